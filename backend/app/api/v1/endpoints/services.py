@@ -1,151 +1,280 @@
-from fastapi import APIRouter, HTTPException, status, Body, Depends, BackgroundTasks
-from fastapi.responses import PlainTextResponse
-from typing import Dict, List
+from fastapi import APIRouter, HTTPException, status, Body, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional
+import hashlib
 import os
-import re
+import json
 import asyncio
-from datetime import datetime
-from app.core import gcp, generation, ai
+from app.core import admission, build_logs, gcp, pipeline, resilience, runtimes, spec_validation, telemetry
 from app.core.config import settings
-from app.models.service import ServiceMetadata, ServiceStatus
+from app.core.events import broker
+from app.core.reconciler import reconciler
+from app.core.signing import signer
+from app.models.service import (
+    BatchGenerateRequest, BatchProgress, GenerationBatch, ServiceMetadata, ServiceStatus, ServiceSummary, DETAIL_FIELDS,
+)
+from app.models.spec import SpecDelta
 from app.state import clients
-from google.cloud.devtools.cloudbuild_v1.types import Build
 from app.core.auth import get_current_user
 from google.api_core.exceptions import NotFound
 
-router = APIRouter()
+log = telemetry.get_logger("services")
 
-
-async def run_generation_pipeline(metadata: ServiceMetadata):
-    """
-    This background task runs the full service generation and deployment pipeline.
-    """
-    print(f"[PIPELINE] Starting generation pipeline for service {metadata.id}")
-    doc_ref = gcp.db.collection(settings.FIRESTORE_SERVICES_COLLECTION).document(metadata.id)
-    try:
-        # 1. Generate the spec from the AI
-        print(f"[PIPELINE] Step 1: Calling Gemini AI for service {metadata.id}")
-        spec = ai.generate_spec_from_prompt(metadata.prompt)
-        metadata.spec = spec
-        print(f"[PIPELINE] Step 1 complete: Generated spec for {spec.get('service_name')}")
-        
-        # Ensure service_name is updated from spec if it changed
-        service_name = sanitize_service_name(spec.get("service_name", metadata.service_name))
-        metadata.service_name = service_name
-        
-        # 2. Generate the Flask service source code
-        print(f"[PIPELINE] Step 2: Generating Flask service files for {service_name}")
-        gcp_config = {
-            "project_id": settings.GCP_PROJECT_ID, 
-            "region": settings.GCP_REGION, 
-            "repository": "api-architect-repo"
-        }
-        zip_path = generation.generate_flask_service(spec, gcp_config)
-        print(f"[PIPELINE] Step 2 complete: Created zip at {zip_path}")
-        
-        # 3. Upload to GCS
-        print(f"[PIPELINE] Step 3: Uploading to Google Cloud Storage")
-        blob_name = f"source/{metadata.id}/{os.path.basename(zip_path)}"
-        gcs_uri = await gcp.upload_source_to_gcs(zip_path, blob_name)
-        print(f"[PIPELINE] Step 3 complete: Uploaded to {gcs_uri}")
-        metadata.source_blob = blob_name
-        
-        # 4. Trigger Cloud Build
-        print(f"[PIPELINE] Step 4: Triggering Cloud Build for {service_name}")
-        build_id = await gcp.trigger_cloud_build(gcs_uri, service_name)
-        metadata.build_id = build_id
-        metadata.status = ServiceStatus.BUILDING
-        metadata.build_log_url = f"https://console.cloud.google.com/cloud-build/builds/{build_id}?project={settings.GCP_PROJECT_ID}"
-        metadata.updated_at = datetime.utcnow()
-        
-        print(f"[PIPELINE] Updating Firestore with build ID: {build_id}")
-        await doc_ref.set(metadata.model_dump())
-        os.remove(zip_path)
-        print(f"[PIPELINE] Pipeline complete for service {metadata.id}")
-
-    except Exception as e:
-        print(f"[PIPELINE ERROR] Error in generation pipeline for service {metadata.id}: {e}")
-        import traceback
-        traceback.print_exc()
-        metadata.status = ServiceStatus.FAILED
-        metadata.error_message = str(e)
-        metadata.updated_at = datetime.utcnow()
-        await doc_ref.set(metadata.model_dump())
+router = APIRouter(dependencies=[Depends(clients.require("firestore_client"))])
 
 
-def sanitize_service_name(name: str) -> str:
-    name = name.lower()
-    name = re.sub(r'[^a-z0-9-]', '-', name)
-    name = name.strip('-')
-    return name[:50]
-
 @router.post("/generate", status_code=status.HTTP_202_ACCEPTED, response_model=ServiceMetadata)
 async def generate_service(
-    background_tasks: BackgroundTasks,
     prompt_body: Dict[str, str] = Body(...), 
+    bypass_cache: bool = Query(False, description="Always call the AI model, ignoring cached specs for this prompt."),
     user: dict = Depends(get_current_user)
 ):
     prompt = prompt_body.get("prompt")
     if not prompt:
         raise HTTPException(status_code=400, detail="Prompt cannot be empty.")
+    runtime = _runtime_or_400(prompt_body.get("runtime"))
+    await _admit_or_429(user['uid'], 1)
     
     # Immediately create and save metadata with PENDING status
     # Use a temporary name that will be updated by the pipeline
-    temp_service_name = sanitize_service_name(f"service-{os.urandom(4).hex()}")
+    temp_service_name = pipeline.sanitize_service_name(f"service-{os.urandom(4).hex()}")
     metadata = ServiceMetadata(
         user_id=user['uid'], 
         service_name=temp_service_name, 
         prompt=prompt, 
-        status=ServiceStatus.PENDING
+        status=ServiceStatus.PENDING,
+        runtime=runtime,
     )
     await gcp.save_service_metadata(metadata)
     
-    # Delegate the long-running process to a background task
-    background_tasks.add_task(run_generation_pipeline, metadata)
+    # Delegate the long-running process to the durable job queue
+    await pipeline.enqueue_generation(metadata, use_cache=not bypass_cache)
     
     # Return immediately
     return metadata
 
-@router.get("/", response_model=List[ServiceMetadata])
-async def list_services(user: dict = Depends(get_current_user)):
+
+async def _admit_or_429(user_id: str, prompts: int):
+    try:
+        await admission.controller.admit(user_id, prompts)
+    except admission.AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+def _runtime_or_400(runtime: Optional[str]) -> str:
+    runtime = runtime or settings.RUNTIME_TARGET
+    if runtime not in runtimes.RUNTIMES:
+        raise HTTPException(status_code=400, detail=f"Unknown runtime '{runtime}'. Expected one of: {', '.join(runtimes.RUNTIMES)}.")
+    return runtime
+
+
+@router.post("/generate/batch", status_code=status.HTTP_202_ACCEPTED, response_model=GenerationBatch)
+async def generate_batch(
+    body: BatchGenerateRequest,
+    bypass_cache: bool = Query(False, description="Always call the AI model, ignoring cached specs for these prompts."),
+    user: dict = Depends(get_current_user)
+):
+    """
+    Generates and deploys one service per prompt as a single job. Returns the
+    batch, whose progress is available from GET /services/batches/{batch_id}.
+    """
+    if any(not prompt.strip() for prompt in body.prompts):
+        raise HTTPException(status_code=400, detail="Prompts cannot be empty.")
+    if len(body.prompts) > settings.BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"A batch takes at most {settings.BATCH_MAX_PROMPTS} prompts.")
+    runtime = _runtime_or_400(body.runtime)
+    await _admit_or_429(user['uid'], len(body.prompts))
+
+    services = [
+        ServiceMetadata(
+            user_id=user['uid'],
+            service_name=pipeline.sanitize_service_name(f"service-{os.urandom(4).hex()}"),
+            prompt=prompt,
+            status=ServiceStatus.PENDING,
+            runtime=runtime,
+        )
+        for prompt in body.prompts
+    ]
+    batch = GenerationBatch(
+        user_id=user['uid'],
+        service_ids=[metadata.id for metadata in services],
+        combined_build=body.combined_build,
+    )
+    for metadata in services:
+        metadata.batch_id = batch.id
+    await gcp.save_batch(batch, services)
+
+    await pipeline.enqueue_batch(batch, use_cache=not bypass_cache)
+    return batch
+
+
+@router.get("/batches/{batch_id}", response_model=BatchProgress)
+async def get_batch_progress(batch_id: str, user: dict = Depends(get_current_user)):
+    """Aggregate status of a batch: one document read plus one count aggregation per status."""
+    batch = await gcp.get_batch(batch_id)
+    if batch is None or batch.user_id != user['uid']:
+        raise HTTPException(status_code=404, detail="Batch not found.")
+
+    counts = await gcp.count_batch_services(batch_id)
+    pending = counts[ServiceStatus.PENDING]
+    building = counts[ServiceStatus.BUILDING]
+    return BatchProgress(
+        batch_id=batch.id,
+        total=len(batch.service_ids),
+        pending=pending,
+        building=building,
+        deployed=counts[ServiceStatus.DEPLOYED],
+        failed=counts[ServiceStatus.FAILED],
+        done=pending == 0 and building == 0,
+    )
+
+async def _list_etag(user_id: str, variant: str) -> str:
+    """
+    Weak validator for a user's service list: the newest `updated_at` plus the
+    document count (so deletions change it too). Costs one single-field read
+    and one count aggregation instead of reading every document.
+    """
+    services_ref = gcp.db.collection(settings.FIRESTORE_SERVICES_COLLECTION).where("user_id", "==", user_id)
+    latest_query = services_ref.order_by("updated_at", direction="DESCENDING").select(["updated_at"]).limit(1)
+    latest = None
+    async for doc in latest_query.stream():
+        latest = doc.get("updated_at")
+    count_result = await services_ref.count().get()
+    count = count_result[0][0].value if count_result else 0
+
+    fingerprint = f"{latest.isoformat() if latest else '-'}|{count}|{variant}"
+    return f'W/"{hashlib.sha256(fingerprint.encode()).hexdigest()[:32]}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison: W/"x" and "x" match.
+    return "*" in candidates or etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in candidates]
+
+
+@router.get("/", response_model=List[ServiceSummary], response_model_exclude_unset=True)
+async def list_services(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    start_after: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page."),
+    include: Optional[str] = Query(None, description="Comma-separated detail fields to include: prompt, spec, revisions."),
+    user: dict = Depends(get_current_user),
+):
     user_id = user['uid']
-    query = gcp.db.collection(settings.FIRESTORE_SERVICES_COLLECTION).where("user_id", "==", user_id).order_by("created_at", direction="DESCENDING")
-    docs = query.stream()
-    services = [ServiceMetadata(**doc.to_dict()) async for doc in docs]
-    
-    async def reconcile_status(service: ServiceMetadata):
-        build_client = clients["build_client"]
-        run_client = clients["run_client"]
-        doc_ref = gcp.db.collection(settings.FIRESTORE_SERVICES_COLLECTION).document(service.id)
-        
-        if service.status == ServiceStatus.BUILDING and service.build_id:
-            try:
-                # --- THE FINAL, CORRECTED FIX ---
-                # The argument is 'id', not 'build_id'
-                build_info = await build_client.get_build(project_id=settings.GCP_PROJECT_ID, id=service.build_id)
-                
-                if build_info.status == Build.Status.SUCCESS:
-                    service.status = ServiceStatus.DEPLOYED
-                    service_path = run_client.service_path(settings.GCP_PROJECT_ID, settings.GCP_REGION, service.service_name)
-                    run_service = await run_client.get_service(name=service_path)
-                    service.deployed_url = run_service.uri
-                    service.updated_at = datetime.utcnow()
-                    await doc_ref.set(service.model_dump())
-                elif build_info.status in [Build.Status.FAILURE, Build.Status.CANCELLED, Build.Status.EXPIRED]:
-                    service.status = ServiceStatus.FAILED
-                    service.updated_at = datetime.utcnow()
-                    await doc_ref.set(service.model_dump())
-            except Exception as e:
-                print(f"Error checking build status for {service.id}: {e}")
-        
-        return service
+    included = {field.strip() for field in include.split(",")} if include else set()
+    unknown = included - set(DETAIL_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include field(s): {', '.join(sorted(unknown))}.")
+
+    etag = await _list_etag(user_id, f"{limit}|{start_after}|{','.join(sorted(included))}")
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    services_ref = gcp.db.collection(settings.FIRESTORE_SERVICES_COLLECTION)
+    query = services_ref.where("user_id", "==", user_id).order_by("created_at", direction="DESCENDING")
+    fields = [name for name in ServiceMetadata.model_fields if name not in DETAIL_FIELDS or name in included]
+    query = query.select(fields).limit(limit)
 
-    tasks = [reconcile_status(s) for s in services]
-    reconciled_results = await asyncio.gather(*tasks)
-    services_to_return = [s for s in reconciled_results if s is not None]
-    return services_to_return
+    if start_after:
+        cursor = await services_ref.document(start_after).get()
+        if not cursor.exists or cursor.get("user_id") != user_id:
+            raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+        query = query.start_after(cursor)
 
-@router.delete("/{service_id}", status_code=status.HTTP_204_NO_CONTENT)
+    # Build status is kept current by the reconciler, so this is a pure read.
+    services = [ServiceSummary(**doc.to_dict()) async for doc in query.stream()]
+
+    response.headers.update(headers)
+    if len(services) == limit:
+        response.headers["X-Next-Cursor"] = services[-1].id
+    return services
+
+@router.get("/events")
+async def service_events(request: Request, user: dict = Depends(get_current_user)):
+    """
+    Server-Sent Events stream of status deltas for the caller's services.
+    Sends `event: status` messages as pipelines and builds progress, and a
+    comment line every EVENTS_HEARTBEAT_SECONDS to keep proxies from closing it.
+    """
+    user_id = user['uid']
+    queue = await broker.subscribe(user_id)
+
+    async def event_stream():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    delta = await asyncio.wait_for(queue.get(), timeout=settings.EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"event: status\ndata: {json.dumps(delta, default=str)}\n\n"
+        finally:
+            broker.unsubscribe(user_id, queue)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
+
+@router.get("/{service_id}", response_model=ServiceMetadata)
+async def get_service(service_id: str, user: dict = Depends(get_current_user)):
+    """Returns a single service with all of its fields, including the prompt and spec."""
+    doc = await gcp.db.collection(settings.FIRESTORE_SERVICES_COLLECTION).document(service_id).get()
+
+    if not doc.exists:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Service not found.")
+
+    data = doc.to_dict()
+    if data.get('user_id') != user['uid']:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied.")
+
+    return ServiceMetadata(**data)
+
+@router.patch("/{service_id}", status_code=status.HTTP_202_ACCEPTED, response_model=ServiceMetadata)
+async def update_service(
+    service_id: str, delta: SpecDelta, response: Response, user: dict = Depends(get_current_user)
+):
+    """
+    Edits a service's spec and redeploys it as a new revision of the same
+    Cloud Run service, without the AI stage and with the previous image as
+    build cache. Returns 202 with the service PENDING and the new revision
+    appended to `revisions`, or 200 unchanged if the edit changes no file.
+    """
+    metadata = await pipeline.load_metadata(service_id)
+    if metadata is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Service not found.")
+    if metadata.user_id != user['uid']:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied.")
+    if metadata.status in (ServiceStatus.PENDING, ServiceStatus.BUILDING):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="The service is still being generated or built.")
+    if not metadata.spec:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="The service has no spec to edit.")
+
+    try:
+        spec = spec_validation.apply_delta(metadata.spec, delta)
+        runtime = runtimes.runtime_for(metadata.runtime)
+        changes = pipeline.changed_files(metadata, spec, pipeline.revision_profile(), runtime)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not changes:
+        response.status_code = status.HTTP_200_OK
+        return metadata
+
+    await _admit_or_429(user['uid'], 1)
+    try:
+        await pipeline.start_revision(metadata, spec, changes)
+    except NotFound:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Service not found.")
+    return metadata
+
+@router.delete(
+    "/{service_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(clients.require("run_client"))]
+)
 async def delete_service(service_id: str, user: dict = Depends(get_current_user)):
     """
     Deletes a service. This operation is idempotent.
@@ -173,14 +302,17 @@ async def delete_service(service_id: str, user: dict = Depends(get_current_user)
                 await run_client.delete_service(name=service_path)
             except NotFound:
                 # This is the desired state, so we can ignore this error.
-                print(f"Cloud Run service '{metadata.service_name}' not found. It may have been deleted manually.")
-                pass
+                log.info(
+                    f"Cloud Run service '{metadata.service_name}' not found. It may have been deleted manually.",
+                    extra={"fields": {"service_id": service_id}},
+                )
         
         # Finally, delete the service metadata from Firestore
+        reconciler.forget(metadata)
         await doc_ref.delete()
 
-    except HTTPException:
-        # Re-raise user-facing errors (e.g., 403)
+    except (HTTPException, resilience.CircuitOpen):
+        # Re-raise user-facing errors (e.g., 403, or 503 from an open circuit)
         raise
     except Exception as e:
         # For any other unexpected error, return a generic 500
@@ -205,16 +337,29 @@ async def get_service_artifact(service_id: str, user: dict = Depends(get_current
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No downloadable artifact is available for this service.")
 
     try:
-        signed_url = await gcp.generate_signed_url(metadata.source_blob)
+        # The blob is recorded on the service, so skip the existence round trip.
+        signed_url = await signer.signed_url(metadata.source_blob, verify_exists=False)
         return {"download_url": signed_url}
     except FileNotFoundError:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Artifact not found in storage.")
+    except resilience.CircuitOpen:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to generate download link: {e}")
 
 
-@router.get("/{service_id}/logs")
-async def get_service_logs(service_id: str, user: dict = Depends(get_current_user)):
+@router.get("/{service_id}/logs", dependencies=[Depends(clients.require("build_client"))])
+async def get_service_logs(
+    service_id: str,
+    request: Request,
+    tail: Optional[int] = Query(None, ge=1, le=100_000, description="Only return the last N lines."),
+    follow: bool = Query(False, description="Keep streaming new output while the build is running."),
+    user: dict = Depends(get_current_user),
+):
+    """
+    Streams the build log in chunks. Supports a single `Range` header, `tail=N`,
+    gzip via `Accept-Encoding`, and `follow=true` to tail a running build live.
+    """
     doc_ref = gcp.db.collection(settings.FIRESTORE_SERVICES_COLLECTION).document(service_id)
     doc = await doc_ref.get()
 
@@ -231,11 +376,53 @@ async def get_service_logs(service_id: str, user: dict = Depends(get_current_use
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No build has been triggered for this service.")
 
     try:
-        log_text, filename = await gcp.fetch_build_logs(metadata.build_id)
-    except FileNotFoundError:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Build logs not found.")
+        log = await gcp.locate_build_log(metadata.build_id)
+    except resilience.CircuitOpen:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to fetch build logs: {e}")
 
-    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
-    return PlainTextResponse(content=log_text, headers=headers)
\ No newline at end of file
+    following = follow and metadata.status == ServiceStatus.BUILDING
+    if log is None and not following:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Build logs not found.")
+
+    filename = log.filename if log else f"log-{metadata.build_id}.txt"
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "no-cache",
+    }
+    status_code = status.HTTP_200_OK
+    start, end = 0, log.size if log else 0
+
+    try:
+        if tail and log:
+            start = await build_logs.tail_offset(log, tail)
+        elif log and not following:
+            byte_range = build_logs.parse_range(request.headers.get("range"), log.size)
+            if byte_range:
+                start, end = byte_range
+                status_code = status.HTTP_206_PARTIAL_CONTENT
+                headers["Content-Range"] = f"bytes {start}-{end - 1}/{log.size}"
+    except build_logs.RangeNotSatisfiable:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range is outside the log.",
+            headers={"Content-Range": f"bytes */{log.size}"},
+        )
+
+    if following:
+        body = build_logs.follow(metadata.build_id, start)
+        headers["X-Accel-Buffering"] = "no"
+    else:
+        body = build_logs.stream_range(log, start, end)
+
+    if status_code == status.HTTP_200_OK:
+        headers["Vary"] = "Accept-Encoding"
+    if status_code == status.HTTP_200_OK and build_logs.accepts_gzip(request.headers.get("accept-encoding")):
+        body = build_logs.gzip_stream(body, flush_each=following)
+        headers["Content-Encoding"] = "gzip"
+    elif not following:
+        headers["Content-Length"] = str(end - start)
+
+    return StreamingResponse(body, status_code=status_code, media_type="text/plain; charset=utf-8", headers=headers)
@@ -0,0 +1,39 @@
+import hmac
+from typing import Any, Dict
+
+from fastapi import APIRouter, HTTPException, status, Body, Depends, Query
+
+from app.core.config import settings
+from app.core.reconciler import reconciler
+from app.state import clients
+
+router = APIRouter(dependencies=[Depends(clients.require("firestore_client", "build_client"))])
+
+
+@router.post("/cloud-build", status_code=status.HTTP_204_NO_CONTENT)
+async def cloud_build_notification(
+    envelope: Dict[str, Any] = Body(...),
+    token: str = Query(...),
+):
+    """
+    Pub/Sub push endpoint for the `cloud-builds` topic.
+    Cloud Build publishes every status change; terminal ones are handed to the reconciler.
+    Any 2xx acknowledges the message, so unknown builds are accepted and dropped.
+    """
+    expected = settings.CLOUD_BUILD_WEBHOOK_TOKEN
+    if not expected:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Cloud Build webhook is not configured.")
+    if not hmac.compare_digest(token, expected):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid webhook token.")
+
+    attributes = (envelope.get("message") or {}).get("attributes") or {}
+    build_id = attributes.get("buildId")
+    build_status = attributes.get("status")
+    if not build_id or not build_status:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Message is missing buildId/status attributes.")
+
+    try:
+        await reconciler.handle_notification(build_id, build_status)
+    except Exception as e:
+        # Let Pub/Sub redeliver; the poller will also pick the build up.
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to apply build update: {e}")
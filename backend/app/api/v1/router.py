@@ -1,5 +1,6 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import services
+from app.api.v1.endpoints import services, webhooks
 
 api_router = APIRouter()
-api_router.include_router(services.router, prefix="/services", tags=["Services"])
\ No newline at end of file
+api_router.include_router(services.router, prefix="/services", tags=["Services"])
+api_router.include_router(webhooks.router, prefix="/webhooks", tags=["Webhooks"])
\ No newline at end of file
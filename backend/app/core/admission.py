@@ -0,0 +1,200 @@
+"""
+Admission control for service generation.
+
+Every generation starts a Gemini call and a Cloud Build, both of which draw
+on project-wide quotas. Before a generation is accepted:
+
+1. Global load: the number of services still in the pipeline (PENDING) and
+   of builds in flight (BUILDING) must be under ADMISSION_MAX_PENDING and
+   ADMISSION_MAX_BUILDING. Both counts come from count aggregations over the
+   services collection, so they cover every instance; they are reused for
+   ADMISSION_LOAD_TTL_SECONDS, plus what this instance admitted since.
+2. Per user: a token bucket refilled at ADMISSION_USER_RATE_PER_MINUTE and
+   holding up to ADMISSION_USER_BURST tokens. Each prompt costs one token. A
+   batch larger than the burst is admitted once the bucket is full and puts
+   it in debt, so the user waits for the whole batch to be paid back.
+
+A rejected request gets a 429 with a Retry-After: the time until the bucket
+holds enough tokens, or ADMISSION_RETRY_AFTER_SECONDS when a global cap is
+reached. Load checks come first, so a request rejected for load spends no
+tokens.
+
+Buckets live in a pluggable store: in memory for a single instance, or in
+Firestore (one document per user, updated in a transaction) for many. If
+the store or the counts cannot be read, requests are admitted: admission
+control is there to shed load, not to add an outage.
+"""
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Tuple
+
+from app.core import gcp, telemetry
+from app.core.concurrency import SingleFlight
+from app.core.config import settings
+from app.models.service import ServiceStatus
+
+log = telemetry.get_logger("admission")
+
+# Buckets the in-memory store keeps; a dropped bucket comes back full, which only errs on the permissive side.
+MAX_MEMORY_BUCKETS = 10000
+
+
+class AdmissionRejected(Exception):
+    """The request must wait; `retry_after` is in whole seconds."""
+
+    def __init__(self, reason: str, retry_after: int, message: str):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def refill(tokens: float, updated_at: float, now: float, capacity: float, rate: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+def take(tokens: float, cost: float, capacity: float, rate: float) -> Tuple[float, float]:
+    """
+    Returns (tokens left, seconds to wait). A cost above `capacity` only needs a
+    full bucket and leaves it in debt; nothing is taken when the caller must wait.
+    """
+    required = min(cost, capacity)
+    if tokens >= required:
+        return tokens - cost, 0.0
+    return tokens, (required - tokens) / rate
+
+
+class AdmissionStore:
+    """Storage interface for per-user token buckets."""
+
+    async def take(self, key: str, cost: float, capacity: float, rate: float) -> float:
+        """Takes `cost` tokens from `key`'s bucket; returns 0 when admitted, else the seconds to wait."""
+        raise NotImplementedError
+
+
+class InMemoryAdmissionStore(AdmissionStore):
+    """Buckets for this instance only."""
+
+    def __init__(self, max_entries: int = MAX_MEMORY_BUCKETS):
+        self.max_entries = max_entries
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, cost: float, capacity: float, rate: float) -> float:
+        now = time.time()
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens, wait = take(refill(tokens, updated_at, now, capacity, rate), cost, capacity, rate)
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_entries:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+async def _take_tokens(transaction, ref, cost: float, capacity: float, rate: float) -> float:
+    """Reads, refills and updates one bucket document; runs inside a transaction (see FirestoreAdmissionStore)."""
+    snapshot = await ref.get(transaction=transaction)
+    now = time.time()
+    state = snapshot.to_dict() if snapshot.exists else {}
+    tokens = refill(state.get("tokens", capacity), state.get("updated_at", now), now, capacity, rate)
+    tokens, wait = take(tokens, cost, capacity, rate)
+    transaction.set(ref, {
+        "tokens": tokens,
+        "updated_at": now,
+        # A bucket idle this long is full again; a Firestore TTL policy on this field can delete it.
+        "expires_at": datetime.utcfromtimestamp(now + (capacity - tokens) / rate),
+    })
+    return wait
+
+
+class FirestoreAdmissionStore(AdmissionStore):
+    """Buckets shared by every instance: one document per user, updated in a transaction."""
+
+    def __init__(self, collection: str):
+        self.collection = collection
+
+    @telemetry.instrumented("firestore", "take_tokens")
+    async def take(self, key: str, cost: float, capacity: float, rate: float) -> float:
+        from google.cloud import firestore
+
+        ref = gcp.db.collection(self.collection).document(key)
+        take_tokens = firestore.async_transactional(_take_tokens)
+        return await take_tokens(gcp.db.transaction(), ref, cost, capacity, rate)
+
+
+def build_store() -> AdmissionStore:
+    """Creates the store configured by ADMISSION_STORE."""
+    if settings.ADMISSION_STORE == "firestore":
+        return FirestoreAdmissionStore(settings.FIRESTORE_ADMISSION_COLLECTION)
+    if settings.ADMISSION_STORE == "memory":
+        return InMemoryAdmissionStore()
+    raise ValueError(f"Unknown admission store '{settings.ADMISSION_STORE}'. Expected 'firestore' or 'memory'.")
+
+
+class AdmissionController:
+
+    def __init__(self, store: AdmissionStore):
+        self.store = store
+        # Decisions by result: "admitted" or the rejection reason.
+        self.decisions: Dict[str, int] = {}
+        self._flights = SingleFlight()
+        self._load: Dict[str, int] = {}
+        self._load_expires_at = 0.0
+        # Prompts admitted by this instance since the counts were last read.
+        self._admitted_since_load = 0
+
+    async def admit(self, user_id: str, cost: int = 1):
+        """Admits `cost` generations for a user or raises AdmissionRejected."""
+        if not settings.ADMISSION_ENABLED:
+            return
+        load = await self._current_load()
+        pending = load.get(ServiceStatus.PENDING, 0) + self._admitted_since_load
+        if pending + cost > settings.ADMISSION_MAX_PENDING:
+            self._reject(
+                "queue_full", settings.ADMISSION_RETRY_AFTER_SECONDS,
+                f"{pending} generations are already queued; try again later.",
+            )
+        if load.get(ServiceStatus.BUILDING, 0) >= settings.ADMISSION_MAX_BUILDING:
+            self._reject(
+                "builds_saturated", settings.ADMISSION_RETRY_AFTER_SECONDS,
+                "The maximum number of concurrent builds is in progress; try again later.",
+            )
+
+        rate = settings.ADMISSION_USER_RATE_PER_MINUTE / 60
+        try:
+            wait = await self.store.take(user_id, cost, settings.ADMISSION_USER_BURST, rate)
+        except Exception as e:
+            log.warning(f"Admission store unavailable, admitting: {e}", extra={"fields": {"user_id": user_id}})
+            wait = 0.0
+        if wait > 0:
+            self._reject(
+                "user_rate", math.ceil(wait),
+                f"Generation rate limit reached ({settings.ADMISSION_USER_RATE_PER_MINUTE:g} per minute).",
+            )
+
+        self._admitted_since_load += cost
+        self.decisions["admitted"] = self.decisions.get("admitted", 0) + 1
+
+    def _reject(self, reason: str, retry_after: int, message: str):
+        self.decisions[reason] = self.decisions.get(reason, 0) + 1
+        raise AdmissionRejected(reason, max(1, retry_after), message)
+
+    async def _current_load(self) -> Dict[str, int]:
+        if time.monotonic() < self._load_expires_at:
+            return self._load
+        try:
+            self._load = await self._flights.do("load", self._read_load)
+        except Exception as e:
+            # Keep the last known counts rather than refuse or wave through everything.
+            log.warning(f"Could not count in-flight services: {e}")
+            self._load_expires_at = time.monotonic() + settings.ADMISSION_LOAD_TTL_SECONDS
+        return self._load
+
+    async def _read_load(self) -> Dict[str, int]:
+        load = await gcp.count_services_by_status([ServiceStatus.PENDING, ServiceStatus.BUILDING])
+        self._admitted_since_load = 0
+        self._load_expires_at = time.monotonic() + settings.ADMISSION_LOAD_TTL_SECONDS
+        return load
+
+
+controller = AdmissionController(build_store())
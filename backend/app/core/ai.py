@@ -1,9 +1,16 @@
-import google.generativeai as genai
+import asyncio
 import json
+import re
+from typing import TYPE_CHECKING, Optional
+
+from app.core import resilience, spec_cache, spec_validation, telemetry
 from app.core.config import settings
+from app.state import clients
+
+if TYPE_CHECKING:
+    import google.generativeai as genai
 
-# Configure the Gemini API client
-genai.configure(api_key=settings.GEMINI_API_KEY)
+log = telemetry.get_logger("ai")
 
 # --- The System Prompt ---
 SYSTEM_PROMPT = """
@@ -13,43 +20,200 @@ JSON OUTPUT RULES:
 1.  The top-level object must have two keys: "service_name" and "endpoint".
 2.  "service_name" must be a DNS-compliant string (lowercase, numbers, hyphens) derived from the user's prompt, up to 30 characters. E.g., "contact form api" -> "contact-form-api".
 3.  "endpoint" must be an object with the following keys: "path", "method", "model_name", "schema_fields".
-4.  "path" must start with a "/" and be a valid URL path.
+4.  "path" must start with a "/" and be a valid URL path without a trailing slash or query string. Write path parameters as {name}. "/" and "/health" are reserved.
 5.  "method" must be one of "GET", "POST", "PUT", "DELETE".
 6.  "model_name" must be a valid Python class name in PascalCase. E.g., "ContactForm" or "WebhookPayload".
 7.  "schema_fields" must be an array of objects.
 8.  Each object in "schema_fields" must have three keys: "name" (string, snake_case), "type" (string), "required" (boolean).
-9.  The "type" for a schema field must be a valid Pydantic type. Prioritize these common types:
+9.  The "type" for a schema field must be one of these Pydantic types:
     - str
     - int
     - float
     - bool
     - EmailStr (use this for any field that looks like an email address)
+    - HttpUrl (use this for any field that holds a link)
     - List[str]
     - List[int]
+    - List[float]
+    - List[bool]
     - Dict[str, Any]
 10. If the user does not specify if a field is required, assume it is "true" for POST/PUT requests.
 """
 
-def generate_spec_from_prompt(prompt: str) -> dict:
+def parse_spec(raw_text: str) -> dict:
     """
-    Sends a user prompt to the Gemini API and returns the generated JSON spec.
+    Decodes a model response (unwrapping a code fence if there is one), then
+    repairs and validates the spec locally (see app/core/spec_validation.py).
     """
-    try:
-        model = genai.GenerativeModel(
-            model_name='models/gemini-pro-latest',
-            system_instruction=SYSTEM_PROMPT
-        )
-        response = model.generate_content(prompt)
-        
-        cleaned_response = response.text.strip().replace("```json", "").replace("```", "").strip()
+    cleaned_response = raw_text.strip()
+    fenced = re.fullmatch(r"```(?:json)?\s*(.*?)\s*```", cleaned_response, re.DOTALL)
+    if fenced:
+        cleaned_response = fenced.group(1)
 
-        if not cleaned_response:
-            raise ValueError("AI model returned an empty response.")
+    if not cleaned_response:
+        raise ValueError("AI model returned an empty response.")
 
+    try:
         spec = json.loads(cleaned_response)
-        return spec
     except json.JSONDecodeError:
-        raise ValueError(f"Failed to decode JSON from the AI model's response. Raw response: '{response.text}'")
+        raise ValueError(f"Failed to decode JSON from the AI model's response. Raw response: '{raw_text}'")
+    return spec_validation.validate_spec(spec)
+
+
+class SpecProvider:
+    """
+    Interface for anything that can turn a prompt into raw spec text.
+    Providers only talk to their backend; parsing and throttling live in SpecEngine.
+    """
+    name = "base"
+    model_version = "none"
+
+    async def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+
+class GeminiSpecProvider(SpecProvider):
+    """Calls Gemini through a single, lazily created GenerativeModel."""
+    name = "gemini"
+
+    def __init__(self, model_name: str):
+        self.model_version = model_name
+        self._model: Optional["genai.GenerativeModel"] = None
+
+    @property
+    def model(self) -> "genai.GenerativeModel":
+        if self._model is None:
+            # The configured google.generativeai module (see app.state).
+            genai = clients["genai"]
+            generation_config = None
+            if settings.AI_STRUCTURED_OUTPUT:
+                # Gemini then answers with bare JSON shaped like ServiceSpec, enums included.
+                generation_config = genai.GenerationConfig(
+                    response_mime_type="application/json",
+                    response_schema=spec_validation.response_schema(),
+                )
+            self._model = genai.GenerativeModel(
+                model_name=self.model_version,
+                system_instruction=SYSTEM_PROMPT,
+                generation_config=generation_config,
+            )
+        return self._model
+
+    async def generate(self, prompt: str) -> str:
+        if self._model is None:
+            # Configuring the SDK imports it; do that off the event loop.
+            await clients.aget("genai")
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+
+class FakeSpecProvider(SpecProvider):
+    """
+    Returns a deterministic spec derived from the prompt without any network access.
+    Used to load-test the pipeline; `latency` simulates the Gemini round trip.
+    """
+    name = "fake"
+    model_version = "fake-v1"
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def generate(self, prompt: str) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        words = re.findall(r"[a-z0-9]+", prompt.lower()) or ["generated"]
+        service_name = "-".join(words)[:30].strip("-") or "generated-api"
+        resource = words[0]
+        spec = {
+            "service_name": service_name,
+            "endpoint": {
+                "path": f"/{resource}",
+                "method": "POST",
+                "model_name": "".join(w.capitalize() for w in words[:3] if not w.isdigit()) or "Payload",
+                "schema_fields": [
+                    {"name": "name", "type": "str", "required": True},
+                    {"name": "email", "type": "EmailStr", "required": True},
+                    {"name": "message", "type": "str", "required": False},
+                ],
+            },
+        }
+        return json.dumps(spec)
+
+
+def build_provider(name: str) -> SpecProvider:
+    """Creates the provider configured by AI_PROVIDER."""
+    if name == "gemini":
+        return GeminiSpecProvider(settings.GEMINI_MODEL_NAME)
+    if name == "fake":
+        return FakeSpecProvider(latency=settings.AI_FAKE_LATENCY_SECONDS)
+    raise ValueError(f"Unknown AI provider '{name}'. Expected 'gemini' or 'fake'.")
+
+
+class SpecEngine:
+    """
+    Runs spec generation off the event loop's critical path.
+    A semaphore bounds how many generations are in flight. Each provider call
+    runs under the provider's resilience policy (see app.core.resilience):
+    a per-attempt timeout so a stuck upstream cannot hold a slot forever,
+    retries of transient errors within AI_DEADLINE_SECONDS, a hedged second
+    request when the first is slower than usual, and a circuit breaker. A
+    hedge shares its generation's slot.
+    """
+
+    def __init__(self, provider: SpecProvider, max_concurrency: int):
+        self.provider = provider
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def generate(self, prompt: str) -> dict:
+        async with self._semaphore:
+            raw_text = await resilience.call(self.provider.name, "generate", lambda: self.provider.generate(prompt))
+        return parse_spec(raw_text)
+
+
+engine = SpecEngine(
+    build_provider(settings.AI_PROVIDER),
+    max_concurrency=settings.AI_MAX_CONCURRENCY,
+)
+
+cache = spec_cache.build_spec_cache()
+
+
+def model_version() -> str:
+    """Identifies the provider/model pair that produced a spec; part of the cache key."""
+    return f"{engine.provider.name}:{engine.provider.model_version}"
+
+
+async def generate_spec_from_prompt(prompt: str, use_cache: bool = True) -> dict:
+    """
+    Sends a user prompt to the configured AI provider and returns the generated JSON spec.
+    Identical prompts are served from the spec cache unless `use_cache` is False;
+    a bypassed call still refreshes the cached entry with the new spec.
+    """
+    caching = settings.SPEC_CACHE_ENABLED
+    key = spec_cache.cache_key(prompt, SYSTEM_PROMPT, model_version())
+    if caching and use_cache:
+        cached_spec = await cache.get(key)
+        if cached_spec is not None:
+            try:
+                spec_validation.check(cached_spec)
+                return cached_spec
+            except ValueError:
+                # Cached before specs were validated; generate a fresh one.
+                pass
+    elif caching:
+        cache.record_bypass()
+
+    try:
+        spec = await engine.generate(prompt)
+    except ValueError:
+        raise
     except Exception as e:
-        print(f"An unexpected error occurred in the AI module: {e}")
-        raise
\ No newline at end of file
+        log.error(f"An unexpected error occurred in the AI module: {e}")
+        raise
+
+    if caching:
+        await cache.set(key, spec, model_version())
+    return spec
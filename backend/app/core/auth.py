@@ -1,28 +1,156 @@
 # backend/app/core/auth.py
-import firebase_admin
-from firebase_admin import credentials, auth
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
-# This will use the Application Default Credentials of the Cloud Run service account
-try:
-    if not firebase_admin._apps:
-        cred = credentials.ApplicationDefault()
-        firebase_admin.initialize_app(cred)
-except Exception as e:
-    print(f"Firebase Admin SDK initialization error: {e}")
-    # In a local environment, you might need to point to a service account JSON file.
-    # For Cloud Run, Application Default Credentials should work.
+from app.core import telemetry
+from app.core.config import settings
+from app.state import clients
+
+log = telemetry.get_logger("auth")
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token") # tokenUrl is a dummy value
 
+# Verification is CPU-bound RSA work plus occasional certificate fetches; keep it off the event loop
+# and out of the default executor that storage calls share.
+_verify_executor = ThreadPoolExecutor(max_workers=settings.AUTH_VERIFY_WORKERS, thread_name_prefix="token-verify")
+
+
+class TokenCache:
+    """
+    LRU of verified token claims keyed by the SHA-256 of the raw token.
+    Each entry is served only until the token's own `exp`, so caching never
+    extends a token's lifetime.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+
+    def get(self, digest: str) -> Optional[dict]:
+        claims = self._entries.get(digest)
+        if claims is None or claims.get("exp", 0) <= time.time():
+            if claims is not None:
+                del self._entries[digest]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return claims
+
+    def set(self, digest: str, claims: dict):
+        self._entries[digest] = claims
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
+
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE)
+
+
+def _prefetch_signing_certs() -> bool:
+    """
+    Fetches Google's token signing certificates through the same cache-control
+    session firebase_admin verifies with, so requests never pay for the fetch.
+    Returns False if the SDK no longer exposes that session; verification then
+    fetches the certificates itself on first use, as it would without this.
+    """
+    # Private firebase_admin API, as of the firebase-admin==6.5.0 pinned in requirements.txt:
+    # the auth client's token verifier and the ID token certificate URL. Re-check both on upgrade.
+    try:
+        from firebase_admin import _token_gen, auth
+
+        get_client, cert_uri = auth._get_client, _token_gen.ID_TOKEN_CERT_URI
+    except (ImportError, AttributeError):
+        return False
+    clients["firebase_app"]
+    try:
+        request = get_client(None)._token_verifier.request
+    except AttributeError:
+        return False
+    request(cert_uri, "GET")
+    return True
+
+
+class SigningCertRefresher:
+    """Background task that keeps the signing certificate cache warm."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                if not await loop.run_in_executor(_verify_executor, _prefetch_signing_certs):
+                    log.warning("firebase_admin has no token verifier session to warm; certificates are fetched on first use")
+                    return
+            except Exception as e:
+                log.warning(f"Failed to refresh signing certificates: {e}")
+            await asyncio.sleep(self.interval)
+
+
+cert_refresher = SigningCertRefresher(settings.AUTH_CERT_REFRESH_SECONDS)
+
+
+def _verify_id_token(token: str) -> dict:
+    from firebase_admin import auth
+
+    # Initializes the Firebase app on first use (see app.state).
+    clients["firebase_app"]
+    return auth.verify_id_token(token)
+
+
+async def verify_token(token: str) -> dict:
+    """Returns the decoded claims for a Firebase ID token, verifying it only on a cache miss."""
+    digest = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    claims = token_cache.get(digest)
+    if claims is not None:
+        return claims
+
+    loop = asyncio.get_running_loop()
+    claims = await loop.run_in_executor(_verify_executor, _verify_id_token, token)
+    token_cache.set(digest, claims)
+    return claims
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     """
     Decodes the Firebase JWT token from the Authorization header and returns user info.
     """
     try:
         # Verify the token
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = await verify_token(token)
         return decoded_token
     except Exception as e:
         # If the token is invalid for any reason, raise an exception
@@ -30,4 +158,4 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Invalid authentication credentials: {e}",
             headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        )
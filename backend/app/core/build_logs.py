@@ -0,0 +1,141 @@
+import asyncio
+import re
+import zlib
+from typing import AsyncIterator, Optional, Tuple
+
+from app.core import gcp
+from app.core.config import settings
+
+# Bytes read per request while scanning backwards for `tail` lines.
+TAIL_WINDOW_BYTES = 64 * 1024
+# Build.Status names, compared by name so the Cloud Build types are not imported here.
+RUNNING_STATUSES = ("PENDING", "QUEUED", "WORKING")
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single `Range: bytes=...` header into a half-open [start, end) slice.
+    Returns None for a missing or multi-range header, which is served as a full response.
+    """
+    if not header:
+        return None
+    match = _RANGE_PATTERN.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def accepts_gzip(header: Optional[str]) -> bool:
+    """
+    Whether an `Accept-Encoding` header allows gzip: listed (or matched by "*")
+    with a non-zero q-value. An explicit "gzip;q=0" refuses it even when "*" is accepted.
+    """
+    qualities = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+async def tail_offset(log: gcp.BuildLog, lines: int) -> int:
+    """Byte offset where the last `lines` lines of the log start, reading backwards in windows."""
+    position = log.size
+    seen = 0
+    at_end = True
+    while position > 0:
+        start = max(0, position - TAIL_WINDOW_BYTES)
+        window = await gcp.read_object_range(log.bucket, log.object_name, start, position)
+        if at_end and window.endswith(b"\n"):
+            # The final newline ends the last line rather than starting another.
+            window = window[:-1]
+        at_end = False
+        index = len(window)
+        while True:
+            index = window.rfind(b"\n", 0, index)
+            if index == -1:
+                break
+            seen += 1
+            if seen == lines:
+                return start + index + 1
+        position = start
+    return 0
+
+
+async def stream_range(log: gcp.BuildLog, start: int, end: int) -> AsyncIterator[bytes]:
+    """Yields bytes [start, end) of the log in BUILD_LOG_CHUNK_BYTES ranged reads."""
+    chunk_size = settings.BUILD_LOG_CHUNK_BYTES
+    for offset in range(start, end, chunk_size):
+        yield await gcp.read_object_range(log.bucket, log.object_name, offset, min(offset + chunk_size, end))
+
+
+async def _build_running(build_id: str) -> bool:
+    builds = await gcp.get_builds([build_id])
+    build = builds.get(build_id)
+    return build is not None and build.status.name in RUNNING_STATUSES
+
+
+async def follow(build_id: str, start: int = 0) -> AsyncIterator[bytes]:
+    """
+    Streams the log from `start` and keeps reading new bytes while the build runs.
+    Build status is checked before each read, so the bytes written before the
+    build finished are always sent before the stream ends.
+    """
+    offset = start
+    while True:
+        running = await _build_running(build_id)
+        log = await gcp.locate_build_log(build_id)
+        if log is not None and log.size > offset:
+            async for chunk in stream_range(log, offset, log.size):
+                yield chunk
+            offset = log.size
+        if not running:
+            return
+        await asyncio.sleep(settings.BUILD_LOG_FOLLOW_POLL_SECONDS)
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes], flush_each: bool = False) -> AsyncIterator[bytes]:
+    """
+    Gzips a byte stream on the fly. With `flush_each`, every chunk is flushed
+    to the client immediately, at a small cost in compression ratio.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if flush_each:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
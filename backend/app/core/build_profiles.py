@@ -0,0 +1,290 @@
+"""
+Build profiles for generated services.
+
+A profile picks the base image the generated Dockerfile starts from, how the
+image is built (plain docker, docker with `--cache-from`, or kaniko with a
+layer cache) and the Cloud Build machine type. `build_config` turns a profile
+into a Cloud Build config in Cloud Build's own JSON format; the same config
+drives `trigger_cloud_build` and is rendered into the `cloudbuild.yaml`
+shipped with the source, so what is downloaded is what was built.
+
+Inspect and check a profile offline (settings are read from the environment / .env):
+
+    python -m app.core.build_profiles --profile kaniko --service-name demo-api
+"""
+import argparse
+import json
+import re
+import sys
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.runtimes import RuntimeTarget, runtime_for
+
+if TYPE_CHECKING:
+    from google.cloud.devtools import cloudbuild_v1
+
+DOCKER_BUILDER = "gcr.io/cloud-builders/docker"
+KANIKO_BUILDER = "gcr.io/kaniko-project/executor:latest"
+CLOUD_SDK_BUILDER = "gcr.io/google.com/cloudsdktool/cloud-sdk"
+PUBLIC_BASE_IMAGE = "python:3.12-slim"
+
+_TIMEOUT_PATTERN = re.compile(r"^\d+(\.\d+)?s$")
+
+
+@dataclass(frozen=True)
+class BuildProfile:
+    name: str
+    # Image the generated Dockerfile starts FROM.
+    base_image: str
+    # "docker" or "kaniko".
+    builder: str = "docker"
+    # Reuse layers from the previous image (docker) or the kaniko layer cache.
+    layer_cache: bool = False
+    # Cloud Build machine type, e.g. "E2_HIGHCPU_8"; None uses the default pool.
+    machine_type: Optional[str] = None
+    timeout_seconds: int = 1200
+
+
+def image_name_for(service_name: str) -> str:
+    """Artifact Registry image the generated service is pushed to."""
+    return f"{settings.GCP_REGION}-docker.pkg.dev/{settings.GCP_PROJECT_ID}/api-architect-repo/{service_name}:latest"
+
+
+def default_base_image() -> str:
+    """The maintained base image with the template's requirements preinstalled (see base_images/)."""
+    return f"{settings.GCP_REGION}-docker.pkg.dev/{settings.GCP_PROJECT_ID}/api-architect-repo/flask-base:py3.12"
+
+
+def profiles() -> Dict[str, BuildProfile]:
+    base_image = settings.BUILD_BASE_IMAGE or default_base_image()
+    return {
+        # Matches the original pipeline: public base image, no caching.
+        "standard": BuildProfile("standard", base_image=PUBLIC_BASE_IMAGE),
+        "cached": BuildProfile("cached", base_image=base_image, layer_cache=True, machine_type="E2_HIGHCPU_8"),
+        "kaniko": BuildProfile(
+            "kaniko", base_image=base_image, builder="kaniko", layer_cache=True, machine_type="E2_HIGHCPU_8"
+        ),
+    }
+
+
+def get_profile(name: Optional[str] = None) -> BuildProfile:
+    """Returns the named profile (BUILD_PROFILE by default) with the BUILD_* overrides applied."""
+    name = name or settings.BUILD_PROFILE
+    available = profiles()
+    if name not in available:
+        raise ValueError(f"Unknown build profile '{name}'. Expected one of: {', '.join(available)}.")
+    profile = available[name]
+    if settings.BUILD_MACHINE_TYPE:
+        profile = replace(profile, machine_type=settings.BUILD_MACHINE_TYPE)
+    if settings.BUILD_TIMEOUT_SECONDS:
+        profile = replace(profile, timeout_seconds=settings.BUILD_TIMEOUT_SECONDS)
+    return profile
+
+
+def deploy_step(service_name: str, image: str, runtime: Optional[RuntimeTarget] = None) -> dict:
+    """`gcloud run deploy`; with a runtime, the instance shape and concurrency its server is sized for."""
+    args = [
+        "run", "deploy", service_name,
+        "--image", image,
+        "--region", settings.GCP_REGION,
+        "--platform", "managed",
+        "--allow-unauthenticated",
+        "--project", settings.GCP_PROJECT_ID,
+    ]
+    if runtime is not None:
+        args += runtime.deploy_flags()
+    return {"id": "deploy", "name": CLOUD_SDK_BUILDER, "entrypoint": "gcloud", "args": args}
+
+
+# Cloud Build substitution naming the image a docker layer cache starts from. The config
+# packaged with a service defaults it to the service's own tag and a rebuild overrides it,
+# so the packaged source, and with it the source hash, does not depend on the previous image.
+CACHE_FROM_SUBSTITUTION = "_CACHE_FROM"
+
+
+def image_steps(
+    profile: BuildProfile, image: str, workdir: Optional[str] = None, cache_from: Optional[str] = None
+) -> List[dict]:
+    """
+    Steps that build `image` (from `workdir` under /workspace, if given) and leave it in Artifact Registry.
+    With a docker layer cache, layers come from `cache_from` (e.g. the service's last deployed image) or the image's own tag.
+    """
+    if profile.builder == "kaniko":
+        context = f"dir:///workspace/{workdir}" if workdir else "dir:///workspace"
+        args = [f"--destination={image}", f"--context={context}"]
+        if profile.layer_cache:
+            args += ["--cache=true", f"--cache-ttl={settings.BUILD_CACHE_TTL_HOURS}h"]
+        # kaniko pushes the image itself.
+        return [{"id": "build", "name": KANIKO_BUILDER, "args": args}]
+
+    steps = []
+    build_args = ["build", "-t", image, "."]
+    if profile.layer_cache:
+        cache_image = cache_from or image
+        steps.append({
+            "id": "pull-cache",
+            "name": DOCKER_BUILDER,
+            "entrypoint": "bash",
+            # The first build of a service has nothing to pull.
+            "args": ["-c", f"docker pull {cache_image} || exit 0"],
+        })
+        build_args = ["build", "--cache-from", cache_image, "-t", image, "."]
+    build_step = {"id": "build", "name": DOCKER_BUILDER, "args": build_args}
+    if workdir:
+        build_step["dir"] = workdir
+    steps.append(build_step)
+    steps.append({"id": "push", "name": DOCKER_BUILDER, "args": ["push", image]})
+    return steps
+
+
+def build_config(
+    profile: BuildProfile,
+    image: str,
+    service_name: str,
+    runtime: Optional[RuntimeTarget] = None,
+    cache_from: Optional[str] = None,
+) -> dict:
+    """
+    The complete Cloud Build config (steps, images, options, timeout) for one service.
+    A docker layer cache reads its image from the CACHE_FROM_SUBSTITUTION substitution,
+    which is `cache_from` if given, else the image's own tag.
+    """
+    cached = profile.builder == "docker" and profile.layer_cache
+    steps = image_steps(profile, image, cache_from=f"${{{CACHE_FROM_SUBSTITUTION}}}" if cached else None)
+    config = {
+        "steps": steps + [deploy_step(service_name, image, runtime)],
+        "timeout": f"{profile.timeout_seconds}s",
+    }
+    if cached:
+        config["substitutions"] = {CACHE_FROM_SUBSTITUTION: cache_from or image}
+    if profile.builder == "docker":
+        # Listing the image makes Cloud Build report its digest in build.results,
+        # which the dedup index uses to redeploy identical sources without rebuilding.
+        # kaniko builds are not listed (Cloud Build would try to push them again),
+        # so they are not reused across services.
+        config["images"] = [image]
+    if profile.machine_type:
+        config["options"] = {"machineType": profile.machine_type}
+    return config
+
+
+def combined_build_config(profile: BuildProfile, targets: List[dict]) -> dict:
+    """
+    One Cloud Build job for several services. Each target is
+    {"service_name", "image", "source_uri", "runtime"} and gets its own chain of steps
+    (fetch and unpack its source, build, push, deploy) linked with waitFor, so
+    the chains run in parallel. A target without "source_uri" has a prebuilt
+    image and its chain only deploys it.
+    """
+    steps = []
+    images = []
+    for target in targets:
+        name = target["service_name"]
+        chain = []
+        if target.get("source_uri"):
+            archive = f"/workspace/{name}.zip"
+            chain.append({
+                "id": "fetch",
+                "name": CLOUD_SDK_BUILDER,
+                "entrypoint": "bash",
+                "args": ["-c", f"gsutil cp {target['source_uri']} {archive} && python3 -m zipfile -e {archive} /workspace/{name}"],
+            })
+            chain += image_steps(profile, target["image"], workdir=name)
+            if profile.builder == "docker":
+                images.append(target["image"])
+        chain.append(deploy_step(name, target["image"], target.get("runtime")))
+
+        previous = "-"
+        for step in chain:
+            step = {**step, "id": f"{name}-{step['id']}", "waitFor": [previous]}
+            previous = step["id"]
+            steps.append(step)
+
+    config = {"steps": steps, "timeout": f"{profile.timeout_seconds}s"}
+    if images:
+        config["images"] = images
+    if profile.machine_type:
+        config["options"] = {"machineType": profile.machine_type}
+    return config
+
+
+def to_build(config: dict) -> "cloudbuild_v1.Build":
+    # The Cloud Build types are only needed once a build is started, not at import.
+    from google.cloud.devtools import cloudbuild_v1
+
+    return cloudbuild_v1.Build.from_json(json.dumps(config))
+
+
+def validate_config(config: dict) -> List[str]:
+    """Offline checks for a generated config; returns a list of problems (empty when valid)."""
+    from google.cloud.devtools import cloudbuild_v1
+
+    problems = []
+    steps = config.get("steps") or []
+    if not steps:
+        problems.append("config has no steps")
+
+    step_ids = set()
+    for index, step in enumerate(steps):
+        if not step.get("name"):
+            problems.append(f"step {index} has no builder image")
+        if not step.get("args"):
+            problems.append(f"step {index} has no args")
+        for dependency in step.get("waitFor", []):
+            if dependency != "-" and dependency not in step_ids:
+                problems.append(f"step {index} waits for unknown or later step '{dependency}'")
+        if step.get("id"):
+            if step["id"] in step_ids:
+                problems.append(f"duplicate step id '{step['id']}'")
+            step_ids.add(step["id"])
+
+    if steps and "deploy" not in steps[-1].get("args", []):
+        problems.append("the last step does not deploy to Cloud Run")
+
+    for image in config.get("images", []):
+        if not any("-t" in step.get("args", []) and image in step["args"] for step in steps):
+            problems.append(f"listed image {image} is not built by any step")
+
+    # Cloud Build fails a build whose substitutions are not all referenced by a step.
+    for key in config.get("substitutions", {}):
+        if not key.startswith("_"):
+            problems.append(f"substitution {key} is not a user substitution (must start with '_')")
+        if not any(f"${key}" in arg or f"${{{key}}}" in arg for step in steps for arg in step.get("args", [])):
+            problems.append(f"substitution {key} is not used by any step")
+
+    machine_type = config.get("options", {}).get("machineType")
+    known_machine_types = [machine.name for machine in cloudbuild_v1.BuildOptions.MachineType]
+    if machine_type and machine_type not in known_machine_types:
+        problems.append(f"unknown machine type {machine_type}")
+
+    if not _TIMEOUT_PATTERN.match(config.get("timeout", "")):
+        problems.append(f"timeout {config.get('timeout')!r} is not a duration like '1200s'")
+
+    try:
+        to_build(config)
+    except Exception as e:
+        problems.append(f"Cloud Build rejects the config: {e}")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Print and validate the Cloud Build config of a build profile.")
+    parser.add_argument("--profile", default=None, help=f"One of: {', '.join(profiles())}. Defaults to BUILD_PROFILE.")
+    parser.add_argument("--service-name", default="example-service")
+    parser.add_argument("--runtime", default=None, help="Runtime target whose deploy flags are added. Defaults to RUNTIME_TARGET.")
+    args = parser.parse_args(argv)
+
+    profile = get_profile(args.profile)
+    runtime = runtime_for(args.runtime)
+    config = build_config(profile, image_name_for(args.service_name), args.service_name, runtime)
+    print(json.dumps(config, indent=2))
+    problems = validate_config(config)
+    for problem in problems:
+        print(f"invalid: {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
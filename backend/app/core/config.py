@@ -14,8 +14,146 @@ class Settings(BaseSettings):
     GCP_REGION: str = "us-central1"
     GCP_SOURCE_BUCKET_NAME: str
     FIRESTORE_SERVICES_COLLECTION: str = "services"
+    # Dedup index: rendered source hash -> uploaded blob and built image digest
+    FIRESTORE_ARTIFACTS_COLLECTION: str = "artifacts"
+    ARTIFACT_DEDUP_ENABLED: bool = True
+
+    # Batch generation
+    FIRESTORE_BATCHES_COLLECTION: str = "batches"
+    BATCH_MAX_PROMPTS: int = 50
+
+    # Spec edits (PATCH /services/{id}): revisions kept per service, oldest dropped first
+    SERVICE_MAX_REVISIONS: int = 20
+
+    # Build status reconciliation
+    RECONCILER_POLL_SECONDS: float = 15.0
+    # Shared secret expected as ?token= on the Cloud Build Pub/Sub push webhook.
+    # The webhook is disabled while this is unset.
+    CLOUD_BUILD_WEBHOOK_TOKEN: Optional[str] = None
+
+    # Bearer token a scraper must send to GET /metrics; the endpoint is disabled (404) while this is unset.
+    METRICS_TOKEN: Optional[str] = None
+
+    # Generation job queue ("firestore" is durable; "memory" is for local runs and tests)
+    JOB_BACKEND: str = "firestore"
+    FIRESTORE_JOBS_COLLECTION: str = "jobs"
+    JOB_WORKERS: int = 4
+    JOB_LEASE_SECONDS: float = 300.0
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_POLL_SECONDS: float = 2.0
+    STAGE_CONCURRENCY_AI: int = 4
+    STAGE_CONCURRENCY_PACKAGE: int = 2
+    STAGE_CONCURRENCY_UPLOAD: int = 4
+    STAGE_CONCURRENCY_BUILD: int = 2
+    STAGE_CONCURRENCY_SMOKE: int = 2
+
+    # Admission control for POST /generate and /generate/batch (see app/core/admission.py)
+    ADMISSION_ENABLED: bool = True
+    # Where per-user token buckets live: "firestore" (shared by every instance) or "memory" (one instance)
+    ADMISSION_STORE: str = "firestore"
+    FIRESTORE_ADMISSION_COLLECTION: str = "admission"
+    # Per-user token bucket: sustained generations per minute, and how many may be started at once
+    ADMISSION_USER_RATE_PER_MINUTE: float = 6.0
+    ADMISSION_USER_BURST: int = 10
+    # Global caps: services still in the pipeline (PENDING) and builds in flight (BUILDING)
+    ADMISSION_MAX_PENDING: int = 100
+    ADMISSION_MAX_BUILDING: int = 30
+    # How long the global counts are reused before they are queried again
+    ADMISSION_LOAD_TTL_SECONDS: float = 2.0
+    # Retry-After sent when a global cap is reached
+    ADMISSION_RETRY_AFTER_SECONDS: int = 30
+
+    # Firebase ID token verification
+    AUTH_TOKEN_CACHE_SIZE: int = 2048
+    AUTH_VERIFY_WORKERS: int = 4
+    AUTH_CERT_REFRESH_SECONDS: float = 300.0
+
+    # Build profile for generated services: "standard", "cached" or "kaniko" (see app/core/build_profiles.py)
+    BUILD_PROFILE: str = "standard"
+    # Overrides the prebuilt base image used by the "cached" and "kaniko" profiles
+    BUILD_BASE_IMAGE: Optional[str] = None
+    BUILD_MACHINE_TYPE: Optional[str] = None
+    BUILD_TIMEOUT_SECONDS: Optional[int] = None
+    BUILD_CACHE_TTL_HOURS: int = 168
+
+    # Default runtime for generated services: "asgi" or "flask" (see app/core/runtimes.py)
+    RUNTIME_TARGET: str = "flask"
+    # Cloud Run instance shape; servers are sized from it
+    RUNTIME_CPU: int = 1
+    RUNTIME_MEMORY: str = "512Mi"
+    RUNTIME_ASGI_CONCURRENCY: int = 80
+
+    # Pre-deploy smoke test of every new generated source (see app/core/smoke_gate.py)
+    SMOKE_TEST_ENABLED: bool = True
+    SMOKE_TEST_REQUESTS: int = 200
+    SMOKE_TEST_MAX_ERROR_RATE: float = 0.0
+    SMOKE_TEST_MAX_P99_MS: float = 250.0
+    SMOKE_TEST_TIMEOUT_SECONDS: float = 30.0
+
+    # GCS I/O (see app/core/storage_io.py): concurrent calls per operation; the thread pool is sized from these
+    GCS_CONCURRENCY_UPLOAD: int = 4
+    GCS_CONCURRENCY_READ: int = 8
+    GCS_CONCURRENCY_STAT: int = 8
+    GCS_TIMEOUT_SECONDS: float = 60.0
+    # Larger uploads (or ones of unknown size) are resumable and sent in chunks of GCS_UPLOAD_CHUNK_BYTES
+    GCS_RESUMABLE_THRESHOLD_BYTES: int = 8 * 1024 * 1024
+    # Must be a multiple of 256 KiB
+    GCS_UPLOAD_CHUNK_BYTES: int = 8 * 1024 * 1024
+
+    # Build log streaming
+    BUILD_LOG_CHUNK_BYTES: int = 256 * 1024
+    BUILD_LOG_FOLLOW_POLL_SECONDS: float = 2.0
+    # Resolved log object names remembered per build id
+    BUILD_LOG_LOCATION_CACHE_SIZE: int = 1024
+
+    # Service status event stream (GET /services/events)
+    # Seconds between keep-alive comments
+    EVENTS_HEARTBEAT_SECONDS: float = 15.0
+    # "firestore": each instance listens for changes to its connected users' services, so updates
+    # written by any instance reach every stream; "memory": only updates made by the same instance
+    EVENTS_FANOUT: str = "firestore"
+
     GEMINI_API_KEY: str
     GCP_SIGNER_SERVICE_ACCOUNT_EMAIL: Optional[str] = None
+
+    # Artifact download links
+    SIGNED_URL_TTL_SECONDS: int = 3600
+    # A cached link is reissued once less than this much of its lifetime remains.
+    SIGNED_URL_REFRESH_MARGIN_SECONDS: int = 600
+    SIGNED_URL_CACHE_SIZE: int = 1024
+    SIGNING_WORKERS: int = 2
+    SIGNER_CREDENTIALS_LIFETIME_SECONDS: int = 3600
+
+    # AI spec generation
+    # "gemini" talks to the Gemini API; "fake" returns canned specs locally (load tests).
+    AI_PROVIDER: str = "gemini"
+    GEMINI_MODEL_NAME: str = "models/gemini-pro-latest"
+    AI_MAX_CONCURRENCY: int = 4
+    AI_TIMEOUT_SECONDS: float = 90.0
+    # Ask Gemini for JSON matching the spec schema (response_schema); turn off for models without structured output
+    AI_STRUCTURED_OUTPUT: bool = True
+    AI_FAKE_LATENCY_SECONDS: float = 0.0
+
+    # Total time for one spec including retries and hedged requests; AI_TIMEOUT_SECONDS bounds each attempt
+    AI_DEADLINE_SECONDS: float = 180.0
+    # Send a duplicate Gemini request once a call runs longer than the recent p95 (but at least the min delay)
+    AI_HEDGE_ENABLED: bool = True
+    AI_HEDGE_MIN_DELAY_SECONDS: float = 5.0
+
+    # Upstream retries and circuit breakers (see app/core/resilience.py)
+    # Retries may add at most this fraction of extra calls per upstream
+    RETRY_BUDGET_RATIO: float = 0.2
+    # Consecutive transient failures that open an upstream's breaker, and how long it stays open
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_RESET_SECONDS: float = 30.0
+
+    # Prompt -> spec cache (in-process LRU backed by a Firestore collection)
+    SPEC_CACHE_ENABLED: bool = True
+    SPEC_CACHE_PERSISTENT: bool = True
+    SPEC_CACHE_MAX_ENTRIES: int = 512
+    SPEC_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    FIRESTORE_SPEC_CACHE_COLLECTION: str = "spec_cache"
+
     # Default CORS origins for local development.
     # In production, this is overridden by the Cloud Run environment variable.
     CORS_ORIGINS: str = "http://localhost:5173,http://127.0.0.1:5173"
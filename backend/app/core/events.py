@@ -0,0 +1,174 @@
+"""
+Service status deltas for the dashboard's event stream (GET /services/events).
+
+Status changes are published from wherever a transition happens: a job
+worker, the reconciler's poll or the Cloud Build webhook, on any instance.
+The in-memory broker only reaches streams held by the publishing instance;
+with EVENTS_FANOUT=firestore each instance also listens to the services of
+the users it holds streams for, so a change written anywhere reaches them.
+"""
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from app.core import telemetry
+from app.core.config import settings
+from app.models.service import ServiceMetadata
+
+log = telemetry.get_logger("events")
+
+# Fields pushed to the dashboard when a service changes state.
+DELTA_FIELDS = ("service_name", "status", "deployed_url", "error_message", "updated_at")
+
+
+def status_delta(metadata: ServiceMetadata) -> Dict[str, Any]:
+    """Builds the event payload for a service: its id plus the fields the dashboard renders."""
+    delta = {"id": metadata.id}
+    delta.update({field: getattr(metadata, field) for field in DELTA_FIELDS})
+    return delta
+
+
+class StatusBroker:
+    """
+    In-process fan-out of service status deltas. Each user has one subscriber
+    set shared by all of their open streams, so a pipeline or reconciler update
+    is published once and copied to every connected tab.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    @property
+    def connections(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    async def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+
+    def publish(self, user_id: str, delta: Dict[str, Any]):
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                # A slow client only ever needs the latest state; drop its oldest delta.
+                queue.get_nowait()
+            queue.put_nowait(delta)
+
+
+def _fingerprint(delta: Dict[str, Any]) -> Tuple:
+    # Not updated_at: a local publish and the written document can carry different clocks for one change.
+    return tuple(delta.get(field) for field in ("status", "deployed_url", "error_message"))
+
+
+class FirestoreStatusBroker(StatusBroker):
+    """
+    StatusBroker that also delivers changes made by other instances. While a
+    user has an open stream here, a Firestore listener on their services
+    forwards every added or modified document. The listener calls back on its
+    own thread, so changes are handed to the event loop; a change this instance
+    already published (same status, URL and error) is not sent twice.
+    """
+
+    def __init__(self, collection: str, queue_size: int = 100):
+        super().__init__(queue_size)
+        self.collection = collection
+        self._watches: Dict[str, Any] = {}
+        # Last delivered fingerprint per user and service.
+        self._last: Dict[str, Dict[str, Tuple]] = {}
+
+    async def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = await super().subscribe(user_id)
+        if user_id not in self._watches:
+            # Claimed before the await, so concurrent subscribers start one listener.
+            claim = object()
+            self._watches[user_id] = claim
+            self._last[user_id] = {}
+            try:
+                watch = await self._watch(user_id)
+            except Exception as e:
+                # Local publishes still arrive, and the dashboard's fallback poll covers the rest.
+                log.warning(f"Could not listen for status changes: {e}", extra={"fields": {"user_id": user_id}})
+                watch = None
+            if self._watches.get(user_id) is claim:
+                self._watches[user_id] = watch
+            else:
+                # Every stream closed while the listener was starting.
+                self._stop(watch)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        super().unsubscribe(user_id, queue)
+        if user_id not in self._subscribers:
+            self._last.pop(user_id, None)
+            self._stop(self._watches.pop(user_id, None))
+
+    def publish(self, user_id: str, delta: Dict[str, Any]):
+        last = self._last.get(user_id)
+        if last is not None:
+            last[delta["id"]] = _fingerprint(delta)
+        super().publish(user_id, delta)
+
+    async def _watch(self, user_id: str):
+        from app.state import clients
+
+        db = await clients.aget("firestore_watch_client")
+        query = db.collection(self.collection).where("user_id", "==", user_id)
+        loop = asyncio.get_running_loop()
+        initial = [True]
+
+        def on_snapshot(documents, changes, read_time):
+            deltas = [
+                {"id": change.document.id, **{field: data.get(field) for field in DELTA_FIELDS}}
+                for change in changes
+                if change.type.name in ("ADDED", "MODIFIED") and (data := change.document.to_dict()) is not None
+            ]
+            try:
+                loop.call_soon_threadsafe(self._deliver, user_id, deltas, initial[0])
+            except RuntimeError:
+                # The loop has closed; the listener is about to be stopped.
+                pass
+            initial[0] = False
+
+        # Starting a listener opens its stream and thread; keep that off the loop.
+        return await asyncio.to_thread(query.on_snapshot, on_snapshot)
+
+    def _deliver(self, user_id: str, deltas, initial: bool):
+        last = self._last.get(user_id)
+        if last is None:
+            return
+        for delta in deltas:
+            fingerprint = _fingerprint(delta)
+            if last.get(delta["id"]) == fingerprint:
+                continue
+            last[delta["id"]] = fingerprint
+            # The first snapshot is every existing service: the state the stream starts from, not a change.
+            if not initial:
+                super().publish(user_id, delta)
+
+    @staticmethod
+    def _stop(watch: Optional[Any]):
+        # None, or the claim of a listener that is still starting.
+        if hasattr(watch, "unsubscribe"):
+            # Stopping joins the listener's thread.
+            asyncio.get_running_loop().run_in_executor(None, watch.unsubscribe)
+
+
+def build_broker() -> StatusBroker:
+    """Creates the broker configured by EVENTS_FANOUT."""
+    if settings.EVENTS_FANOUT == "firestore":
+        return FirestoreStatusBroker(settings.FIRESTORE_SERVICES_COLLECTION)
+    if settings.EVENTS_FANOUT == "memory":
+        return StatusBroker()
+    raise ValueError(f"Unknown events fan-out '{settings.EVENTS_FANOUT}'. Expected 'firestore' or 'memory'.")
+
+
+broker = build_broker()
@@ -1,98 +1,257 @@
 import asyncio
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterable, List, Optional, Tuple
 
 from google.api_core.exceptions import NotFound
-from google.auth.transport.requests import Request
-from google.auth import impersonated_credentials
-from google.cloud import firestore, storage
-from google.cloud.devtools import cloudbuild_v1
 
+from app.core import build_profiles, resilience
+from app.core.concurrency import SingleFlight
 from app.core.config import settings
-from app.models.service import ServiceMetadata
+from app.core.runtimes import RuntimeTarget
+from app.core.storage_io import gcs
+from app.models.service import GenerationBatch, ServiceMetadata, ServiceStatus
 from app.state import clients
 
-# Use async clients for Google Cloud services that support them
-db = firestore.AsyncClient(project=settings.GCP_PROJECT_ID)
-# Use synchronous client for storage (will be wrapped in executor when called)
-storage_client = storage.Client(project=settings.GCP_PROJECT_ID)
-# Note: cloudbuild_client is initialized in main.py's lifespan and accessed via clients dict
+if TYPE_CHECKING:
+    from google.cloud.devtools import cloudbuild_v1
 
+# Firestore caps a WriteBatch at 500 operations.
+WRITE_BATCH_LIMIT = 500
+# Max build ids OR-ed together in a single list_builds filter.
+BUILD_FILTER_CHUNK_SIZE = 50
+_lookups = SingleFlight()
 
-async def save_service_metadata(metadata: ServiceMetadata):
-    """Saves or updates service metadata in Firestore."""
-    metadata.updated_at = datetime.utcnow()
-    doc_ref = db.collection(settings.FIRESTORE_SERVICES_COLLECTION).document(metadata.id)
-    await doc_ref.set(metadata.model_dump())
-
-
-async def upload_source_to_gcs(source_zip_path: str, destination_blob_name: str) -> str:
-    """Uploads the zipped source code to Google Cloud Storage asynchronously."""
-    # Run the synchronous storage operation in a thread pool to avoid blocking
-    loop = asyncio.get_event_loop()
-
-    def _upload():
-        bucket = storage_client.bucket(settings.GCP_SOURCE_BUCKET_NAME)
-        blob = bucket.blob(destination_blob_name)
-        blob.upload_from_filename(source_zip_path)
-        return f"gs://{settings.GCP_SOURCE_BUCKET_NAME}/{destination_blob_name}"
-
-    return await loop.run_in_executor(None, _upload)
 
+def __getattr__(name: str):
+    # `gcp.db` and `gcp.storage_client` are created on first use (see app.state).
+    if name == "db":
+        return clients["firestore_client"]
+    if name == "storage_client":
+        return clients["storage_client"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-async def generate_signed_url(destination_blob_name: str, expires_in: int = 3600) -> str:
-    """Generates a signed URL for a previously uploaded artifact."""
-    loop = asyncio.get_event_loop()
 
-    def _sign():
-        bucket = storage_client.bucket(settings.GCP_SOURCE_BUCKET_NAME)
-        blob = bucket.blob(destination_blob_name)
+def _db():
+    return clients["firestore_client"]
 
-        if not blob.exists():
-            raise FileNotFoundError(f"Artifact {destination_blob_name} not found in bucket.")
 
-        expiration = timedelta(seconds=expires_in)
-
-        credentials = storage_client._credentials
-        request = Request()
-        if credentials is not None and not credentials.valid:
-            credentials.refresh(request)
-
-        if credentials and hasattr(credentials, "sign_bytes") and callable(getattr(credentials, "sign_bytes")):
-            signing_credentials = credentials
-        else:
-            signer_email = settings.GCP_SIGNER_SERVICE_ACCOUNT_EMAIL
-            if not signer_email:
-                raise RuntimeError(
-                    "GCP_SIGNER_SERVICE_ACCOUNT_EMAIL must be configured to use IAM-based signing."
-                )
+@resilience.guarded("firestore", "set_service")
+async def save_service_metadata(metadata: ServiceMetadata):
+    """Saves or updates service metadata in Firestore."""
+    metadata.updated_at = datetime.utcnow()
+    doc_ref = _db().collection(settings.FIRESTORE_SERVICES_COLLECTION).document(metadata.id)
+    await doc_ref.set(metadata.model_dump())
 
-            base_credentials = credentials or storage_client._credentials
-            if base_credentials is None:
-                raise RuntimeError("Storage client has no credentials available for signing.")
 
-            if not base_credentials.valid:
-                base_credentials.refresh(request)
+@resilience.guarded("firestore", "update_service")
+async def update_service_fields(service_id: str, changes: dict):
+    """
+    Writes only the given fields plus a server-side `updated_at`.
+    Raises NotFound if the service was deleted, instead of recreating it.
+    """
+    await _update_service_fields(service_id, changes)
+
+
+async def _update_service_fields(service_id: str, changes: dict):
+    doc_ref = _db().collection(settings.FIRESTORE_SERVICES_COLLECTION).document(service_id)
+    from google.cloud.firestore import SERVER_TIMESTAMP
+
+    await doc_ref.update({**changes, "updated_at": SERVER_TIMESTAMP})
+
+
+@resilience.guarded("firestore", "batch_update_services")
+async def update_services_batch(updates: Dict[str, dict]) -> List[str]:
+    """
+    Applies many partial service updates with WriteBatch commits and returns the ids written.
+    A batch is atomic, so one deleted service fails it; that batch then falls back to
+    individual updates and deleted services are skipped.
+    """
+    from google.cloud.firestore import SERVER_TIMESTAMP
+
+    items = list(updates.items())
+    written: List[str] = []
+    for start in range(0, len(items), WRITE_BATCH_LIMIT):
+        chunk = items[start:start + WRITE_BATCH_LIMIT]
+        batch = _db().batch()
+        for service_id, changes in chunk:
+            doc_ref = _db().collection(settings.FIRESTORE_SERVICES_COLLECTION).document(service_id)
+            batch.update(doc_ref, {**changes, "updated_at": SERVER_TIMESTAMP})
+        try:
+            await batch.commit()
+            written.extend(service_id for service_id, _ in chunk)
+        except NotFound:
+            for service_id, changes in chunk:
+                try:
+                    # Unguarded: this whole call is already retried as one batch_update_services.
+                    await _update_service_fields(service_id, changes)
+                    written.append(service_id)
+                except NotFound:
+                    continue
+    return written
+
+
+@resilience.guarded("firestore", "batch_create_services")
+async def save_batch(batch: GenerationBatch, services: List[ServiceMetadata]):
+    """Creates a batch document and all of its services with as few WriteBatch commits as possible."""
+    now = datetime.utcnow()
+    writes = [(_db().collection(settings.FIRESTORE_BATCHES_COLLECTION).document(batch.id), batch.model_dump())]
+    for metadata in services:
+        metadata.updated_at = now
+        doc_ref = _db().collection(settings.FIRESTORE_SERVICES_COLLECTION).document(metadata.id)
+        writes.append((doc_ref, metadata.model_dump()))
+    for start in range(0, len(writes), WRITE_BATCH_LIMIT):
+        write_batch = _db().batch()
+        for doc_ref, data in writes[start:start + WRITE_BATCH_LIMIT]:
+            write_batch.set(doc_ref, data)
+        await write_batch.commit()
+
+
+@resilience.guarded("firestore", "get_batch")
+async def get_batch(batch_id: str) -> Optional[GenerationBatch]:
+    doc = await _db().collection(settings.FIRESTORE_BATCHES_COLLECTION).document(batch_id).get()
+    return GenerationBatch(**doc.to_dict()) if doc.exists else None
+
+
+@resilience.guarded("firestore", "get_services")
+async def get_services(service_ids: Iterable[str]) -> Dict[str, ServiceMetadata]:
+    """Reads many services in one batched get; deleted services are left out."""
+    refs = [_db().collection(settings.FIRESTORE_SERVICES_COLLECTION).document(service_id) for service_id in service_ids]
+    services = {}
+    async for doc in _db().get_all(refs):
+        if doc.exists:
+            services[doc.id] = ServiceMetadata(**doc.to_dict())
+    return services
+
+
+async def _count_by_status(services_ref, statuses: List[str]) -> Dict[str, int]:
+    """One count aggregation per status (no document reads), run concurrently."""
+    async def count(status: str) -> int:
+        result = await services_ref.where("status", "==", status).count().get()
+        return result[0][0].value if result else 0
+
+    counts = await asyncio.gather(*(count(status) for status in statuses))
+    return dict(zip(statuses, counts))
+
+
+@resilience.guarded("firestore", "count_batch_services")
+async def count_batch_services(batch_id: str) -> Dict[str, int]:
+    """Service count per status for a batch."""
+    services_ref = _db().collection(settings.FIRESTORE_SERVICES_COLLECTION).where("batch_id", "==", batch_id)
+    statuses = [ServiceStatus.PENDING, ServiceStatus.BUILDING, ServiceStatus.DEPLOYED, ServiceStatus.FAILED]
+    return await _count_by_status(services_ref, statuses)
+
+
+@resilience.guarded("firestore", "count_services")
+async def count_services_by_status(statuses: List[str]) -> Dict[str, int]:
+    """Service count per status across every user."""
+    return await _count_by_status(_db().collection(settings.FIRESTORE_SERVICES_COLLECTION), statuses)
+
+
+class MetadataWriter:
+    """
+    Persists a ServiceMetadata incrementally. It remembers what Firestore already
+    holds, and `flush` sends only the fields changed since then in one update(),
+    so every mutation made during a stage is coalesced into a single write and
+    the prompt/spec are never resent unless they changed.
+    """
+
+    def __init__(self, metadata: ServiceMetadata):
+        self.metadata = metadata
+        self._persisted = metadata.model_dump()
+
+    def changes(self) -> dict:
+        current = self.metadata.model_dump()
+        return {
+            field: value for field, value in current.items()
+            if field != "updated_at" and self._persisted.get(field) != value
+        }
+
+    async def flush(self) -> dict:
+        changes = self.changes()
+        if not changes:
+            return changes
+        await update_service_fields(self.metadata.id, changes)
+        self._persisted.update(changes)
+        self.metadata.updated_at = datetime.utcnow()
+        return changes
+
+
+@resilience.guarded("firestore", "get_artifact")
+async def get_artifact(content_hash: str) -> Optional[dict]:
+    """Looks up a previously uploaded/built source tree in the dedup index."""
+    doc = await _db().collection(settings.FIRESTORE_ARTIFACTS_COLLECTION).document(content_hash).get()
+    return doc.to_dict() if doc.exists else None
+
+
+@resilience.guarded("firestore", "set_artifact")
+async def record_artifact_source(content_hash: str, source_blob: str, gcs_uri: str, smoke_test: Optional[dict] = None):
+    """Registers an uploaded source archive (and its smoke test report) under its content hash."""
+    doc_ref = _db().collection(settings.FIRESTORE_ARTIFACTS_COLLECTION).document(content_hash)
+    now = datetime.utcnow()
+    await doc_ref.set({
+        "source_blob": source_blob,
+        "gcs_uri": gcs_uri,
+        "smoke_test": smoke_test,
+        "created_at": now,
+        "updated_at": now,
+    }, merge=True)
+
+
+@resilience.guarded("firestore", "set_artifact")
+async def record_artifact_image(content_hash: str, image: str):
+    """Attaches the digest-pinned image built from a source tree to its dedup entry."""
+    doc_ref = _db().collection(settings.FIRESTORE_ARTIFACTS_COLLECTION).document(content_hash)
+    await doc_ref.set({"image": image, "updated_at": datetime.utcnow()}, merge=True)
 
-            signing_credentials = impersonated_credentials.Credentials(
-                source_credentials=base_credentials,
-                target_principal=signer_email,
-                target_scopes=["https://www.googleapis.com/auth/cloud-platform"],
-                lifetime=300,
-            )
 
-        return blob.generate_signed_url(
-            expiration=expiration,
-            version="v4",
-            credentials=signing_credentials,
-        )
+def built_image_ref(build, image_name: Optional[str] = None) -> Optional[str]:
+    """
+    Returns the digest-pinned reference (name@sha256:...) of a finished build's image, if any.
+    Builds that push several images (see `trigger_combined_build`) pass the `image_name` wanted.
+    """
+    for image in build.results.images:
+        if image_name is not None and image.name != image_name:
+            continue
+        if image.digest:
+            return f"{image.name.rsplit(':', 1)[0]}@{image.digest}"
+    return None
+
+
+async def upload_source_to_gcs(source: BinaryIO, destination_blob_name: str, size: Optional[int] = None) -> str:
+    """Uploads the zipped source code from a file-like object to Google Cloud Storage (see app.core.storage_io)."""
+    await gcs.upload(settings.GCP_SOURCE_BUCKET_NAME, destination_blob_name, source, size, "application/zip")
+    return f"gs://{settings.GCP_SOURCE_BUCKET_NAME}/{destination_blob_name}"
 
-    return await loop.run_in_executor(None, _sign)
+
+@dataclass
+class BuildLog:
+    """Where a build's log lives in GCS and how many bytes it held when last checked."""
+    bucket: str
+    object_name: str
+    size: int
+
+    @property
+    def filename(self) -> str:
+        return self.object_name.split("/")[-1]
+
+
+# build id -> (bucket, object name); repeat reads skip fetching the build and probing names.
+_build_log_locations: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
 
 
-async def fetch_build_logs(build_id: str) -> tuple[str, str]:
-    """Fetches Cloud Build logs for the given build ID and returns the log text and the filename."""
+async def _object_size(bucket_name: str, object_name: str) -> Optional[int]:
+    """Returns an object's current size, or None if it does not exist (yet)."""
+    return await gcs.object_size(bucket_name, object_name)
+
+
+async def _find_build_log(build_id: str) -> Optional[BuildLog]:
     cloudbuild_client = clients["build_client"]
-    build = await cloudbuild_client.get_build(project_id=settings.GCP_PROJECT_ID, id=build_id)
+    build = await resilience.call(
+        "cloud_build", "get_build",
+        lambda: cloudbuild_client.get_build(project_id=settings.GCP_PROJECT_ID, id=build_id),
+    )
 
     logs_bucket = build.logs_bucket
     if not logs_bucket:
@@ -118,70 +277,134 @@ async def fetch_build_logs(build_id: str) -> tuple[str, str]:
     # Remove duplicates while preserving order
     object_candidates = list(dict.fromkeys(object_candidates))
 
-    loop = asyncio.get_event_loop()
-
-    def _download() -> tuple[str, str]:
-        bucket = storage_client.bucket(bucket_name)
-        last_error: Exception | None = None
-        for object_name in object_candidates:
-            blob = bucket.blob(object_name)
-            try:
-                content = blob.download_as_text()
-                filename = object_name.split("/")[-1]
-                return content, filename
-            except NotFound as err:
-                last_error = err
-                continue
-        raise FileNotFoundError(
-            f"Build logs not found in bucket {logs_bucket} for build {build_id}."
-        ) from last_error
-
-    return await loop.run_in_executor(None, _download)
-
-
-async def trigger_cloud_build(gcs_source_uri: str, service_name: str) -> str:
-    """Triggers a Cloud Build job to build and deploy the service asynchronously."""
+    # Probe every candidate at once instead of one round trip after another.
+    sizes = await asyncio.gather(*(_object_size(bucket_name, name) for name in object_candidates))
+    for object_name, size in zip(object_candidates, sizes):
+        if size is not None:
+            return BuildLog(bucket_name, object_name, size)
+    return None
+
+
+async def locate_build_log(build_id: str) -> Optional[BuildLog]:
+    """
+    Finds a build's log object and its current size. Returns None while Cloud
+    Build has not written the log yet. The resolved name is remembered per
+    build, so later calls (and every poll of a followed log) cost one stat.
+    """
+    location = _build_log_locations.get(build_id)
+    if location is not None:
+        size = await _object_size(*location)
+        if size is not None:
+            _build_log_locations.move_to_end(build_id)
+            return BuildLog(*location, size)
+        del _build_log_locations[build_id]
+
+    log = await _lookups.do(("build_log", build_id), lambda: _find_build_log(build_id))
+    if log is not None:
+        _build_log_locations[build_id] = (log.bucket, log.object_name)
+        while len(_build_log_locations) > settings.BUILD_LOG_LOCATION_CACHE_SIZE:
+            _build_log_locations.popitem(last=False)
+    return log
+
+
+async def read_object_range(bucket_name: str, object_name: str, start: int, end: int) -> bytes:
+    """Downloads bytes [start, end) of an object; only that slice is held in memory."""
+    return await gcs.read_range(bucket_name, object_name, start, end)
+
+
+@resilience.guarded("cloud_build", "list_builds")
+async def _list_builds(build_ids: tuple) -> Dict[str, "cloudbuild_v1.Build"]:
+    cloudbuild_client = clients["build_client"]
+    build_filter = " OR ".join(f'build_id="{build_id}"' for build_id in build_ids)
+    pager = await cloudbuild_client.list_builds(
+        project_id=settings.GCP_PROJECT_ID,
+        filter=build_filter,
+        page_size=len(build_ids),
+    )
+    return {build.id: build async for build in pager}
+
+
+async def get_builds(build_ids: Iterable[str]) -> Dict[str, "cloudbuild_v1.Build"]:
+    """
+    Fetches many builds with one filtered list_builds call per chunk of ids instead of
+    one get_build per id. Concurrent lookups of the same ids share a single upstream call.
+    """
+    unique_ids = sorted(set(build_ids))
+    chunks = [
+        tuple(unique_ids[i:i + BUILD_FILTER_CHUNK_SIZE])
+        for i in range(0, len(unique_ids), BUILD_FILTER_CHUNK_SIZE)
+    ]
+    results = await asyncio.gather(*(
+        _lookups.do(("builds", chunk), lambda chunk=chunk: _list_builds(chunk)) for chunk in chunks
+    ))
+    builds: Dict[str, "cloudbuild_v1.Build"] = {}
+    for result in results:
+        builds.update(result)
+    return builds
+
+
+@resilience.guarded("cloud_run", "list_services")
+async def _list_service_urls(region: str) -> Dict[str, str]:
+    run_client = clients["run_client"]
+    pager = await run_client.list_services(parent=f"projects/{settings.GCP_PROJECT_ID}/locations/{region}")
+    return {service.name.rsplit("/", 1)[-1]: service.uri async for service in pager}
+
+
+async def get_service_urls(region: str) -> Dict[str, str]:
+    """Maps Cloud Run service name -> URL for a whole region with one list_services call."""
+    return await _lookups.do(("run_services", region), lambda: _list_service_urls(region))
+
+
+@resilience.guarded("cloud_build", "create_build", idempotent=False)
+async def trigger_cloud_build(
+    gcs_source_uri: str,
+    service_name: str,
+    profile: build_profiles.BuildProfile,
+    runtime: Optional[RuntimeTarget] = None,
+    cache_from: Optional[str] = None,
+) -> str:
+    """
+    Triggers a Cloud Build job that builds and deploys the service with the given build profile.
+    `cache_from` names the image whose layers a docker layer cache starts from (see `build_profiles.image_steps`).
+    """
+    from google.cloud.devtools import cloudbuild_v1
+
     cloudbuild_client = clients["build_client"]
-    project_id = settings.GCP_PROJECT_ID
-    region = settings.GCP_REGION
     source_object = gcs_source_uri.split(f"gs://{settings.GCP_SOURCE_BUCKET_NAME}/")[-1]
 
-    # Define build steps directly (matching cloudbuild.yaml.j2 template)
-    image_name = f"{region}-docker.pkg.dev/{project_id}/api-architect-repo/{service_name}:latest"
-
-    build = cloudbuild_v1.Build(
-        source=cloudbuild_v1.Source(
-            storage_source=cloudbuild_v1.StorageSource(
-                bucket=settings.GCP_SOURCE_BUCKET_NAME,
-                object_=source_object
-            )
-        ),
-        steps=[
-            # Step 1: Build the Docker image
-            cloudbuild_v1.BuildStep(
-                name="gcr.io/cloud-builders/docker",
-                args=["build", "-t", image_name, "."]
-            ),
-            # Step 2: Push to Artifact Registry
-            cloudbuild_v1.BuildStep(
-                name="gcr.io/cloud-builders/docker",
-                args=["push", image_name]
-            ),
-            # Step 3: Deploy to Cloud Run
-            cloudbuild_v1.BuildStep(
-                name="gcr.io/google.com/cloudsdktool/cloud-sdk",
-                entrypoint="gcloud",
-                args=[
-                    "run", "deploy", service_name,
-                    "--image", image_name,
-                    "--region", region,
-                    "--platform", "managed",
-                    "--allow-unauthenticated",
-                    "--project", project_id
-                ]
-            )
-        ]
+    image_name = build_profiles.image_name_for(service_name)
+    build = build_profiles.to_build(build_profiles.build_config(profile, image_name, service_name, runtime, cache_from))
+    build.source = cloudbuild_v1.Source(
+        storage_source=cloudbuild_v1.StorageSource(
+            bucket=settings.GCP_SOURCE_BUCKET_NAME,
+            object_=source_object
+        )
     )
 
-    operation = await cloudbuild_client.create_build(project_id=project_id, build=build)
+    operation = await cloudbuild_client.create_build(project_id=settings.GCP_PROJECT_ID, build=build)
+    return operation.metadata.build.id
+
+
+@resilience.guarded("cloud_build", "create_build", idempotent=False)
+async def trigger_cloud_deploy(image: str, service_name: str, runtime: Optional[RuntimeTarget] = None) -> str:
+    """
+    Deploys an already built image to Cloud Run without a docker build.
+    Runs as a one-step Cloud Build job so status tracking works exactly like a full build.
+    """
+    cloudbuild_client = clients["build_client"]
+    build = build_profiles.to_build({"steps": [build_profiles.deploy_step(service_name, image, runtime)]})
+    operation = await cloudbuild_client.create_build(project_id=settings.GCP_PROJECT_ID, build=build)
+    return operation.metadata.build.id
+
+
+@resilience.guarded("cloud_build", "create_build", idempotent=False)
+async def trigger_combined_build(targets: List[dict], profile: build_profiles.BuildProfile) -> str:
+    """
+    Builds and deploys several services in one Cloud Build job, one parallel chain of
+    steps per service (see `build_profiles.combined_build_config`). Each service's
+    source is fetched by its own step, so the build itself has no source.
+    """
+    cloudbuild_client = clients["build_client"]
+    build = build_profiles.to_build(build_profiles.combined_build_config(profile, targets))
+    operation = await cloudbuild_client.create_build(project_id=settings.GCP_PROJECT_ID, build=build)
     return operation.metadata.build.id
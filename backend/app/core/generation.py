@@ -1,76 +1,132 @@
+import hashlib
 import os
-import shutil
+import re
 import zipfile
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Any
-from jinja2 import Environment, FileSystemLoader, TemplateError
+from tempfile import SpooledTemporaryFile
+from typing import Dict, Any, BinaryIO, List, Tuple
+from jinja2 import Environment, FileSystemLoader, Template, TemplateError
 import logging
 
+from app.core import spec_validation
+from app.core.runtimes import RuntimeTarget
+
 logging.basicConfig(level=logging.INFO)
 template_dir = Path(__file__).parent.parent.parent / "templates"
-env = Environment(loader=FileSystemLoader(str(template_dir)))
-
-def generate_flask_service(spec: Dict[str, Any], gcp_config: Dict[str, str]) -> str:
-    # --- Robustness Fix: Validate the incoming spec ---
-    service_name = spec.get("service_name")
-    if not service_name:
-        raise ValueError("AI-generated spec is missing the required 'service_name' field.")
-    
-    endpoint_spec = spec.get("endpoint")
-    if not endpoint_spec:
-        raise ValueError("AI-generated spec is missing the required 'endpoint' field.")
-    # ----------------------------------------------------
+# Templates never change at runtime, so skip the per-lookup mtime checks.
+env = Environment(loader=FileSystemLoader(str(template_dir)), auto_reload=False)
+# Specs write path parameters as {name}; Flask routes spell them <name>.
+env.filters["flask_route"] = lambda path: re.sub(r"\{([^}]+)\}", r"<\1>", path)
+
+# Archives larger than this spill from memory into an anonymous temp file.
+ARCHIVE_SPOOL_MAX_BYTES = 8 * 1024 * 1024
+# Fixed timestamp for archive entries so identical sources produce identical zips.
+ARCHIVE_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+@dataclass
+class SourceArchive:
+    """A zipped source tree held in memory (or a spooled temp file), ready for upload."""
+    filename: str
+    fileobj: BinaryIO
+    size: int
+    content_hash: str
+
+    def close(self):
+        self.fileobj.close()
+
+
+def _compile_template_set(name: str) -> List[Tuple[str, Template]]:
+    """
+    Compiles every template of a template set once and pairs it with the
+    path its output takes inside the generated source tree.
+    """
+    set_dir = template_dir / name
+    compiled = []
+    for template_file in sorted(set_dir.rglob("*.j2")):
+        relative_path = template_file.relative_to(set_dir)
+
+        if relative_path.parts and relative_path.parts[0] == 'app':
+            output_relative_path = Path(*relative_path.parts[1:])
+        else:
+            output_relative_path = relative_path
+
+        template_name = template_file.relative_to(template_dir).as_posix()
+        try:
+            template = env.get_template(template_name)
+        except TemplateError as e:
+            raise IOError(f"Failed to compile template {template_name}: {e}")
+        compiled.append((output_relative_path.with_suffix("").as_posix(), template))
+    return compiled
+
+
+TEMPLATE_SETS = {name: _compile_template_set(name) for name in ("flask_template", "asgi_template")}
+
+
+def validate_spec(spec: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Checks the spec against the strict spec model (see app/core/spec_validation.py) and returns (service_name, endpoint)."""
+    spec_validation.check(spec)
+    return spec["service_name"], spec["endpoint"]
+
+
+def render_service(
+    spec: Dict[str, Any], gcp_config: Dict[str, str], build: Dict[str, Any], runtime: RuntimeTarget
+) -> Dict[str, str]:
+    """
+    Renders the runtime's template set and returns {archive path: file content}.
+    `build` carries the build profile name, its base image and the Cloud Build config.
+    """
+    service_name, endpoint_spec = validate_spec(spec)
+
+    context = {
+        "endpoint": endpoint_spec,
+        "storage": spec.get("storage"),
+        "service": {"name": service_name},
+        "gcp": gcp_config,
+        "build": build,
+        "runtime": runtime,
+    }
+
+    files = {}
+    for output_path, template in TEMPLATE_SETS[runtime.template_set]:
+        try:
+            files[output_path] = template.render(context)
+        except TemplateError as e:
+            raise IOError(f"Failed to render template {template.name}: {e}")
+    return files
+
+
+def source_hash(files: Dict[str, str]) -> str:
+    """Content address of a rendered source tree: SHA-256 over every path and its content."""
+    digest = hashlib.sha256()
+    for path in sorted(files):
+        digest.update(path.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(files[path].encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def package_sources(files: Dict[str, str], filename: str) -> SourceArchive:
+    """Zips rendered files straight into a spooled buffer; nothing touches the disk unless it is large."""
+    buffer = SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_MAX_BYTES)
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for path in sorted(files):
+            info = zipfile.ZipInfo(path, date_time=ARCHIVE_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            zipf.writestr(info, files[path])
+
+    size = buffer.tell()
+    buffer.seek(0)
+    return SourceArchive(filename=filename, fileobj=buffer, size=size, content_hash=source_hash(files))
+
 
+def generate_service(
+    spec: Dict[str, Any], gcp_config: Dict[str, str], build: Dict[str, Any], runtime: RuntimeTarget
+) -> SourceArchive:
+    """Renders and packages a service for its runtime. The caller owns the archive and must close it."""
+    files = render_service(spec, gcp_config, build, runtime)
     unique_id = os.urandom(4).hex()
-    build_dir = Path("/tmp") / f"{service_name}_{unique_id}"
-    source_dir = build_dir
-    
-    # --- Robustness Fix: Ensure cleanup happens even if errors occur ---
-    try:
-        source_dir.mkdir(parents=True, exist_ok=True)
-        
-        flask_template_dir = template_dir / "flask_template"
-        
-        context = {
-            "endpoint": endpoint_spec,
-            "storage": spec.get("storage"),
-            "service": {"name": service_name},
-            "gcp": gcp_config
-        }
-
-        for template_file in flask_template_dir.rglob("*.j2"):
-            relative_path = template_file.relative_to(flask_template_dir)
-            
-            if relative_path.parts and relative_path.parts[0] == 'app':
-                output_relative_path = Path(*relative_path.parts[1:])
-            else:
-                output_relative_path = relative_path
-                
-            output_file = source_dir / output_relative_path.with_suffix("")
-            
-            output_file.parent.mkdir(parents=True, exist_ok=True)
-            template_name = template_file.relative_to(template_dir).as_posix()
-            
-            try:
-                template = env.get_template(template_name)
-                rendered_content = template.render(context)
-                with open(output_file, "w") as f:
-                    f.write(rendered_content)
-            except TemplateError as e:
-                raise IOError(f"Failed to render template {template_name}: {e}")
-
-        # Create zip at parent level (not inside source_dir which will be deleted)
-        zip_path = Path("/tmp") / f"{service_name}_{unique_id}.zip"
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, _, files in os.walk(source_dir):
-                for file in files:
-                    file_path = Path(root) / file
-                    archive_path = file_path.relative_to(source_dir)
-                    zipf.write(file_path, archive_path)
-        
-        return str(zip_path)
-    finally:
-        # Clean up the source directory (but not the zip file which is at parent level)
-        if source_dir.exists():
-            shutil.rmtree(source_dir)
-    # -----------------------------------------------------------------
\ No newline at end of file
+    return package_sources(files, f"{spec['service_name']}_{unique_id}.zip")
@@ -0,0 +1,391 @@
+import asyncio
+import random
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, Field
+
+from app.core import gcp, resilience, telemetry
+from app.core.config import settings
+
+log = telemetry.get_logger("jobs")
+
+
+class JobState:
+    PENDING = "PENDING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+
+class LeaseLost(Exception):
+    """The worker's lease on a job expired and the job was leased again; its writes are rejected."""
+
+    def __init__(self, job_id: str):
+        super().__init__(f"Lease on job {job_id} was lost to another worker.")
+        self.job_id = job_id
+
+
+class Job(BaseModel):
+    """
+    A unit of durable work. A pending job is visible to workers once
+    `available_at` has passed; leasing pushes `available_at` forward by the
+    lease duration, so a job whose worker dies simply becomes visible again.
+    """
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    kind: str
+    payload: Dict[str, Any] = Field(default_factory=dict)
+    state: str = JobState.PENDING
+    attempts: int = 0
+    max_attempts: int = 3
+    available_at: datetime = Field(default_factory=datetime.utcnow)
+    lease_id: Optional[str] = None
+    # Results of completed stages, so a retried job resumes where it stopped.
+    checkpoints: Dict[str, Any] = Field(default_factory=dict)
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class JobBackend:
+    """
+    Storage interface for the job queue. Every write to a leased job raises
+    LeaseLost unless the caller still holds the job's current lease.
+    """
+
+    async def enqueue(self, job: Job):
+        raise NotImplementedError
+
+    async def lease(self, lease_seconds: float) -> Optional[Job]:
+        """Claims one visible job, or returns None when the queue is empty."""
+        raise NotImplementedError
+
+    async def extend(self, job: Job, lease_seconds: float):
+        raise NotImplementedError
+
+    async def checkpoint(self, job: Job, stage: str, result: Any):
+        raise NotImplementedError
+
+    async def complete(self, job: Job):
+        raise NotImplementedError
+
+    async def retry(self, job: Job, error: str, delay: float):
+        raise NotImplementedError
+
+    async def fail(self, job: Job, error: str):
+        raise NotImplementedError
+
+
+class InMemoryJobBackend(JobBackend):
+    """Single-process backend for local runs and tests; jobs do not survive a restart."""
+
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self._lock = asyncio.Lock()
+
+    async def enqueue(self, job: Job):
+        self.jobs[job.id] = job.model_copy(deep=True)
+
+    async def lease(self, lease_seconds: float) -> Optional[Job]:
+        async with self._lock:
+            now = datetime.utcnow()
+            visible = [
+                job for job in self.jobs.values()
+                if job.state == JobState.PENDING and job.available_at <= now
+            ]
+            if not visible:
+                return None
+            job = min(visible, key=lambda j: j.available_at)
+            job.lease_id = str(uuid.uuid4())
+            job.attempts += 1
+            job.available_at = now + timedelta(seconds=lease_seconds)
+            job.updated_at = now
+            return job.model_copy(deep=True)
+
+    def _leased(self, job: Job) -> Job:
+        stored = self.jobs.get(job.id)
+        if stored is None or stored.lease_id != job.lease_id:
+            raise LeaseLost(job.id)
+        return stored
+
+    async def extend(self, job: Job, lease_seconds: float):
+        self._leased(job).available_at = datetime.utcnow() + timedelta(seconds=lease_seconds)
+
+    async def checkpoint(self, job: Job, stage: str, result: Any):
+        stored = self._leased(job)
+        job.checkpoints[stage] = result
+        stored.checkpoints[stage] = result
+
+    async def complete(self, job: Job):
+        stored = self._leased(job)
+        stored.state = JobState.DONE
+        stored.updated_at = datetime.utcnow()
+
+    async def retry(self, job: Job, error: str, delay: float):
+        stored = self._leased(job)
+        stored.last_error = error
+        stored.lease_id = None
+        stored.available_at = datetime.utcnow() + timedelta(seconds=delay)
+
+    async def fail(self, job: Job, error: str):
+        stored = self._leased(job)
+        stored.state = JobState.FAILED
+        stored.last_error = error
+        stored.updated_at = datetime.utcnow()
+
+
+async def _claim_job(transaction, ref, lease_seconds: float) -> Optional[Job]:
+    """Leases a job document if it is still pending and visible; runs inside a transaction (see `lease`)."""
+    snapshot = await ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return None
+    job = Job(**snapshot.to_dict())
+    now = datetime.utcnow()
+    if job.state != JobState.PENDING or job.available_at.replace(tzinfo=None) > now:
+        return None
+    job.lease_id = str(uuid.uuid4())
+    job.attempts += 1
+    job.available_at = now + timedelta(seconds=lease_seconds)
+    job.updated_at = now
+    transaction.update(ref, {
+        "lease_id": job.lease_id,
+        "attempts": job.attempts,
+        "available_at": job.available_at,
+        "updated_at": now,
+    })
+    return job
+
+
+async def _update_leased_job(transaction, ref, lease_id: Optional[str], changes: Dict[str, Any]) -> bool:
+    """Applies `changes` only while `lease_id` still holds the job; runs inside a transaction (see `_update`)."""
+    snapshot = await ref.get(transaction=transaction)
+    if not snapshot.exists or snapshot.to_dict().get("lease_id") != lease_id:
+        return False
+    transaction.update(ref, changes)
+    return True
+
+
+class FirestoreJobBackend(JobBackend):
+    """
+    Durable backend: one document per job. Leasing claims a document inside a
+    transaction, so two workers (or instances) can never hold the same job, and
+    every later write compares the lease in a transaction too, so a worker whose
+    lease expired cannot overwrite the job's new holder. Requires a composite index on (state, available_at).
+    """
+
+    def __init__(self, collection: str, scan_size: int = 5):
+        self.collection = collection
+        self.scan_size = scan_size
+
+    def _ref(self, job_id: str):
+        return gcp.db.collection(self.collection).document(job_id)
+
+    async def enqueue(self, job: Job):
+        await self._ref(job.id).set(job.model_dump())
+
+    @telemetry.instrumented("firestore", "lease_job")
+    async def lease(self, lease_seconds: float) -> Optional[Job]:
+        from google.cloud import firestore
+
+        now = datetime.utcnow()
+        query = (
+            gcp.db.collection(self.collection)
+            .where("state", "==", JobState.PENDING)
+            .where("available_at", "<=", now)
+            .order_by("available_at")
+            .limit(self.scan_size)
+        )
+        candidates = [doc.reference async for doc in query.stream()]
+        # Spread concurrent workers across candidates to reduce transaction contention.
+        random.shuffle(candidates)
+        claim_job = firestore.async_transactional(_claim_job)
+        for ref in candidates:
+            job = await claim_job(gcp.db.transaction(), ref, lease_seconds)
+            if job is not None:
+                return job
+        return None
+
+    async def _update(self, job: Job, changes: Dict[str, Any]):
+        """Writes to a job this worker still holds; raises LeaseLost otherwise."""
+        from google.cloud import firestore
+
+        update = firestore.async_transactional(_update_leased_job)
+        if not await update(gcp.db.transaction(), self._ref(job.id), job.lease_id, changes):
+            raise LeaseLost(job.id)
+
+    async def extend(self, job: Job, lease_seconds: float):
+        await self._update(job, {"available_at": datetime.utcnow() + timedelta(seconds=lease_seconds)})
+
+    @resilience.guarded("firestore", "checkpoint_job")
+    async def checkpoint(self, job: Job, stage: str, result: Any):
+        await self._update(job, {f"checkpoints.{stage}": result, "updated_at": datetime.utcnow()})
+        job.checkpoints[stage] = result
+
+    async def complete(self, job: Job):
+        await self._update(job, {"state": JobState.DONE, "updated_at": datetime.utcnow()})
+
+    async def retry(self, job: Job, error: str, delay: float):
+        now = datetime.utcnow()
+        await self._update(job, {
+            "last_error": error,
+            "lease_id": None,
+            "available_at": now + timedelta(seconds=delay),
+            "updated_at": now,
+        })
+
+    async def fail(self, job: Job, error: str):
+        await self._update(job, {
+            "state": JobState.FAILED,
+            "last_error": error,
+            "updated_at": datetime.utcnow(),
+        })
+
+
+class StageLimiter:
+    """Independent concurrency caps per pipeline stage, shared by every worker."""
+
+    def __init__(self, limits: Dict[str, int]):
+        self._semaphores = {stage: asyncio.Semaphore(limit) for stage, limit in limits.items()}
+
+    @asynccontextmanager
+    async def slot(self, stage: str):
+        semaphore = self._semaphores.get(stage)
+        if semaphore is None:
+            yield
+            return
+        async with semaphore:
+            yield
+
+
+async def run_stage(backend: JobBackend, job: Job, stage: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Runs a stage at most once per job: a checkpointed result is returned as-is,
+    otherwise `fn` runs and its (JSON-serializable) result is checkpointed.
+    """
+    if stage in job.checkpoints:
+        return job.checkpoints[stage]
+    result = await fn()
+    await backend.checkpoint(job, stage, result)
+    return result
+
+
+JobHandler = Callable[[Job], Awaitable[None]]
+FailureHandler = Callable[[Job, Exception], Awaitable[None]]
+
+
+class WorkerPool:
+    """
+    Fixed-size pool of workers that lease jobs, keep their leases alive while
+    running, and retry failures with exponential backoff until `max_attempts`.
+    Exceptions listed in `permanent_errors` fail the job on the first attempt.
+    A worker that cannot record a job's outcome leaves its lease to expire, so
+    the job runs again, and moves on to the next job.
+    """
+
+    def __init__(
+        self,
+        backend: JobBackend,
+        handler: JobHandler,
+        on_failure: FailureHandler,
+        workers: int,
+        lease_seconds: float,
+        poll_interval: float,
+        permanent_errors: Tuple[Type[Exception], ...] = (),
+    ):
+        self.backend = backend
+        self.handler = handler
+        self.on_failure = on_failure
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.permanent_errors = permanent_errors
+        self.active = 0
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    async def enqueue(self, job: Job):
+        await self.backend.enqueue(job)
+        self._wakeup.set()
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                await self._work_once(index)
+            except LeaseLost as e:
+                log.warning(f"Worker {index} abandoned a job: {e}")
+            except Exception as e:
+                log.error(f"Worker {index} could not record a job's outcome; it runs again once its lease expires: {e}")
+
+    async def _work_once(self, index: int):
+        try:
+            job = await self.backend.lease(self.lease_seconds)
+        except Exception as e:
+            log.warning(f"Worker {index} failed to lease a job: {e}")
+            job = None
+
+        if job is None:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        await self._run(job)
+
+    async def _run(self, job: Job):
+        self.active += 1
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            await self.handler(job)
+            await self.backend.complete(job)
+        except LeaseLost:
+            # Another worker holds the job now; its outcome is that worker's to record.
+            raise
+        except Exception as e:
+            await self._handle_error(job, e)
+        finally:
+            heartbeat.cancel()
+            self.active -= 1
+
+    async def _heartbeat(self, job: Job):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self.backend.extend(job, self.lease_seconds)
+            except LeaseLost as e:
+                log.warning(str(e))
+                return
+            except Exception as e:
+                log.warning(f"Failed to extend lease for job {job.id}: {e}")
+
+    async def _handle_error(self, job: Job, error: Exception):
+        message = str(error)
+        if isinstance(error, self.permanent_errors) or job.attempts >= job.max_attempts:
+            log.error(f"Job {job.id} failed permanently after {job.attempts} attempt(s): {message}")
+            await self.backend.fail(job, message)
+            await self.on_failure(job, error)
+            return
+
+        delay = min(2 ** job.attempts, 60) * (0.5 + random.random())
+        log.warning(f"Job {job.id} attempt {job.attempts} failed, retrying in {delay:.1f}s: {message}")
+        await self.backend.retry(job, message, delay)
+
+
+def build_job_backend() -> JobBackend:
+    """Creates the backend configured by JOB_BACKEND."""
+    if settings.JOB_BACKEND == "firestore":
+        return FirestoreJobBackend(settings.FIRESTORE_JOBS_COLLECTION)
+    if settings.JOB_BACKEND == "memory":
+        return InMemoryJobBackend()
+    raise ValueError(f"Unknown job backend '{settings.JOB_BACKEND}'. Expected 'firestore' or 'memory'.")
@@ -0,0 +1,631 @@
+import asyncio
+import re
+from dataclasses import replace
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from google.api_core.exceptions import NotFound
+
+from app.core import ai, build_profiles, gcp, generation, jobs, resilience, runtimes, smoke_gate, telemetry
+from app.core.config import settings
+from app.core.events import broker, status_delta
+from app.core.reconciler import reconciler
+from app.models.service import GenerationBatch, ServiceMetadata, ServiceRevision, ServiceStatus, SmokeTestReport
+
+GENERATION_JOB = "generate_service"
+BATCH_JOB = "generate_batch"
+REVISION_JOB = "build_revision"
+
+log = telemetry.get_logger("pipeline")
+
+stage_limiter = jobs.StageLimiter({
+    "ai": settings.STAGE_CONCURRENCY_AI,
+    "package": settings.STAGE_CONCURRENCY_PACKAGE,
+    "upload": settings.STAGE_CONCURRENCY_UPLOAD,
+    "build": settings.STAGE_CONCURRENCY_BUILD,
+    "smoke": settings.STAGE_CONCURRENCY_SMOKE,
+})
+
+
+def sanitize_service_name(name: str) -> str:
+    name = name.lower()
+    name = re.sub(r'[^a-z0-9-]', '-', name)
+    name = name.strip('-')
+    return name[:50]
+
+
+def gcp_config() -> dict:
+    return {
+        "project_id": settings.GCP_PROJECT_ID,
+        "region": settings.GCP_REGION,
+        "repository": "api-architect-repo"
+    }
+
+
+@resilience.guarded("firestore", "get_service")
+async def load_metadata(service_id: str) -> Optional[ServiceMetadata]:
+    doc = await gcp.db.collection(settings.FIRESTORE_SERVICES_COLLECTION).document(service_id).get()
+    return ServiceMetadata(**doc.to_dict()) if doc.exists else None
+
+
+def build_context(service_name: str, profile: build_profiles.BuildProfile, runtime: runtimes.RuntimeTarget) -> dict:
+    """What the templates know about the build: profile, base image and the Cloud Build config."""
+    image = build_profiles.image_name_for(service_name)
+    return {
+        "profile": profile.name,
+        "base_image": profile.base_image,
+        "config": build_profiles.build_config(profile, image, service_name, runtime),
+    }
+
+
+def package_service(
+    spec: dict,
+    service_name: str,
+    profile: build_profiles.BuildProfile,
+    runtime: runtimes.RuntimeTarget,
+) -> generation.SourceArchive:
+    """Renders and zips the service source together with the build config it will be built with."""
+    build = build_context(service_name, profile, runtime)
+    return generation.generate_service(spec, gcp_config(), build, runtime)
+
+
+async def store_source(
+    metadata: ServiceMetadata, archive: generation.SourceArchive, runtime: runtimes.RuntimeTarget, fields: dict
+) -> dict:
+    """
+    Uploads a packaged source, unless the dedup index already has an identical
+    one (or an image built from it). A new source is smoke-tested first and is
+    never uploaded if it fails. Returns the `source` checkpoint.
+    """
+    log.info(
+        f"Packaged {archive.filename}",
+        extra={"fields": {**fields, "size_bytes": archive.size, "source_hash": archive.content_hash}},
+    )
+    source = {"source_hash": archive.content_hash}
+    artifact = None
+    if settings.ARTIFACT_DEDUP_ENABLED:
+        artifact = await gcp.get_artifact(archive.content_hash)
+
+    if artifact and artifact.get("image"):
+        log.info(f"Source already built; reusing {artifact['image']}", extra={"fields": fields})
+        source.update(source_blob=artifact["source_blob"], image=artifact["image"], smoke_test=artifact.get("smoke_test"))
+    elif artifact and artifact.get("source_blob"):
+        log.info(f"Reusing identical source at {artifact['gcs_uri']}", extra={"fields": fields})
+        source.update(source_blob=artifact["source_blob"], gcs_uri=artifact["gcs_uri"], smoke_test=artifact.get("smoke_test"))
+    else:
+        report = None
+        if settings.SMOKE_TEST_ENABLED:
+            async with telemetry.stage("smoke_test", **fields), stage_limiter.slot("smoke"):
+                report = (await smoke_gate.run_smoke_test(archive, metadata.spec, runtime)).model_dump()
+            log.info(
+                f"Smoke test passed: p50 {report['p50_ms']}ms, p99 {report['p99_ms']}ms",
+                extra={"fields": {**fields, "smoke_test": report}},
+            )
+        blob_name = f"source/{metadata.id}/{archive.filename}"
+        async with telemetry.stage("upload", **fields), stage_limiter.slot("upload"):
+            gcs_uri = await gcp.upload_source_to_gcs(archive.fileobj, blob_name, size=archive.size)
+        if settings.ARTIFACT_DEDUP_ENABLED:
+            await gcp.record_artifact_source(archive.content_hash, blob_name, gcs_uri, smoke_test=report)
+        source.update(source_blob=blob_name, gcs_uri=gcs_uri, smoke_test=report)
+    return source
+
+
+def apply_source(metadata: ServiceMetadata, source: dict):
+    metadata.source_hash = source["source_hash"]
+    metadata.source_blob = source["source_blob"]
+    metadata.image = source.get("image")
+    if source.get("smoke_test"):
+        metadata.smoke_test = SmokeTestReport(**source["smoke_test"])
+
+
+def failure_changes(error: Exception) -> dict:
+    """Fields written when a service fails; a failed smoke test also records its report."""
+    changes = {"status": ServiceStatus.FAILED, "error_message": str(error)}
+    if isinstance(error, smoke_gate.SmokeTestFailed):
+        changes["smoke_test"] = error.report.model_dump()
+    return changes
+
+
+def mark_building(metadata: ServiceMetadata, build_id: str):
+    metadata.build_id = build_id
+    metadata.status = ServiceStatus.BUILDING
+    metadata.build_log_url = f"https://console.cloud.google.com/cloud-build/builds/{build_id}?project={settings.GCP_PROJECT_ID}"
+    metadata.error_message = None
+
+
+async def enqueue_generation(metadata: ServiceMetadata, use_cache: bool = True):
+    """Queues the pipeline for a freshly created PENDING service."""
+    job = jobs.Job(
+        id=metadata.id,
+        kind=GENERATION_JOB,
+        # The request's trace id travels with the job, so worker logs join the request's trace.
+        payload={"service_id": metadata.id, "use_cache": use_cache, "trace_id": telemetry.current_trace_id()},
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+    )
+    await workers.enqueue(job)
+
+
+async def run_generation_pipeline(job: jobs.Job):
+    """
+    Job handler for the full service generation and deployment pipeline.
+    Every stage is checkpointed on the job, so a retried job resumes after
+    the last stage that completed instead of starting over.
+    """
+    with telemetry.trace(job.payload.get("trace_id")):
+        await _run_generation_pipeline(job)
+
+
+async def _run_generation_pipeline(job: jobs.Job):
+    metadata = await load_metadata(job.payload["service_id"])
+    if metadata is None or metadata.status != ServiceStatus.PENDING:
+        # Deleted by the user, or already taken past this pipeline by an earlier attempt.
+        return
+    writer = gcp.MetadataWriter(metadata)
+    use_cache = job.payload.get("use_cache", True)
+    fields = {"service_id": metadata.id, "job_id": job.id, "attempt": job.attempts}
+    log.info("Starting generation pipeline", extra={"fields": fields})
+
+    # 1. Generate the spec from the AI
+    async def generate_spec():
+        async with telemetry.stage("spec", **fields), stage_limiter.slot("ai"):
+            return await ai.generate_spec_from_prompt(metadata.prompt, use_cache=use_cache)
+
+    spec = await jobs.run_stage(workers.backend, job, "spec", generate_spec)
+    metadata.spec = spec
+
+    # Ensure service_name is updated from spec if it changed
+    service_name = sanitize_service_name(spec.get("service_name", metadata.service_name))
+    metadata.service_name = service_name
+    broker.publish(metadata.user_id, status_delta(metadata))
+
+    profile = build_profiles.get_profile()
+    runtime = runtimes.runtime_for(metadata.runtime)
+    metadata.runtime = runtime.name
+
+    # 2-3. Package the service and upload it, unless an identical source already exists
+    async def package_and_upload():
+        async with telemetry.stage("package", **fields), stage_limiter.slot("package"):
+            archive = package_service(spec, service_name, profile, runtime)
+        try:
+            return await store_source(metadata, archive, runtime, fields)
+        finally:
+            archive.close()
+
+    source = await jobs.run_stage(workers.backend, job, "source", package_and_upload)
+    apply_source(metadata, source)
+
+    # 4. Trigger Cloud Build (or a deploy-only job for a known image)
+    async def trigger_build():
+        async with telemetry.stage("build", **fields), stage_limiter.slot("build"):
+            if source.get("image"):
+                return await gcp.trigger_cloud_deploy(source["image"], service_name, runtime)
+            return await gcp.trigger_cloud_build(source["gcs_uri"], service_name, profile, runtime)
+
+    build_id = await jobs.run_stage(workers.backend, job, "build", trigger_build)
+    mark_building(metadata, build_id)
+
+    try:
+        async with telemetry.stage("persist", **fields):
+            await writer.flush()
+    except NotFound:
+        log.warning("Service was deleted while its pipeline ran", extra={"fields": fields})
+        return
+    reconciler.track(metadata)
+    broker.publish(metadata.user_id, status_delta(metadata))
+    log.info(f"Pipeline complete; build {build_id} started", extra={"fields": {**fields, "build_id": build_id}})
+
+
+async def mark_generation_failed(job: jobs.Job, error: Exception):
+    """Called once a job has exhausted its retries (or hit a permanent error)."""
+    with telemetry.trace(job.payload.get("trace_id")):
+        log.error(
+            f"Generation pipeline failed: {error}",
+            extra={"fields": {"service_id": job.payload["service_id"], "job_id": job.id, "attempt": job.attempts}},
+        )
+    metadata = await load_metadata(job.payload["service_id"])
+    if metadata is None:
+        return
+    writer = gcp.MetadataWriter(metadata)
+    metadata.status = ServiceStatus.FAILED
+    metadata.error_message = str(error)
+    if isinstance(error, smoke_gate.SmokeTestFailed):
+        metadata.smoke_test = error.report
+    try:
+        await writer.flush()
+    except NotFound:
+        return
+    broker.publish(metadata.user_id, status_delta(metadata))
+
+
+async def enqueue_batch(batch: GenerationBatch, use_cache: bool = True):
+    """Queues one job that takes every service of a freshly created batch through the pipeline."""
+    job = jobs.Job(
+        id=batch.id,
+        kind=BATCH_JOB,
+        payload={
+            "batch_id": batch.id,
+            "service_ids": batch.service_ids,
+            "combined_build": batch.combined_build,
+            "use_cache": use_cache,
+            "trace_id": telemetry.current_trace_id(),
+        },
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+    )
+    await workers.enqueue(job)
+
+
+async def run_batch_pipeline(job: jobs.Job):
+    """
+    Job handler for a batch of services. Each stage runs for the whole batch at
+    once: specs are generated concurrently (bounded by the AI stage limit), all
+    sources are packaged in one pass and uploaded concurrently, builds are
+    started either per service or as one combined Cloud Build, and the results
+    are written with batched Firestore updates. Per-service results are
+    checkpointed, so a retry only redoes the services that had not finished.
+    """
+    with telemetry.trace(job.payload.get("trace_id")):
+        await _run_batch_pipeline(job)
+
+
+async def _fail_services(services: List[ServiceMetadata], errors: Dict[str, Exception]):
+    updates = {service_id: failure_changes(error) for service_id, error in errors.items()}
+    by_id = {metadata.id: metadata for metadata in services}
+    for service_id in await gcp.update_services_batch(updates):
+        metadata = by_id[service_id]
+        metadata.status = ServiceStatus.FAILED
+        metadata.error_message = str(errors[service_id])
+        broker.publish(metadata.user_id, status_delta(metadata))
+
+
+async def _for_each_service(
+    job: jobs.Job,
+    stage: str,
+    services: List[ServiceMetadata],
+    fn: Callable[[ServiceMetadata], Awaitable[Any]],
+) -> Dict[str, Any]:
+    """
+    Runs `fn` for every service concurrently and checkpoints the results per service.
+    A service whose call raises a permanent error (or any error on the job's last
+    attempt) is marked FAILED and dropped; any other error fails the attempt after
+    the successful results are checkpointed, so the retry skips those services.
+    """
+    done = dict(job.checkpoints.get(stage, {}))
+    pending = [metadata for metadata in services if metadata.id not in done]
+    outcomes = await asyncio.gather(*(fn(metadata) for metadata in pending), return_exceptions=True)
+
+    last_attempt = job.attempts >= job.max_attempts
+    failed: Dict[str, Exception] = {}
+    retry_error: Optional[BaseException] = None
+    for metadata, outcome in zip(pending, outcomes):
+        if not isinstance(outcome, BaseException):
+            done[metadata.id] = outcome
+        elif isinstance(outcome, ValueError) or (last_attempt and isinstance(outcome, Exception)):
+            failed[metadata.id] = outcome
+        else:
+            retry_error = retry_error or outcome
+
+    if pending:
+        await workers.backend.checkpoint(job, stage, done)
+    if failed:
+        await _fail_services(services, failed)
+    if retry_error is not None:
+        raise retry_error
+    return {service_id: result for service_id, result in done.items() if service_id not in failed}
+
+
+def _unique_service_name(name: str, metadata: ServiceMetadata, taken: set) -> str:
+    """Keeps names unique within a batch, so two services never deploy over each other."""
+    if name in taken:
+        name = f"{name[:45]}-{metadata.id[:4]}"
+    taken.add(name)
+    return name
+
+
+async def _run_batch_pipeline(job: jobs.Job):
+    batch_id = job.payload["batch_id"]
+    loaded = await gcp.get_services(job.payload["service_ids"])
+    # Services already failed or deleted by the user, or taken further by an earlier attempt, are skipped.
+    services = [metadata for metadata in loaded.values() if metadata.status == ServiceStatus.PENDING]
+    if not services:
+        return
+    use_cache = job.payload.get("use_cache", True)
+    fields = {"batch_id": batch_id, "job_id": job.id, "attempt": job.attempts}
+    log.info(f"Starting batch pipeline for {len(services)} services", extra={"fields": fields})
+    writers = {metadata.id: gcp.MetadataWriter(metadata) for metadata in services}
+
+    # 1. Generate every spec; the shared AI stage limit bounds how many run at once
+    async def generate_spec(metadata: ServiceMetadata):
+        async with stage_limiter.slot("ai"):
+            return await ai.generate_spec_from_prompt(metadata.prompt, use_cache=use_cache)
+
+    async with telemetry.stage("batch_spec", **fields):
+        specs = await _for_each_service(job, "specs", services, generate_spec)
+    services = [metadata for metadata in services if metadata.id in specs]
+    taken_names: set = set()
+    for metadata in services:
+        metadata.spec = specs[metadata.id]
+        name = sanitize_service_name(metadata.spec.get("service_name", metadata.service_name))
+        metadata.service_name = _unique_service_name(name, metadata, taken_names)
+        broker.publish(metadata.user_id, status_delta(metadata))
+
+    profile = build_profiles.get_profile()
+    service_runtimes = {}
+    for metadata in services:
+        service_runtimes[metadata.id] = runtimes.runtime_for(metadata.runtime)
+        metadata.runtime = service_runtimes[metadata.id].name
+
+    # 2-3. Package all services in one pass, then upload them concurrently
+    stored = job.checkpoints.get("sources", {})
+    archives: Dict[str, Any] = {}
+    async with telemetry.stage("batch_package", **fields), stage_limiter.slot("package"):
+        for metadata in services:
+            if metadata.id in stored:
+                continue
+            try:
+                archives[metadata.id] = package_service(
+                    metadata.spec, metadata.service_name, profile, service_runtimes[metadata.id]
+                )
+            except Exception as e:
+                archives[metadata.id] = e
+
+    async def upload(metadata: ServiceMetadata):
+        archive = archives[metadata.id]
+        if isinstance(archive, Exception):
+            raise archive
+        return await store_source(metadata, archive, service_runtimes[metadata.id], {**fields, "service_id": metadata.id})
+
+    try:
+        async with telemetry.stage("batch_upload", **fields):
+            sources = await _for_each_service(job, "sources", services, upload)
+    finally:
+        for archive in archives.values():
+            if not isinstance(archive, Exception):
+                archive.close()
+    services = [metadata for metadata in services if metadata.id in sources]
+    for metadata in services:
+        apply_source(metadata, sources[metadata.id])
+
+    # 4. Start the builds: one combined Cloud Build with a parallel chain per service, or one build each
+    if job.payload.get("combined_build") and services:
+        targets = [
+            {
+                "service_name": metadata.service_name,
+                "image": sources[metadata.id].get("image") or build_profiles.image_name_for(metadata.service_name),
+                "source_uri": None if sources[metadata.id].get("image") else sources[metadata.id]["gcs_uri"],
+                "runtime": service_runtimes[metadata.id],
+            }
+            for metadata in services
+        ]
+
+        async def trigger_combined_build():
+            async with telemetry.stage("batch_build", **fields), stage_limiter.slot("build"):
+                return await gcp.trigger_combined_build(targets, profile)
+
+        build_id = await jobs.run_stage(workers.backend, job, "build", trigger_combined_build)
+        build_ids = {metadata.id: build_id for metadata in services}
+    else:
+        async def trigger_build(metadata: ServiceMetadata):
+            source = sources[metadata.id]
+            runtime = service_runtimes[metadata.id]
+            async with stage_limiter.slot("build"):
+                if source.get("image"):
+                    return await gcp.trigger_cloud_deploy(source["image"], metadata.service_name, runtime)
+                return await gcp.trigger_cloud_build(source["gcs_uri"], metadata.service_name, profile, runtime)
+
+        async with telemetry.stage("batch_build", **fields):
+            build_ids = await _for_each_service(job, "builds", services, trigger_build)
+    services = [metadata for metadata in services if metadata.id in build_ids]
+
+    # 5. Persist everything with batched writes
+    for metadata in services:
+        mark_building(metadata, build_ids[metadata.id])
+    async with telemetry.stage("batch_persist", **fields):
+        written = await gcp.update_services_batch({metadata.id: writers[metadata.id].changes() for metadata in services})
+    by_id = {metadata.id: metadata for metadata in services}
+    for service_id in written:
+        metadata = by_id[service_id]
+        reconciler.track(metadata)
+        broker.publish(metadata.user_id, status_delta(metadata))
+    log.info(f"Batch pipeline complete; {len(written)} builds started", extra={"fields": fields})
+
+
+async def mark_batch_failed(job: jobs.Job, error: Exception):
+    """Fails the services of a batch that had not made it to BUILDING when the job gave up."""
+    with telemetry.trace(job.payload.get("trace_id")):
+        log.error(
+            f"Batch pipeline failed: {error}",
+            extra={"fields": {"batch_id": job.payload["batch_id"], "job_id": job.id, "attempt": job.attempts}},
+        )
+    services = await gcp.get_services(job.payload["service_ids"])
+    pending = [metadata for metadata in services.values() if metadata.status == ServiceStatus.PENDING]
+    if pending:
+        await _fail_services(pending, {metadata.id: error for metadata in pending})
+
+
+def changed_files(
+    metadata: ServiceMetadata, spec: dict, profile: build_profiles.BuildProfile, runtime: runtimes.RuntimeTarget
+) -> List[str]:
+    """
+    Generated files an edit changes: the stored spec and the edited one are
+    rendered with the same build context and compared file by file.
+    """
+    build = build_context(metadata.service_name, profile, runtime)
+    after = generation.render_service(spec, gcp_config(), build, runtime)
+    try:
+        before = generation.render_service(metadata.spec, gcp_config(), build, runtime)
+    except ValueError:
+        # Stored before specs were validated; everything is new.
+        before = {}
+    return sorted(path for path in before.keys() | after.keys() if before.get(path) != after.get(path))
+
+
+def revision_profile() -> build_profiles.BuildProfile:
+    """Edits always build with a layer cache, seeded from the service's previous image."""
+    return replace(build_profiles.get_profile(), layer_cache=True)
+
+
+async def start_revision(metadata: ServiceMetadata, spec: dict, changes: List[str]):
+    """
+    Records a new revision of an existing service and queues its rebuild. The
+    service keeps its Firestore document and its Cloud Run service; the deploy
+    step rolls that service to a new Cloud Run revision.
+    """
+    writer = gcp.MetadataWriter(metadata)
+    if metadata.revisions:
+        # The newest revision's outcome is known now that it is being superseded.
+        metadata.revisions[-1].status = metadata.status
+        metadata.revisions[-1].image = metadata.image
+    else:
+        # The service as first generated.
+        metadata.revisions.append(ServiceRevision(
+            number=1,
+            spec=metadata.spec,
+            runtime=metadata.runtime,
+            source_hash=metadata.source_hash,
+            build_id=metadata.build_id,
+            status=metadata.status,
+            image=metadata.image,
+            created_at=metadata.created_at,
+        ))
+    number = metadata.revisions[-1].number + 1
+    metadata.revisions.append(ServiceRevision(number=number, spec=spec, runtime=metadata.runtime, changed_files=changes))
+    del metadata.revisions[:-settings.SERVICE_MAX_REVISIONS]
+
+    # Layers come from the image the service runs now: the digest when known, else its tag.
+    cache_from = metadata.image or build_profiles.image_name_for(metadata.service_name)
+    metadata.spec = spec
+    metadata.status = ServiceStatus.PENDING
+    metadata.error_message = None
+    await writer.flush()
+    broker.publish(metadata.user_id, status_delta(metadata))
+
+    job = jobs.Job(
+        id=f"{metadata.id}-r{number}",
+        kind=REVISION_JOB,
+        payload={
+            "service_id": metadata.id,
+            "revision": number,
+            "cache_from": cache_from,
+            "trace_id": telemetry.current_trace_id(),
+        },
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+    )
+    await workers.enqueue(job)
+
+
+async def _load_revision(job: jobs.Job) -> Optional[ServiceMetadata]:
+    """The service if this job's revision is still the newest and waiting to be built."""
+    metadata = await load_metadata(job.payload["service_id"])
+    if metadata is None or metadata.status != ServiceStatus.PENDING:
+        return None
+    if not metadata.revisions or metadata.revisions[-1].number != job.payload["revision"]:
+        # Superseded by a newer edit.
+        return None
+    return metadata
+
+
+async def run_revision_pipeline(job: jobs.Job):
+    """
+    Job handler for an edited service: packages the stored spec, then builds it
+    with the previous image as layer cache (or redeploys an identical build).
+    There is no AI stage; stages are checkpointed like the generation pipeline's.
+    """
+    with telemetry.trace(job.payload.get("trace_id")):
+        await _run_revision_pipeline(job)
+
+
+async def _run_revision_pipeline(job: jobs.Job):
+    metadata = await _load_revision(job)
+    if metadata is None:
+        return
+    writer = gcp.MetadataWriter(metadata)
+    revision = metadata.revisions[-1]
+    service_name = metadata.service_name
+    cache_from = job.payload.get("cache_from")
+    fields = {"service_id": metadata.id, "job_id": job.id, "attempt": job.attempts, "revision": revision.number}
+    log.info("Starting revision pipeline", extra={"fields": fields})
+
+    profile = revision_profile()
+    runtime = runtimes.runtime_for(metadata.runtime)
+
+    async def package_and_upload():
+        async with telemetry.stage("package", **fields), stage_limiter.slot("package"):
+            archive = package_service(metadata.spec, service_name, profile, runtime)
+        try:
+            return await store_source(metadata, archive, runtime, fields)
+        finally:
+            archive.close()
+
+    source = await jobs.run_stage(workers.backend, job, "source", package_and_upload)
+    apply_source(metadata, source)
+
+    async def trigger_build():
+        async with telemetry.stage("build", **fields), stage_limiter.slot("build"):
+            if source.get("image"):
+                return await gcp.trigger_cloud_deploy(source["image"], service_name, runtime)
+            return await gcp.trigger_cloud_build(source["gcs_uri"], service_name, profile, runtime, cache_from)
+
+    build_id = await jobs.run_stage(workers.backend, job, "build", trigger_build)
+    mark_building(metadata, build_id)
+    revision.source_hash = metadata.source_hash
+    revision.build_id = build_id
+
+    try:
+        async with telemetry.stage("persist", **fields):
+            await writer.flush()
+    except NotFound:
+        log.warning("Service was deleted while its revision was built", extra={"fields": fields})
+        return
+    reconciler.track(metadata)
+    broker.publish(metadata.user_id, status_delta(metadata))
+    log.info(f"Revision {revision.number} build {build_id} started", extra={"fields": {**fields, "build_id": build_id}})
+
+
+async def mark_revision_failed(job: jobs.Job, error: Exception):
+    """Fails the service if the revision this job was building is still its newest."""
+    with telemetry.trace(job.payload.get("trace_id")):
+        log.error(
+            f"Revision pipeline failed: {error}",
+            extra={"fields": {"service_id": job.payload["service_id"], "job_id": job.id, "attempt": job.attempts}},
+        )
+    metadata = await _load_revision(job)
+    if metadata is None:
+        return
+    writer = gcp.MetadataWriter(metadata)
+    metadata.status = ServiceStatus.FAILED
+    metadata.error_message = str(error)
+    if isinstance(error, smoke_gate.SmokeTestFailed):
+        metadata.smoke_test = error.report
+    try:
+        await writer.flush()
+    except NotFound:
+        return
+    broker.publish(metadata.user_id, status_delta(metadata))
+
+
+_HANDLERS = {
+    GENERATION_JOB: (run_generation_pipeline, mark_generation_failed),
+    BATCH_JOB: (run_batch_pipeline, mark_batch_failed),
+    REVISION_JOB: (run_revision_pipeline, mark_revision_failed),
+}
+
+
+async def run_job(job: jobs.Job):
+    handler, _ = _HANDLERS[job.kind]
+    await handler(job)
+
+
+async def fail_job(job: jobs.Job, error: Exception):
+    _, on_failure = _HANDLERS[job.kind]
+    await on_failure(job, error)
+
+
+workers = jobs.WorkerPool(
+    jobs.build_job_backend(),
+    handler=run_job,
+    on_failure=fail_job,
+    workers=settings.JOB_WORKERS,
+    lease_seconds=settings.JOB_LEASE_SECONDS,
+    poll_interval=settings.JOB_POLL_SECONDS,
+    # Spec validation errors will not fix themselves on retry.
+    permanent_errors=(ValueError,),
+)
@@ -0,0 +1,256 @@
+import asyncio
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from google.api_core.exceptions import NotFound
+
+from app.core import build_profiles, gcp, resilience, telemetry
+from app.core.config import settings
+from app.core.events import broker
+from app.models.service import ServiceMetadata, ServiceStatus
+from app.state import clients
+
+if TYPE_CHECKING:
+    from google.cloud.devtools.cloudbuild_v1.types import Build
+
+# Build.Status names; statuses are compared by name so the Cloud Build types load with the client.
+SUCCESS = "SUCCESS"
+TERMINAL_FAILURES = ("FAILURE", "INTERNAL_ERROR", "TIMEOUT", "CANCELLED", "EXPIRED")
+
+log = telemetry.get_logger("reconciler")
+
+
+class BuildReconciler:
+    """
+    Single owner of every in-flight Cloud Build.
+
+    The pipeline registers builds with `track`, a background loop polls the
+    tracked builds, and the Cloud Build Pub/Sub webhook pushes updates as they
+    happen. Whichever path sees a terminal status first writes it to Firestore;
+    the build is then forgotten, so each transition is written exactly once and
+    `GET /services` never has to talk to Cloud Build. A combined batch build
+    deploys several services, so builds map to every service they deploy.
+    """
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        # build id -> {service id -> metadata}
+        self._in_flight: Dict[str, Dict[str, ServiceMetadata]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def track(self, metadata: ServiceMetadata):
+        if metadata.build_id:
+            self._in_flight.setdefault(metadata.build_id, {})[metadata.id] = metadata
+
+    def forget(self, metadata: ServiceMetadata):
+        """Stops tracking a (deleted) service; its build is dropped once no service waits on it."""
+        services = self._in_flight.get(metadata.build_id) if metadata.build_id else None
+        if services is None:
+            return
+        services.pop(metadata.id, None)
+        if not services:
+            self._in_flight.pop(metadata.build_id, None)
+
+    async def start(self):
+        """Re-adopts builds left BUILDING by a previous instance, then starts polling."""
+        try:
+            await self._load_in_flight()
+        except Exception as e:
+            log.error(f"Failed to load in-flight builds: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _load_in_flight(self):
+        query = gcp.db.collection(settings.FIRESTORE_SERVICES_COLLECTION).where("status", "==", ServiceStatus.BUILDING)
+        async for doc in query.stream():
+            self.track(ServiceMetadata(**doc.to_dict()))
+        log.info(f"Tracking {self.in_flight} in-flight builds")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll_once()
+            except Exception as e:
+                log.error(f"Poll failed: {e}")
+
+    async def poll_once(self):
+        """Resolves every tracked build with O(1) upstream calls, regardless of how many are in flight."""
+        if not self._in_flight:
+            return
+        builds = await gcp.get_builds(list(self._in_flight))
+
+        service_urls = None
+        if any(build.status.name == SUCCESS for build in builds.values()):
+            try:
+                service_urls = await gcp.get_service_urls(settings.GCP_REGION)
+            except Exception as e:
+                log.warning(f"Could not list Cloud Run services: {e}")
+
+        updates = {}
+        for build in builds.values():
+            for service, changes in await self._resolve(build, service_urls):
+                updates[service.id] = (service, changes)
+        if updates:
+            await self._write(updates)
+
+    async def handle_notification(self, build_id: str, build_status: str):
+        """Applies a status pushed by Cloud Build; unknown or non-terminal updates are ignored."""
+        if build_status != SUCCESS and build_status not in TERMINAL_FAILURES:
+            return
+
+        if build_id not in self._in_flight:
+            # The build may have been started by another instance.
+            services = await self._find_building_services(build_id)
+            if not services:
+                return
+            for metadata in services:
+                self.track(metadata)
+
+        build = await resilience.call(
+            "cloud_build", "get_build",
+            lambda: clients["build_client"].get_build(project_id=settings.GCP_PROJECT_ID, id=build_id),
+        )
+        await self.apply_build(build)
+
+    async def _find_building_services(self, build_id: str) -> List[ServiceMetadata]:
+        query = (
+            gcp.db.collection(settings.FIRESTORE_SERVICES_COLLECTION)
+            .where("build_id", "==", build_id)
+            .where("status", "==", ServiceStatus.BUILDING)
+        )
+        return [ServiceMetadata(**doc.to_dict()) async for doc in query.stream()]
+
+    async def apply_build(self, build: "Build", service_urls: Optional[Dict[str, str]] = None):
+        """Writes a terminal build status to the tracked services; running builds are left alone."""
+        resolved = await self._resolve(build, service_urls)
+        if not resolved:
+            return
+        if len(resolved) == 1:
+            service, changes = resolved[0]
+            try:
+                # update() rather than set() so a service deleted mid-build is not recreated.
+                await gcp.update_service_fields(service.id, changes)
+            except NotFound:
+                return
+            except Exception:
+                self.track(service)
+                raise
+            self._announce(service, changes)
+            return
+
+        await self._write({service.id: (service, changes) for service, changes in resolved})
+
+    async def _write(self, updates: Dict[str, Tuple[ServiceMetadata, dict]]):
+        """
+        Writes resolved transitions. `_resolve` has already claimed their builds, so
+        if the write fails the services are tracked again and the next poll retries.
+        """
+        try:
+            written = await gcp.update_services_batch({service_id: changes for service_id, (_, changes) in updates.items()})
+        except Exception:
+            for service, _ in updates.values():
+                self.track(service)
+            raise
+        for service_id in written:
+            self._announce(*updates[service_id])
+
+    async def _resolve(
+        self, build: "Build", service_urls: Optional[Dict[str, str]]
+    ) -> List[Tuple[ServiceMetadata, dict]]:
+        """
+        Claims a finished build and returns its services with the fields to change.
+        The caller must write the changes, or track the services again if it cannot.
+        `service_urls` is a prefetched name -> URL map; without it the URLs are looked up directly.
+        """
+        if build.status.name != SUCCESS and build.status.name not in TERMINAL_FAILURES:
+            return []
+
+        services = self._in_flight.pop(build.id, None)
+        if not services:
+            # Another path already handled this transition.
+            return []
+
+        if build.status.name == SUCCESS:
+            deployed, failed = list(services.values()), []
+        else:
+            # The chains of a combined build run in parallel, so some services may be live anyway.
+            steps = {step.id: step for step in build.steps}
+            deployed, failed = [], []
+            for service in services.values():
+                deploy = steps.get(f"{service.service_name}-deploy")
+                (deployed if deploy is not None and deploy.status.name == SUCCESS else failed).append(service)
+
+        if service_urls is None and len(deployed) > 1:
+            try:
+                service_urls = await gcp.get_service_urls(settings.GCP_REGION)
+            except Exception as e:
+                log.warning(f"Could not list Cloud Run services: {e}")
+        resolved = [(service, await self._deployed_changes(build, service, service_urls)) for service in deployed]
+        resolved += [(service, _failed_changes(build, service)) for service in failed]
+        return resolved
+
+    async def _deployed_changes(
+        self, build: "Build", service: ServiceMetadata, service_urls: Optional[Dict[str, str]]
+    ) -> dict:
+        changes = {"status": ServiceStatus.DEPLOYED}
+        image = gcp.built_image_ref(build, build_profiles.image_name_for(service.service_name))
+        if image:
+            changes["image"] = image
+            if service.source_hash and settings.ARTIFACT_DEDUP_ENABLED:
+                try:
+                    await gcp.record_artifact_image(service.source_hash, image)
+                except Exception as e:
+                    log.warning(f"Could not record image for {service.source_hash[:12]}: {e}")
+        try:
+            if service_urls is not None and service.service_name in service_urls:
+                changes["deployed_url"] = service_urls[service.service_name]
+            else:
+                run_client = clients["run_client"]
+                service_path = run_client.service_path(settings.GCP_PROJECT_ID, settings.GCP_REGION, service.service_name)
+                run_service = await resilience.call(
+                    "cloud_run", "get_service", lambda: run_client.get_service(name=service_path)
+                )
+                changes["deployed_url"] = run_service.uri
+        except Exception as e:
+            log.warning(f"Could not resolve Cloud Run URL for {service.service_name}: {e}")
+        return changes
+
+    def _announce(self, service: ServiceMetadata, changes: dict):
+        broker.publish(service.user_id, {"id": service.id, **changes, "updated_at": datetime.utcnow()})
+        log.info(
+            f"Service {service.id} is now {changes['status']}",
+            extra={"fields": {"service_id": service.id, "status": changes["status"]}},
+        )
+
+
+def _failed_changes(build: "Build", service: ServiceMetadata) -> dict:
+    """FAILED, naming the step of the service's own chain that failed when the build has one."""
+    message = f"Cloud Build finished with status {build.status.name}."
+    steps = {step.id: step for step in build.steps}
+    step = steps.get(f"{service.service_name}-deploy")
+    chain = []
+    # Walk the chain back from its deploy step; each step waits for the one before it.
+    while step is not None:
+        chain.insert(0, step)
+        step = steps.get(step.wait_for[0]) if step.wait_for else None
+    for step in chain:
+        if step.status.name in TERMINAL_FAILURES:
+            message = f"Cloud Build step {step.id} finished with status {step.status.name}."
+            break
+    return {"status": ServiceStatus.FAILED, "error_message": message}
+
+
+reconciler = BuildReconciler(settings.RECONCILER_POLL_SECONDS)
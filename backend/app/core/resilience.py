@@ -0,0 +1,319 @@
+"""
+Retries, deadlines, hedging and circuit breakers for upstream calls.
+
+Every upstream (Firestore, Cloud Build, Cloud Run, the AI provider) gets a
+`Policy` and its own breaker, retry budget and latency window. A call
+through `Upstream.call`:
+
+- fails fast with CircuitOpen while the upstream's breaker is open. The
+  breaker opens after BREAKER_FAILURE_THRESHOLD consecutive transient
+  failures and lets a single probe through after BREAKER_RESET_SECONDS.
+- is retried after transient errors (unavailable, rate limited, timed out,
+  ...) with full-jitter exponential backoff, up to the policy's attempts
+  and within its total deadline. Each upstream's retry budget caps retries
+  at RETRY_BUDGET_RATIO of its calls, so an outage does not multiply the
+  load on it. Calls that are not idempotent (creating a build) are only
+  retried when the upstream rejected them outright.
+- with hedging (the AI provider), sends one duplicate request once the
+  first has run longer than the recent p95 latency; the first answer wins
+  and the other is cancelled.
+
+Errors that are not transient (NotFound, invalid arguments, ValueError)
+are raised at once and count as a healthy response for the breaker.
+Every attempt is timed as an upstream call; retries, hedges and breaker
+rejections are counted and breaker states are exported by main.py.
+"""
+import asyncio
+import functools
+import math
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from google.api_core import exceptions as api_exceptions
+
+from app.core import telemetry
+from app.core.config import settings
+
+T = TypeVar("T")
+
+log = telemetry.get_logger("resilience")
+
+# The upstream refused the request, so it was not processed and is always safe to resend.
+REJECTED_ERRORS = (api_exceptions.ServiceUnavailable, api_exceptions.TooManyRequests, api_exceptions.ResourceExhausted)
+TRANSIENT_ERRORS = REJECTED_ERRORS + (
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.DeadlineExceeded,
+    api_exceptions.Aborted,
+    asyncio.TimeoutError,
+    TimeoutError,
+    ConnectionError,
+)
+
+# Latency samples kept per upstream, and how many are needed before hedging starts.
+LATENCY_WINDOW = 200
+MIN_HEDGE_SAMPLES = 20
+HEDGE_QUANTILE = 0.95
+# Retries the budget can bank while traffic is low.
+RETRY_BUDGET_CAP = 10.0
+
+
+class CircuitOpen(Exception):
+    """The upstream is failing; `retry_after` is the number of seconds until the breaker lets a probe through."""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} is unavailable (circuit open); retry in {math.ceil(retry_after)}s.")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class Policy:
+    # Total time for a call, including every attempt, hedge and backoff.
+    deadline: float
+    # Time allowed for a single attempt.
+    attempt_timeout: float
+    max_attempts: int = 3
+    base_delay: float = 0.2
+    max_delay: float = 5.0
+    hedge: bool = False
+    # Lower bound for the hedge delay, whatever the recent p95.
+    hedge_min_delay: float = 0.0
+
+
+def policies() -> Dict[str, Policy]:
+    ai = Policy(
+        deadline=settings.AI_DEADLINE_SECONDS,
+        attempt_timeout=settings.AI_TIMEOUT_SECONDS,
+        max_attempts=3,
+        base_delay=1.0,
+        max_delay=8.0,
+        hedge=settings.AI_HEDGE_ENABLED,
+        hedge_min_delay=settings.AI_HEDGE_MIN_DELAY_SECONDS,
+    )
+    return {
+        "gemini": ai,
+        "fake": ai,
+        "firestore": Policy(deadline=30.0, attempt_timeout=10.0, max_attempts=4, base_delay=0.1, max_delay=2.0),
+        "cloud_build": Policy(deadline=60.0, attempt_timeout=30.0, max_attempts=3, base_delay=0.5, max_delay=5.0),
+        "cloud_run": Policy(deadline=30.0, attempt_timeout=15.0, max_attempts=3, base_delay=0.25, max_delay=2.0),
+    }
+
+
+DEFAULT_POLICY = Policy(deadline=30.0, attempt_timeout=15.0)
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, upstream: str, failure_threshold: int, reset_seconds: float):
+        self.upstream = upstream
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        # When the half-open probe was let through; a probe that never reports back is replaced after reset_seconds.
+        self._probe_started: Optional[float] = None
+
+    def before_call(self):
+        """Raises CircuitOpen unless the call may go ahead."""
+        if self.state == self.CLOSED:
+            return
+        now = time.monotonic()
+        remaining = self._opened_at + self.reset_seconds - now
+        if self.state == self.OPEN and remaining <= 0:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe_started is None or now - self._probe_started >= self.reset_seconds:
+                self._probe_started = now
+                return
+            remaining = self._probe_started + self.reset_seconds - now
+        raise CircuitOpen(self.upstream, max(remaining, 1.0))
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            log.info("Circuit closed", extra={"fields": {"upstream": self.upstream}})
+        self._failures = 0
+        self._probe_started = None
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                log.warning(
+                    f"Circuit opened after {self._failures} consecutive failures",
+                    extra={"fields": {"upstream": self.upstream}},
+                )
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_started = None
+
+
+class RetryBudget:
+    """Each call deposits `ratio` of a retry and each retry withdraws a whole one."""
+
+    def __init__(self, ratio: float, cap: float = RETRY_BUDGET_CAP):
+        self.ratio = ratio
+        self.cap = cap
+        self._balance = cap
+
+    def deposit(self):
+        self._balance = min(self.cap, self._balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self._balance < 1:
+            return False
+        self._balance -= 1
+        return True
+
+
+class LatencyWindow:
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self._samples) < MIN_HEDGE_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Upstream:
+
+    def __init__(self, name: str, policy: Policy):
+        self.name = name
+        self.policy = policy
+        self.breaker = CircuitBreaker(name, settings.BREAKER_FAILURE_THRESHOLD, settings.BREAKER_RESET_SECONDS)
+        self.budget = RetryBudget(settings.RETRY_BUDGET_RATIO)
+        self.latencies = LatencyWindow()
+
+    async def call(self, operation: str, fn: Callable[[], Awaitable[T]], idempotent: bool = True) -> T:
+        """Runs `fn` (called again for every attempt or hedge) under this upstream's policy."""
+        try:
+            self.breaker.before_call()
+        except CircuitOpen:
+            telemetry.CIRCUIT_REJECTIONS.labels(self.name).inc()
+            raise
+        self.budget.deposit()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.policy.deadline
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = min(self.policy.attempt_timeout, deadline - loop.time())
+            try:
+                result = await self._attempt(operation, fn, timeout)
+            except TRANSIENT_ERRORS as e:
+                self.breaker.record_failure()
+                retryable = idempotent or isinstance(e, REJECTED_ERRORS)
+                delay = random.uniform(0, min(self.policy.max_delay, self.policy.base_delay * 2 ** (attempt - 1)))
+                if (
+                    not retryable
+                    or self.breaker.state == CircuitBreaker.OPEN
+                    or attempt >= self.policy.max_attempts
+                    or loop.time() + delay >= deadline
+                    or not self.budget.withdraw()
+                ):
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise TimeoutError(f"{self.name} {operation} did not complete within {self.policy.deadline:g} seconds.")
+                    raise
+                telemetry.UPSTREAM_RETRIES.labels(self.name, operation, type(e).__name__).inc()
+                await asyncio.sleep(delay)
+                continue
+            except Exception:
+                # The upstream answered; the request itself was at fault.
+                self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def _timed(self, operation: str, fn: Callable[[], Awaitable[T]]) -> T:
+        started = time.perf_counter()
+        async with telemetry.upstream_call(self.name, operation):
+            result = await fn()
+        self.latencies.add(time.perf_counter() - started)
+        return result
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.policy.hedge:
+            return None
+        p95 = self.latencies.quantile(HEDGE_QUANTILE)
+        return None if p95 is None else max(p95, self.policy.hedge_min_delay)
+
+    async def _attempt(self, operation: str, fn: Callable[[], Awaitable[T]], timeout: float) -> T:
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is None or hedge_delay >= timeout:
+            return await asyncio.wait_for(self._timed(operation, fn), timeout)
+
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + timeout
+        primary = asyncio.ensure_future(self._timed(operation, fn))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+            if done:
+                return primary.result()
+            telemetry.UPSTREAM_HEDGES.labels(self.name, operation, "sent").inc()
+            hedge = asyncio.ensure_future(self._timed(operation, fn))
+            pending.add(hedge)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=give_up_at - loop.time(), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            telemetry.UPSTREAM_HEDGES.labels(self.name, operation, "won").inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+_upstreams: Dict[str, Upstream] = {}
+
+
+def upstream(name: str) -> Upstream:
+    if name not in _upstreams:
+        _upstreams[name] = Upstream(name, policies().get(name, DEFAULT_POLICY))
+    return _upstreams[name]
+
+
+async def call(upstream_name: str, operation: str, fn: Callable[[], Awaitable[T]], idempotent: bool = True) -> T:
+    return await upstream(upstream_name).call(operation, fn, idempotent=idempotent)
+
+
+def guarded(upstream_name: str, operation: str, idempotent: bool = True):
+    """
+    Decorator form of `call` for coroutine functions, in place of
+    `telemetry.instrumented`: each attempt is still timed as an upstream call.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await call(upstream_name, operation, lambda: fn(*args, **kwargs), idempotent=idempotent)
+        return wrapper
+    return decorator
+
+
+def breaker_states() -> Dict[str, float]:
+    """Upstream -> 0 (closed), 1 (half open) or 2 (open), for the metrics endpoint."""
+    codes = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+    return {name: codes[upstream.breaker.state] for name, upstream in _upstreams.items()}
@@ -0,0 +1,63 @@
+"""
+Runtime targets for generated services.
+
+A runtime target picks the template set a service is rendered from and how
+the server inside its container is sized. The same numbers become the Cloud
+Run deploy flags, so Cloud Run never routes more concurrent requests to an
+instance than its server can work on at once.
+
+- "asgi": FastAPI on uvicorn with orjson responses, one event loop per vCPU.
+- "flask": Flask on gunicorn gthread workers, one process per vCPU with a
+  thread per request it may hold.
+"""
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.core.config import settings
+
+RUNTIMES = ("asgi", "flask")
+
+# gthread threads per worker.
+FLASK_THREADS = 8
+
+
+@dataclass(frozen=True)
+class RuntimeTarget:
+    name: str
+    # Directory under templates/ the service is rendered from.
+    template_set: str
+    cpu: int
+    memory: str
+    # Server processes inside the container.
+    workers: int
+    # Threads per worker (gthread only; 1 for the event loop runtime).
+    threads: int
+    # Cloud Run max concurrent requests per instance.
+    concurrency: int
+
+    def deploy_flags(self) -> List[str]:
+        return [
+            "--cpu", str(self.cpu),
+            "--memory", self.memory,
+            "--concurrency", str(self.concurrency),
+        ]
+
+
+def runtime_for(name: Optional[str]) -> RuntimeTarget:
+    """Sizes the named runtime (RUNTIME_TARGET by default) for the instance shape."""
+    name = name or settings.RUNTIME_TARGET
+    if name not in RUNTIMES:
+        raise ValueError(f"Unknown runtime '{name}'. Expected one of: {', '.join(RUNTIMES)}.")
+    cpu = settings.RUNTIME_CPU
+    memory = settings.RUNTIME_MEMORY
+
+    if name == "asgi":
+        return RuntimeTarget(
+            "asgi", "asgi_template", cpu, memory,
+            workers=cpu, threads=1, concurrency=settings.RUNTIME_ASGI_CONCURRENCY,
+        )
+
+    return RuntimeTarget(
+        "flask", "flask_template", cpu, memory,
+        workers=cpu, threads=FLASK_THREADS, concurrency=cpu * FLASK_THREADS,
+    )
@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Tuple
+
+from google.auth import impersonated_credentials
+from google.auth.transport.requests import Request
+
+from app.core import gcp, telemetry
+from app.core.concurrency import SingleFlight
+from app.core.config import settings
+
+# Signing can mean a credential refresh plus a remote IAM signBlob call; keep it
+# in its own bounded pool so it never queues behind uploads on the default executor.
+_sign_executor = ThreadPoolExecutor(max_workers=settings.SIGNING_WORKERS, thread_name_prefix="url-signer")
+
+
+class UrlSigner:
+    """
+    Issues V4 signed download URLs for objects in the source bucket.
+
+    Issued URLs are cached per blob and served until less than `refresh_margin`
+    of their lifetime remains, so every link handed out is still valid for at
+    least that long. The signing credentials (impersonated ones on the IAM
+    path) are built once and reused until `refresh_margin` before they expire.
+    """
+
+    def __init__(self, ttl: int, refresh_margin: int, max_entries: int, credentials_lifetime: int):
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self.credentials_lifetime = credentials_lifetime
+        self.hits = 0
+        self.misses = 0
+        self._urls: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._flights = SingleFlight()
+        # Credentials are resolved on signer threads, so guard them with a thread lock.
+        self._credentials_lock = threading.Lock()
+        self._credentials = None
+        self._credentials_expire_at = 0.0
+
+    async def signed_url(self, blob_name: str, verify_exists: bool = True) -> str:
+        """
+        Returns a signed URL for `blob_name`. Pass `verify_exists=False` when the
+        blob is already known to exist (e.g. recorded in service metadata) to
+        skip the GCS existence check; otherwise a missing blob raises FileNotFoundError.
+        """
+        cached = self._urls.get(blob_name)
+        if cached is not None and cached[1] - time.monotonic() > self.refresh_margin:
+            self._urls.move_to_end(blob_name)
+            self.hits += 1
+            return cached[0]
+        self.misses += 1
+        return await self._flights.do(blob_name, lambda: self._issue(blob_name, verify_exists))
+
+    async def _issue(self, blob_name: str, verify_exists: bool) -> str:
+        loop = asyncio.get_running_loop()
+        issued_at = time.monotonic()
+        async with telemetry.upstream_call("gcs", "sign_url"):
+            url = await loop.run_in_executor(_sign_executor, self._sign, blob_name, verify_exists)
+        self._urls[blob_name] = (url, issued_at + self.ttl)
+        self._urls.move_to_end(blob_name)
+        while len(self._urls) > self.max_entries:
+            self._urls.popitem(last=False)
+        return url
+
+    def _sign(self, blob_name: str, verify_exists: bool) -> str:
+        bucket = gcp.storage_client.bucket(settings.GCP_SOURCE_BUCKET_NAME)
+        blob = bucket.blob(blob_name)
+
+        if verify_exists and not blob.exists():
+            raise FileNotFoundError(f"Artifact {blob_name} not found in bucket.")
+
+        return blob.generate_signed_url(
+            expiration=timedelta(seconds=self.ttl),
+            version="v4",
+            credentials=self._signing_credentials(),
+        )
+
+    def _signing_credentials(self):
+        with self._credentials_lock:
+            now = time.monotonic()
+            if self._credentials is None or now >= self._credentials_expire_at:
+                self._credentials = self._build_signing_credentials()
+                self._credentials_expire_at = now + self.credentials_lifetime - self.refresh_margin
+            return self._credentials
+
+    def _build_signing_credentials(self):
+        credentials = gcp.storage_client._credentials
+        request = Request()
+        if credentials is not None and not credentials.valid:
+            credentials.refresh(request)
+
+        if credentials and hasattr(credentials, "sign_bytes") and callable(getattr(credentials, "sign_bytes")):
+            return credentials
+
+        signer_email = settings.GCP_SIGNER_SERVICE_ACCOUNT_EMAIL
+        if not signer_email:
+            raise RuntimeError(
+                "GCP_SIGNER_SERVICE_ACCOUNT_EMAIL must be configured to use IAM-based signing."
+            )
+
+        if credentials is None:
+            raise RuntimeError("Storage client has no credentials available for signing.")
+
+        # The source credentials refresh themselves when signBlob needs a new token.
+        return impersonated_credentials.Credentials(
+            source_credentials=credentials,
+            target_principal=signer_email,
+            target_scopes=["https://www.googleapis.com/auth/cloud-platform"],
+            lifetime=self.credentials_lifetime,
+        )
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._urls),
+        }
+
+
+signer = UrlSigner(
+    ttl=settings.SIGNED_URL_TTL_SECONDS,
+    refresh_margin=settings.SIGNED_URL_REFRESH_MARGIN_SECONDS,
+    max_entries=settings.SIGNED_URL_CACHE_SIZE,
+    credentials_lifetime=settings.SIGNER_CREDENTIALS_LIFETIME_SECONDS,
+)
@@ -0,0 +1,226 @@
+"""
+Pre-deploy smoke test for generated services.
+
+Before a new source is uploaded and built, the packaged archive is unpacked
+into a temp dir and its app is driven in-process (see app.core.smoke_runner)
+with a short burst of requests against the spec's endpoint: valid payloads
+synthesized from `schema_fields`, which must succeed, and invalid ones, which
+must be rejected with 400/422. p50/p99 latency and the error rate are
+recorded on the service, and a service that cannot serve fails before any
+build minutes are spent on it.
+
+The runner is a separate interpreter with a scrubbed environment, so the
+generated modules never share the API's module namespace, credentials or
+event loop.
+"""
+import asyncio
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from app.core.config import settings
+from app.core.generation import SourceArchive
+from app.core.runtimes import RuntimeTarget
+from app.models.service import SmokeTestReport
+
+RUNNER = str(Path(__file__).with_name("smoke_runner.py"))
+BODY_METHODS = ("POST", "PUT", "PATCH")
+# Statuses that count as a correctly rejected invalid payload.
+REJECTED_STATUSES = (400, 422)
+MAX_REPORTED_ERRORS = 5
+
+_SAMPLE_VALUES = {
+    "str": "example",
+    "int": 1,
+    "float": 1.5,
+    "bool": True,
+    "EmailStr": "user@example.com",
+    "HttpUrl": "https://example.com",
+    "Any": "example",
+}
+# Values the field type must reject; types with no entry (e.g. Any) accept anything.
+_WRONG_VALUES = {
+    "str": {"not": "a string"},
+    "int": "not-a-number",
+    "float": "not-a-number",
+    "bool": "not-a-bool",
+    "EmailStr": "not-an-email",
+    "HttpUrl": "not a url",
+}
+_NO_VALUE = object()
+
+
+class SmokeTestFailed(ValueError):
+    """The generated service cannot serve; carries the report for the service metadata."""
+
+    def __init__(self, message: str, report: SmokeTestReport):
+        super().__init__(message)
+        self.report = report
+
+
+def _unwrap_optional(type_name: str) -> str:
+    type_name = type_name.replace(" ", "")
+    match = re.fullmatch(r"Optional\[(.+)\]", type_name)
+    return match.group(1) if match else type_name
+
+
+def sample_value(type_name: str) -> Any:
+    """A value that validates as `type_name`, e.g. "List[int]" -> [1]."""
+    type_name = _unwrap_optional(type_name)
+    if type_name.startswith(("List[", "list[")):
+        return [sample_value(type_name[5:-1])]
+    if type_name.startswith(("Dict[", "dict[")) or type_name in ("Dict", "dict"):
+        return {}
+    if type_name in ("List", "list"):
+        return []
+    return _SAMPLE_VALUES.get(type_name, "example")
+
+
+def wrong_value(type_name: str) -> Any:
+    type_name = _unwrap_optional(type_name)
+    if type_name.startswith(("List", "list")):
+        return "not-a-list"
+    if type_name.startswith(("Dict", "dict")):
+        return "not-an-object"
+    return _WRONG_VALUES.get(type_name, _NO_VALUE)
+
+
+def synthesize_payloads(schema_fields: List[Dict[str, Any]]) -> Tuple[dict, List[Any]]:
+    """Returns a valid payload plus invalid ones: each required field missing, each field mistyped, a non-object."""
+    valid = {field["name"]: sample_value(field["type"]) for field in schema_fields}
+    invalid: List[Any] = []
+    for field in schema_fields:
+        if field.get("required"):
+            invalid.append({name: value for name, value in valid.items() if name != field["name"]})
+        wrong = wrong_value(field["type"])
+        if wrong is not _NO_VALUE:
+            invalid.append({**valid, field["name"]: wrong})
+    invalid.append([])
+    return valid, invalid
+
+
+def _concrete_path(path: str) -> str:
+    """Fills path parameters ({id} or <id>) with a sample value."""
+    return re.sub(r"\{[^}]+\}|<[^>]+>", "1", path)
+
+
+def build_plan(spec: Dict[str, Any], runtime: RuntimeTarget, source_dir: str) -> dict:
+    endpoint = spec["endpoint"]
+    method = endpoint.get("method", "GET").upper()
+    if method in BODY_METHODS:
+        valid, invalid = synthesize_payloads(endpoint.get("schema_fields") or [])
+        cases = [["valid", valid]] + [["invalid", payload] for payload in invalid]
+    else:
+        cases = [["valid", None]]
+    return {
+        "source_dir": source_dir,
+        "runtime": runtime.name,
+        "method": method,
+        "path": _concrete_path(endpoint["path"]),
+        "cases": cases,
+        "requests": settings.SMOKE_TEST_REQUESTS,
+    }
+
+
+def _percentile_ms(sorted_seconds: List[float], fraction: float) -> float:
+    rank = max(1, math.ceil(fraction * len(sorted_seconds)))
+    return round(sorted_seconds[rank - 1] * 1000, 3)
+
+
+def summarize(result: dict) -> SmokeTestReport:
+    """Turns the runner's raw result into a report and decides whether the service passes."""
+    problems = result.get("compile_errors") or ([result["load_error"].strip()] if result.get("load_error") else [])
+    if problems:
+        return SmokeTestReport(passed=False, errors=problems[:MAX_REPORTED_ERRORS])
+
+    samples = result.get("samples") or []
+    errors: List[str] = []
+    failures = 0
+    for kind, status, _, error in samples:
+        if error is not None:
+            message = error
+        elif kind == "valid" and not 200 <= status < 300:
+            message = f"valid payload got {status}"
+        elif kind == "invalid" and status not in REJECTED_STATUSES:
+            message = f"invalid payload got {status}"
+        else:
+            continue
+        failures += 1
+        if message not in errors and len(errors) < MAX_REPORTED_ERRORS:
+            errors.append(message)
+
+    latencies = sorted(seconds for _, _, seconds, _ in samples)
+    if not latencies:
+        return SmokeTestReport(passed=False, errors=["no requests were made"])
+    report = SmokeTestReport(
+        requests=len(samples),
+        p50_ms=_percentile_ms(latencies, 0.50),
+        p99_ms=_percentile_ms(latencies, 0.99),
+        error_rate=round(failures / len(samples), 4),
+        errors=errors,
+    )
+    report.passed = report.error_rate <= settings.SMOKE_TEST_MAX_ERROR_RATE and report.p99_ms <= settings.SMOKE_TEST_MAX_P99_MS
+    return report
+
+
+def _child_env() -> Dict[str, str]:
+    # Nothing from the API's environment (credentials, settings) reaches the generated code.
+    return {"PATH": os.environ.get("PATH", ""), "PYTHONDONTWRITEBYTECODE": "1"}
+
+
+async def run_smoke_test(archive: SourceArchive, spec: Dict[str, Any], runtime: RuntimeTarget) -> SmokeTestReport:
+    """
+    Smoke-tests a packaged service and returns its report; raises SmokeTestFailed
+    when it does not pass. A runner that exceeds SMOKE_TEST_TIMEOUT_SECONDS is
+    killed and raises TimeoutError, which the job queue retries.
+    """
+    with tempfile.TemporaryDirectory(prefix="smoke-") as source_dir:
+        with zipfile.ZipFile(archive.fileobj) as zipf:
+            zipf.extractall(source_dir)
+        archive.fileobj.seek(0)
+
+        plan = build_plan(spec, runtime, source_dir)
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, RUNNER,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=source_dir,
+            env=_child_env(),
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(json.dumps(plan).encode()), timeout=settings.SMOKE_TEST_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise TimeoutError(f"Smoke test did not finish within {settings.SMOKE_TEST_TIMEOUT_SECONDS}s.")
+
+    try:
+        result = json.loads(stdout)
+    except ValueError:
+        detail = stderr.decode(errors="replace").strip().splitlines()[-1:] or ["no output"]
+        result = {"load_error": f"Smoke test runner exited with {process.returncode}: {detail[0]}"}
+
+    report = summarize(result)
+    if not report.passed:
+        raise SmokeTestFailed(f"Generated service failed its smoke test: {_failure_reason(report)}", report)
+    return report
+
+
+def _failure_reason(report: SmokeTestReport) -> str:
+    if report.error_rate is None:
+        return "; ".join(report.errors)
+    reasons = []
+    if report.error_rate > settings.SMOKE_TEST_MAX_ERROR_RATE:
+        reasons.append(f"{report.error_rate:.0%} of requests failed ({'; '.join(report.errors)})")
+    if report.p99_ms > settings.SMOKE_TEST_MAX_P99_MS:
+        reasons.append(f"p99 latency {report.p99_ms}ms exceeds {settings.SMOKE_TEST_MAX_P99_MS}ms")
+    return "; ".join(reasons)
@@ -0,0 +1,157 @@
+"""
+Child half of the pre-deploy smoke test (see app.core.smoke_gate).
+
+Runs in a fresh interpreter, started by path so the generated `main`, `routes`
+and `models` modules cannot collide with the backend's own. It compile-checks
+the rendered sources, imports the service and calls its WSGI or ASGI app
+directly (no server, no network) with the requests in the plan.
+
+Reads the plan as JSON on stdin and writes the result as JSON on stdout. Only
+the standard library is imported here; the service brings its own imports.
+"""
+import asyncio
+import io
+import json
+import sys
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, List
+
+
+def compile_check(source_dir: Path) -> List[str]:
+    problems = []
+    for path in sorted(source_dir.glob("*.py")):
+        try:
+            compile(path.read_text(), path.name, "exec")
+        except SyntaxError as e:
+            problems.append(f"{path.name}:{e.lineno}: {e.msg}")
+    return problems
+
+
+def wsgi_caller(app) -> Callable[[str, str, bytes], int]:
+    def call(method: str, path: str, body: bytes) -> int:
+        environ = {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": path,
+            "QUERY_STRING": "",
+            "SERVER_NAME": "smoke",
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(int(status.split(" ", 1)[0]))
+
+        result = app(environ, start_response)
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        return statuses[0]
+
+    return call
+
+
+async def asgi_call(app, method: str, path: str, body: bytes) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"smoke"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("smoke", 80),
+    }
+    sent = False
+    status = None
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+def drive(plan: dict, source_dir: Path) -> List[list]:
+    """Returns one [case kind, status or None, seconds, error or None] sample per request."""
+    sys.path.insert(0, str(source_dir))
+    import main as service
+
+    cases = [(kind, json.dumps(body).encode() if body is not None else b"") for kind, body in plan["cases"]]
+    method, path = plan["method"], plan["path"]
+    samples = []
+
+    if plan["runtime"] == "asgi":
+        async def run_all():
+            for index in range(plan["requests"]):
+                kind, body = cases[index % len(cases)]
+                started = time.perf_counter()
+                try:
+                    status = await asgi_call(service.app, method, path, body)
+                    samples.append([kind, status, time.perf_counter() - started, None])
+                except Exception as e:
+                    samples.append([kind, None, time.perf_counter() - started, repr(e)])
+
+        asyncio.run(run_all())
+        return samples
+
+    call = wsgi_caller(service.create_app())
+    for index in range(plan["requests"]):
+        kind, body = cases[index % len(cases)]
+        started = time.perf_counter()
+        try:
+            status = call(method, path, body)
+            samples.append([kind, status, time.perf_counter() - started, None])
+        except Exception as e:
+            samples.append([kind, None, time.perf_counter() - started, repr(e)])
+    return samples
+
+
+def main():
+    plan = json.load(sys.stdin)
+    source_dir = Path(plan["source_dir"])
+    # Generated handlers may print; keep stdout for the result.
+    result_stream, sys.stdout = sys.stdout, sys.stderr
+
+    result = {"compile_errors": compile_check(source_dir)}
+    if not result["compile_errors"]:
+        try:
+            result["samples"] = drive(plan, source_dir)
+        except Exception as e:
+            result["load_error"] = "".join(traceback.format_exception_only(type(e), e)).strip()
+    json.dump(result, result_stream)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import copy
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from app.core import gcp, telemetry
+from app.core.config import settings
+
+log = telemetry.get_logger("spec_cache")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapses whitespace so trivially different copies of a prompt share a cache entry."""
+    return " ".join(prompt.split())
+
+
+def cache_key(prompt: str, system_prompt: str, model_version: str) -> str:
+    """
+    Content address for a generated spec. Changing the system prompt or the
+    model produces a new key, which invalidates every older entry for free.
+    """
+    digest = hashlib.sha256()
+    for part in (model_version, system_prompt, normalize_prompt(prompt)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class LRUSpecCache:
+    """In-process tier: a size-bounded LRU whose entries expire after `ttl_seconds`."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, spec = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return spec
+
+    def set(self, key: str, spec: dict, ttl_seconds: Optional[float] = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, spec)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class FirestoreSpecStore:
+    """
+    Persistent tier shared by every instance: one document per cache key.
+    `expires_at` is checked on read and can also back a Firestore TTL policy.
+    """
+
+    def __init__(self, collection: str, ttl_seconds: float):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+
+    async def get(self, key: str) -> Optional[Tuple[dict, float]]:
+        """Returns the spec and its remaining lifetime in seconds, or None."""
+        doc = await gcp.db.collection(self.collection).document(key).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        expires_at = data.get("expires_at")
+        if expires_at is None:
+            return None
+        remaining = (expires_at.replace(tzinfo=None) - datetime.utcnow()).total_seconds()
+        if remaining <= 0:
+            return None
+        return data["spec"], remaining
+
+    async def set(self, key: str, spec: dict, model_version: str):
+        now = datetime.utcnow()
+        await gcp.db.collection(self.collection).document(key).set({
+            "spec": spec,
+            "model_version": model_version,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl_seconds),
+        })
+
+
+class SpecCache:
+    """
+    Two-tier prompt->spec cache. Lookups try memory first, then the persistent
+    store, and promote persistent hits into memory. Persistent-tier failures are
+    logged and treated as misses so the cache can never fail a generation.
+    """
+
+    def __init__(self, memory: LRUSpecCache, persistent: Optional[FirestoreSpecStore] = None):
+        self.memory = memory
+        self.persistent = persistent
+        self.stats: Dict[str, int] = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+        }
+
+    async def get(self, key: str) -> Optional[dict]:
+        spec = self.memory.get(key)
+        if spec is not None:
+            self.stats["memory_hits"] += 1
+            return copy.deepcopy(spec)
+
+        if self.persistent is not None:
+            try:
+                stored = await self.persistent.get(key)
+            except Exception as e:
+                log.warning(f"Persistent lookup failed for {key[:12]}: {e}")
+                stored = None
+            if stored is not None:
+                spec, remaining = stored
+                self.memory.set(key, spec, ttl_seconds=remaining)
+                self.stats["persistent_hits"] += 1
+                return copy.deepcopy(spec)
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, spec: dict, model_version: str):
+        self.memory.set(key, copy.deepcopy(spec))
+        if self.persistent is not None:
+            try:
+                await self.persistent.set(key, spec, model_version)
+            except Exception as e:
+                log.warning(f"Persistent write failed for {key[:12]}: {e}")
+
+    def record_bypass(self):
+        self.stats["bypassed"] += 1
+
+
+def build_spec_cache() -> SpecCache:
+    """Creates the cache configured by the SPEC_CACHE_* settings."""
+    memory = LRUSpecCache(settings.SPEC_CACHE_MAX_ENTRIES, settings.SPEC_CACHE_TTL_SECONDS)
+    persistent = None
+    if settings.SPEC_CACHE_PERSISTENT:
+        persistent = FirestoreSpecStore(
+            settings.FIRESTORE_SPEC_CACHE_COLLECTION, settings.SPEC_CACHE_TTL_SECONDS
+        )
+    return SpecCache(memory, persistent)
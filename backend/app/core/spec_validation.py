@@ -0,0 +1,295 @@
+"""
+Local validation and repair of generated specs.
+
+Every spec is checked against the strict model in app/models/spec.py
+before anything is rendered, so a spec that cannot produce a working
+service fails in milliseconds instead of after a Cloud Build. Common
+defects are repaired first, without another round trip to the model:
+
+- names: service names are made DNS-compliant, field names snake_case and
+  model names PascalCase; names that would clash with Python keywords or
+  with what the templates import are suffixed.
+- types: common spellings ("string", "integer", "array", "List[string]",
+  "Optional[int]", ...) are mapped onto the allow-list; Optional[X]
+  becomes X with required=false.
+- paths: a leading "/" is added, query strings and trailing or repeated
+  slashes are dropped, and path parameters (<id>, <int:id>, :id) become {id}.
+- shape: unknown keys are dropped, a one-element "endpoints" list is
+  unwrapped, a {name: type} mapping becomes a field list, a missing
+  "required" follows rule 10 of the system prompt.
+
+Anything still invalid is rejected with a ValueError listing each problem.
+`stats` counts specs that were valid, repaired or rejected.
+"""
+import keyword
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.core import telemetry
+from app.models.spec import SERVICE_NAME_MAX_LENGTH, ServiceSpec, SpecDelta
+
+log = telemetry.get_logger("spec_validation")
+
+# Generated code defines its routes at these paths.
+RESERVED_PATHS = ("/health",)
+# Names the generated models.py and routes.py import; the model class must not shadow them.
+RESERVED_MODEL_NAMES = {
+    "Any", "APIRouter", "BaseModel", "Blueprint", "Dict", "EmailStr", "FastAPI", "HttpUrl",
+    "List", "None", "ORJSONResponse", "Optional", "Request", "Response", "ValidationError", "True", "False",
+}
+# Methods whose fields default to required when the spec does not say (rule 10).
+BODY_METHODS = ("POST", "PUT")
+
+_TYPE_ALIASES = {
+    "str": "str", "string": "str", "text": "str",
+    "int": "int", "integer": "int", "long": "int",
+    "float": "float", "number": "float", "double": "float", "decimal": "float",
+    "bool": "bool", "boolean": "bool",
+    "emailstr": "EmailStr", "email": "EmailStr",
+    "httpurl": "HttpUrl", "url": "HttpUrl", "uri": "HttpUrl",
+    "list": "List[str]", "array": "List[str]",
+    "dict": "Dict[str, Any]", "object": "Dict[str, Any]", "json": "Dict[str, Any]", "map": "Dict[str, Any]",
+}
+_PATH_PARAMETER = re.compile(r"^(?:<(?:[a-z]+:)?([^>]+)>|:(.+)|\{([^}]+)\})$")
+
+stats: Dict[str, int] = {"valid": 0, "repaired": 0, "rejected": 0}
+
+
+def _words(text: str) -> List[str]:
+    """Splits "contactForm", "Contact form" or "contact_form" into lowercase words."""
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)
+    text = re.sub(r"([A-Z]+)([A-Z][a-z])", r"\1 \2", text)
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def snake_case(name: str) -> str:
+    result = "_".join(_words(name))
+    if result[:1].isdigit():
+        result = f"field_{result}"
+    if keyword.iskeyword(result):
+        result = f"{result}_"
+    return result
+
+
+def pascal_case(name: str) -> str:
+    result = "".join(word.capitalize() for word in _words(name))
+    if result[:1].isdigit():
+        result = f"Model{result}"
+    if result in RESERVED_MODEL_NAMES:
+        result = f"{result}Model"
+    return result
+
+
+def service_name(name: str) -> str:
+    result = "-".join(re.findall(r"[a-z0-9]+", name.lower()))
+    if result[:1].isdigit():
+        result = f"api-{result}"
+    return result[:SERVICE_NAME_MAX_LENGTH].rstrip("-")
+
+
+def normalize_type(type_name: str) -> Tuple[str, bool]:
+    """Returns (allow-listed type if one matches, whether it was Optional)."""
+    compact = re.sub(r"\s+", "", type_name)
+    optional = re.fullmatch(r"(?i)optional\[(.+)\]", compact)
+    if optional:
+        return normalize_type(optional.group(1))[0], True
+
+    alias = _TYPE_ALIASES.get(compact.lower())
+    if alias:
+        return alias, False
+    sequence = re.fullmatch(r"(?i)(?:list|array)[\[<](.+)[\]>]", compact)
+    if sequence:
+        item = _TYPE_ALIASES.get(sequence.group(1).lower(), sequence.group(1))
+        return f"List[{item}]", False
+    if re.fullmatch(r"(?i)dict\[str(?:ing)?,any\]", compact):
+        return "Dict[str, Any]", False
+    return type_name.strip(), False
+
+
+def normalize_path(path: str) -> str:
+    path = re.split(r"[?#]", path.strip(), 1)[0]
+    segments = []
+    for segment in path.split("/"):
+        segment = segment.strip()
+        if not segment:
+            continue
+        parameter = _PATH_PARAMETER.match(segment)
+        if parameter:
+            segments.append("{" + snake_case(next(group for group in parameter.groups() if group)) + "}")
+        else:
+            segments.append(re.sub(r"\s+", "-", segment))
+    return "/" + "/".join(segments)
+
+
+def _repair_field(field: Any, method: Optional[str], repairs: List[str]) -> Any:
+    if not isinstance(field, dict):
+        return field
+    repaired = {key: field[key] for key in ("name", "type", "required") if key in field}
+    if len(repaired) != len(field):
+        repairs.append("dropped unknown field keys")
+    if isinstance(repaired.get("name"), str):
+        repaired["name"] = snake_case(repaired["name"])
+    optional = False
+    if isinstance(repaired.get("type"), str):
+        repaired["type"], optional = normalize_type(repaired["type"])
+    required = repaired.get("required")
+    if optional:
+        repaired["required"] = False
+    elif required is None:
+        repaired["required"] = method in BODY_METHODS
+    elif isinstance(required, str) and required.strip().lower() in ("true", "false"):
+        repaired["required"] = required.strip().lower() == "true"
+    if repaired != field:
+        repairs.append(f"field {field.get('name')!r}")
+    return repaired
+
+
+def _repair_endpoint(endpoint: Any, repairs: List[str]) -> Any:
+    if not isinstance(endpoint, dict):
+        return endpoint
+    repaired = {key: endpoint[key] for key in ("path", "method", "model_name", "schema_fields") if key in endpoint}
+    if len(repaired) != len(endpoint):
+        repairs.append("dropped unknown endpoint keys")
+    for key, fix in (("path", normalize_path), ("method", lambda method: method.strip().upper()), ("model_name", pascal_case)):
+        value = repaired.get(key)
+        if isinstance(value, str) and fix(value) != value:
+            repaired[key] = fix(value)
+            repairs.append(key)
+
+    fields = repaired.get("schema_fields")
+    if fields is None:
+        fields = []
+    elif isinstance(fields, dict):
+        fields = [{"name": name, "type": type_name} for name, type_name in fields.items()]
+        repairs.append("schema_fields mapping")
+    if isinstance(fields, list):
+        method = repaired.get("method")
+        fields = [_repair_field(field, method, repairs) for field in fields]
+    repaired["schema_fields"] = fields
+    return repaired
+
+
+def repair(raw: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """Fixes the defects listed in the module docstring; returns the spec and what was repaired."""
+    repairs: List[str] = []
+    spec = {key: raw[key] for key in ("service_name", "endpoint") if key in raw}
+    known = set(spec)
+    endpoints = raw.get("endpoints")
+    if "endpoint" not in spec and isinstance(endpoints, list) and len(endpoints) == 1:
+        spec["endpoint"] = endpoints[0]
+        known.add("endpoints")
+        repairs.append("endpoints list")
+    if set(raw) - known:
+        repairs.append("dropped unknown keys")
+
+    name = spec.get("service_name")
+    if isinstance(name, str) and service_name(name) != name:
+        spec["service_name"] = service_name(name)
+        repairs.append("service_name")
+    if "endpoint" in spec:
+        spec["endpoint"] = _repair_endpoint(spec["endpoint"], repairs)
+    return spec, repairs
+
+
+def _problems(spec: ServiceSpec) -> List[str]:
+    """Checks the model cannot express on its own."""
+    endpoint = spec.endpoint
+    problems = []
+    if endpoint.path in RESERVED_PATHS:
+        problems.append(f"endpoint.path: {endpoint.path} is reserved for the generated service")
+    names = [field.name for field in endpoint.schema_fields]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        problems.append(f"endpoint.schema_fields: duplicate names {', '.join(duplicates)}")
+    for name in names:
+        if name.startswith("model_"):
+            problems.append(f"endpoint.schema_fields: {name} clashes with pydantic's model_ namespace")
+    return problems
+
+
+def check(spec: Dict[str, Any]) -> ServiceSpec:
+    """Validates a spec as is, without repairs; raises ValueError listing every problem."""
+    try:
+        validated = ServiceSpec.model_validate(spec)
+    except ValidationError as e:
+        problems = [
+            f"{'.'.join(str(part) for part in error['loc']) or 'spec'}: {error['msg']}" for error in e.errors()
+        ]
+    else:
+        problems = _problems(validated)
+    if problems:
+        raise ValueError(f"Service spec is invalid: {'; '.join(problems)}.")
+    return validated
+
+
+def validate_spec(raw: Any) -> Dict[str, Any]:
+    """Repairs a decoded spec and validates it; returns the spec as a plain dict or raises ValueError."""
+    try:
+        if not isinstance(raw, dict):
+            raise ValueError(f"AI-generated spec must be a JSON object, got {type(raw).__name__}.")
+        repaired, repairs = repair(raw)
+        spec = check(repaired)
+    except ValueError:
+        stats["rejected"] += 1
+        raise
+
+    if repairs:
+        stats["repaired"] += 1
+        log.info(f"Repaired spec: {', '.join(dict.fromkeys(repairs))}", extra={"fields": {"service_name": spec.service_name}})
+    else:
+        stats["valid"] += 1
+    return spec.model_dump(exclude_none=True)
+
+
+def apply_delta(spec: Dict[str, Any], delta: SpecDelta) -> Dict[str, Any]:
+    """
+    Applies an edit (PATCH /services/{id}) to a stored spec. The result is
+    repaired and checked like a generated spec; raises ValueError if it is invalid.
+    """
+    endpoint = dict(spec.get("endpoint") or {})
+    for key in ("path", "method", "model_name"):
+        value = getattr(delta, key)
+        if value is not None:
+            endpoint[key] = value
+
+    fields = list(endpoint.get("schema_fields") or [])
+    existing = {field.get("name") for field in fields}
+    removed = {snake_case(name) for name in delta.remove_fields}
+    missing = sorted(removed - existing)
+    if missing:
+        raise ValueError(f"Cannot remove unknown field(s): {', '.join(missing)}.")
+    fields = [field for field in fields if field.get("name") not in removed]
+    for added in delta.add_fields:
+        name = snake_case(str(added.get("name", "")))
+        fields = [field for field in fields if field.get("name") != name] + [added]
+    endpoint["schema_fields"] = fields
+
+    repaired, _ = repair({**spec, "endpoint": endpoint})
+    return check(repaired).model_dump(exclude_none=True)
+
+
+def _gemini_schema(node: Dict[str, Any], definitions: Dict[str, Any]) -> Dict[str, Any]:
+    """Converts a pydantic JSON schema node into the OpenAPI subset Gemini's response_schema accepts."""
+    if "$ref" in node:
+        return _gemini_schema(definitions[node["$ref"].rsplit("/", 1)[-1]], definitions)
+    if "enum" in node:
+        return {"type": "string", "format": "enum", "enum": list(node["enum"])}
+    schema: Dict[str, Any] = {"type": node["type"]}
+    if node["type"] == "object":
+        required = node.get("required", [])
+        # Optional properties are not requested from the model.
+        schema["properties"] = {
+            name: _gemini_schema(child, definitions) for name, child in node["properties"].items() if name in required
+        }
+        schema["required"] = list(required)
+    elif node["type"] == "array":
+        schema["items"] = _gemini_schema(node["items"], definitions)
+    return schema
+
+
+def response_schema() -> Dict[str, Any]:
+    """ServiceSpec as a Gemini structured-output schema: field types and methods are enums there too."""
+    json_schema = ServiceSpec.model_json_schema()
+    return _gemini_schema(json_schema, json_schema.get("$defs", {}))
@@ -0,0 +1,125 @@
+"""
+GCS I/O.
+
+google-cloud-storage is synchronous, so every storage call runs on a thread.
+Those threads are a pool of their own rather than the loop's default
+executor, and each operation type has its own concurrency cap: a burst of
+uploads cannot hold every thread while log reads and existence checks wait,
+and storage traffic as a whole cannot starve anything else that needs a
+thread. The pool is sized from the caps, so a call that got a slot always
+gets a thread.
+
+All calls share the storage client's HTTP session, whose connection pool is
+sized for every thread that uses it (see `connection_pool_size`), so
+connections are reused instead of reopened per call.
+
+Each call reports its latency as an upstream call ("gcs", operation) and the
+time it waited for a slot as `gcs_io_queue_seconds`.
+"""
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, Optional
+
+from app.core import telemetry
+from app.core.config import settings
+from app.state import clients
+
+# GCS requires resumable upload chunks to be a multiple of 256 KiB.
+CHUNK_GRANULARITY = 256 * 1024
+
+
+def operation_limits() -> Dict[str, int]:
+    return {
+        "upload": settings.GCS_CONCURRENCY_UPLOAD,
+        "read_range": settings.GCS_CONCURRENCY_READ,
+        "stat_object": settings.GCS_CONCURRENCY_STAT,
+    }
+
+
+def connection_pool_size() -> int:
+    """Connections kept per host: one per GCS I/O thread plus the URL signer's threads, which share the client."""
+    return sum(operation_limits().values()) + settings.SIGNING_WORKERS
+
+
+class GcsIO:
+
+    def __init__(self, limits: Dict[str, int], resumable_threshold: int, chunk_size: int, timeout: float):
+        if chunk_size <= 0 or chunk_size % CHUNK_GRANULARITY:
+            raise ValueError(f"GCS upload chunk size must be a positive multiple of {CHUNK_GRANULARITY} bytes.")
+        self.resumable_threshold = resumable_threshold
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self._semaphores = {operation: asyncio.Semaphore(limit) for operation, limit in limits.items()}
+        self._executor = ThreadPoolExecutor(max_workers=sum(limits.values()), thread_name_prefix="gcs-io")
+        self.in_flight: Dict[str, int] = {operation: 0 for operation in limits}
+
+    async def run(self, operation: str, fn: Callable[..., Any], *args) -> Any:
+        """Runs a blocking storage call on the GCS pool once a slot for `operation` is free."""
+        queued_at = time.perf_counter()
+        async with self._semaphores[operation]:
+            telemetry.GCS_QUEUE_SECONDS.labels(operation).observe(time.perf_counter() - queued_at)
+            self.in_flight[operation] += 1
+            try:
+                async with telemetry.upstream_call("gcs", operation):
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+            finally:
+                self.in_flight[operation] -= 1
+
+    async def upload(
+        self, bucket_name: str, object_name: str, source: BinaryIO, size: Optional[int], content_type: str
+    ):
+        """
+        Uploads a file-like object from its start. Small uploads of known size
+        go in one request; larger ones (or of unknown size) are resumable and
+        sent in `chunk_size` pieces, so a failed chunk is resent rather than
+        the whole object and only one chunk is buffered at a time.
+        """
+        resumable = size is None or size > self.resumable_threshold
+
+        def _upload():
+            bucket = clients["storage_client"].bucket(bucket_name)
+            blob = bucket.blob(object_name, chunk_size=self.chunk_size if resumable else None)
+            blob.upload_from_file(
+                source, rewind=True, size=size, content_type=content_type,
+                timeout=self.timeout, retry=_upload_retry(),
+            )
+
+        await self.run("upload", _upload)
+
+    async def read_range(self, bucket_name: str, object_name: str, start: int, end: int) -> bytes:
+        """Downloads bytes [start, end) of an object; only that slice is held in memory."""
+        def _download() -> bytes:
+            blob = clients["storage_client"].bucket(bucket_name).blob(object_name)
+            # download_as_bytes takes an inclusive end offset.
+            return blob.download_as_bytes(start=start, end=end - 1, timeout=self.timeout)
+
+        return await self.run("read_range", _download)
+
+    async def object_size(self, bucket_name: str, object_name: str) -> Optional[int]:
+        """Returns an object's current size, or None if it does not exist (yet)."""
+        def _stat() -> Optional[int]:
+            blob = clients["storage_client"].bucket(bucket_name).get_blob(object_name, timeout=self.timeout)
+            return blob.size if blob is not None else None
+
+        return await self.run("stat_object", _stat)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _upload_retry():
+    # Source objects are named per service and rewritten with the same bytes on a
+    # retried job, so retrying an upload without a generation precondition is safe.
+    from google.cloud.storage.retry import DEFAULT_RETRY
+    return DEFAULT_RETRY
+
+
+gcs = GcsIO(
+    operation_limits(),
+    resumable_threshold=settings.GCS_RESUMABLE_THRESHOLD_BYTES,
+    chunk_size=settings.GCS_UPLOAD_CHUNK_BYTES,
+    timeout=settings.GCS_TIMEOUT_SECONDS,
+)
@@ -0,0 +1,248 @@
+import contextvars
+import functools
+import json
+import logging
+import secrets
+import sys
+import time
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from app.core.config import settings
+
+# --- Metrics ---
+
+# Buckets span a cached spec (milliseconds) to a slow Gemini call or large upload (minutes).
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_duration_seconds",
+    "Wall time of each generation pipeline stage, including time spent waiting for a stage slot.",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    "pipeline_stage_errors_total",
+    "Generation pipeline stage failures by exception type.",
+    ["stage", "exception"],
+)
+STAGE_IN_FLIGHT = Gauge(
+    "pipeline_stage_in_flight",
+    "Generation pipeline stages currently running.",
+    ["stage"],
+)
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_duration_seconds",
+    "Latency of calls to Google Cloud and AI backends.",
+    ["upstream", "operation"],
+    buckets=_LATENCY_BUCKETS,
+)
+UPSTREAM_ERRORS = Counter(
+    "upstream_request_errors_total",
+    "Failed calls to Google Cloud and AI backends by exception type.",
+    ["upstream", "operation", "exception"],
+)
+UPSTREAM_RETRIES = Counter(
+    "upstream_retries_total",
+    "Upstream calls retried after a transient error, by that error's type.",
+    ["upstream", "operation", "exception"],
+)
+UPSTREAM_HEDGES = Counter(
+    "upstream_hedged_requests_total",
+    "Duplicate requests sent for slow upstream calls, and how many of them answered first.",
+    ["upstream", "operation", "outcome"],
+)
+CIRCUIT_REJECTIONS = Counter(
+    "circuit_breaker_rejections_total",
+    "Calls failed fast because the upstream's circuit breaker was open.",
+    ["upstream"],
+)
+GCS_QUEUE_SECONDS = Histogram(
+    "gcs_io_queue_seconds",
+    "Time GCS calls wait for a slot of their operation type before running.",
+    ["operation"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+
+class StatsCollector:
+    """
+    Exposes counters that components already keep (cache hit counts, queue
+    sizes, ...) at scrape time, so those components need no metrics code.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, tuple] = {}
+
+    def counter(self, name: str, documentation: str, fn: Callable[[], float], label: Optional[str] = None):
+        """With `label`, `fn` returns a {label value: count} mapping instead of a single number."""
+        self._metrics[name] = (CounterMetricFamily, documentation, fn, label)
+
+    def gauge(self, name: str, documentation: str, fn: Callable[[], float], label: Optional[str] = None):
+        self._metrics[name] = (GaugeMetricFamily, documentation, fn, label)
+
+    def collect(self):
+        for name, (family_type, documentation, fn, label) in self._metrics.items():
+            if label is None:
+                yield family_type(name, documentation, value=fn())
+                continue
+            family = family_type(name, documentation, labels=[label])
+            for label_value, value in fn().items():
+                family.add_metric([label_value], value)
+            yield family
+
+    def describe(self):
+        # Registration must not call the callbacks, which may touch state that is not ready yet.
+        return []
+
+
+stats = StatsCollector()
+REGISTRY.register(stats)
+
+
+# --- Tracing context ---
+
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_id", default=None)
+_span_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("span_id", default=None)
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+
+def new_span_id() -> str:
+    return secrets.token_hex(8)
+
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+def parse_cloud_trace_header(value: Optional[str]) -> Optional[str]:
+    """Extracts the trace id from an `X-Cloud-Trace-Context: TRACE_ID/SPAN_ID;o=1` header."""
+    if not value:
+        return None
+    trace_id = value.split("/", 1)[0].strip()
+    return trace_id or None
+
+
+@contextmanager
+def trace(trace_id: Optional[str] = None):
+    """Binds a trace id (a new one by default) to everything logged inside the block."""
+    trace_token = _trace_id.set(trace_id or new_trace_id())
+    span_token = _span_id.set(None)
+    try:
+        yield _trace_id.get()
+    finally:
+        _span_id.reset(span_token)
+        _trace_id.reset(trace_token)
+
+
+# --- Structured logging ---
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line. Cloud Logging picks up `severity` and the
+    `logging.googleapis.com/*` keys, so entries group under their request trace.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        trace_id = _trace_id.get()
+        if trace_id:
+            entry["trace_id"] = trace_id
+            entry["logging.googleapis.com/trace"] = f"projects/{settings.GCP_PROJECT_ID}/traces/{trace_id}"
+        span_id = _span_id.get()
+        if span_id:
+            entry["span_id"] = span_id
+            entry["logging.googleapis.com/spanId"] = span_id
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_handler = logging.StreamHandler(sys.stdout)
+_handler.setFormatter(JsonFormatter())
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Returns a JSON logger under the `api_architect` namespace.
+    Pass structured context as `extra={"fields": {...}}`.
+    """
+    root = logging.getLogger("api_architect")
+    if _handler not in root.handlers:
+        root.addHandler(_handler)
+        root.setLevel(logging.INFO)
+        # Keep entries out of the plain-text root handler other modules configure.
+        root.propagate = False
+    return root.getChild(name)
+
+
+log = get_logger("telemetry")
+
+
+# --- Instrumentation helpers ---
+
+@asynccontextmanager
+async def stage(name: str, **fields):
+    """
+    Runs a pipeline stage in its own span: tracks it as in flight, times it and
+    counts failures by exception type. Start, end and failure are logged.
+    """
+    span_token = _span_id.set(new_span_id())
+    in_flight = STAGE_IN_FLIGHT.labels(name)
+    in_flight.inc()
+    started = time.perf_counter()
+    log.info(f"Stage {name} started", extra={"fields": {"stage": name, **fields}})
+    try:
+        yield
+    except Exception as e:
+        elapsed = time.perf_counter() - started
+        STAGE_ERRORS.labels(name, type(e).__name__).inc()
+        log.error(
+            f"Stage {name} failed: {e}",
+            extra={"fields": {"stage": name, "duration_seconds": elapsed, "exception": type(e).__name__, **fields}},
+        )
+        raise
+    else:
+        elapsed = time.perf_counter() - started
+        log.info(f"Stage {name} completed", extra={"fields": {"stage": name, "duration_seconds": elapsed, **fields}})
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - started)
+        in_flight.dec()
+        _span_id.reset(span_token)
+
+
+@asynccontextmanager
+async def upstream_call(upstream: str, operation: str):
+    """Times one call to an external backend and counts its failures."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        UPSTREAM_ERRORS.labels(upstream, operation, type(e).__name__).inc()
+        raise
+    finally:
+        UPSTREAM_SECONDS.labels(upstream, operation).observe(time.perf_counter() - started)
+
+
+def instrumented(upstream: str, operation: str):
+    """Decorator form of `upstream_call` for coroutine functions."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            async with upstream_call(upstream, operation):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 import uuid
 
@@ -11,6 +11,32 @@ class ServiceStatus:
     FAILED = "FAILED"
 
 
+class SmokeTestReport(BaseModel):
+    """Result of the pre-deploy smoke test (see app/core/smoke_gate.py)."""
+    passed: bool = False
+    requests: int = 0
+    p50_ms: Optional[float] = None
+    p99_ms: Optional[float] = None
+    error_rate: Optional[float] = None
+    # First few distinct problems: compile/import errors or unexpected responses
+    errors: List[str] = Field(default_factory=list)
+
+
+class ServiceRevision(BaseModel):
+    """One version of a service's spec and what was built from it; PATCH /services/{id} adds one per edit."""
+    number: int
+    spec: Dict[str, Any]
+    runtime: Optional[str] = None
+    source_hash: Optional[str] = None
+    build_id: Optional[str] = None
+    # Filled in once a newer revision supersedes this one; until then the service's own status and image apply.
+    status: Optional[str] = None
+    image: Optional[str] = None
+    # Generated files whose content the edit changed
+    changed_files: List[str] = Field(default_factory=list)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class ServiceMetadata(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
@@ -21,7 +47,52 @@ class ServiceMetadata(BaseModel):
     build_id: Optional[str] = None
     build_log_url: Optional[str] = None
     source_blob: Optional[str] = None
+    source_hash: Optional[str] = None
+    image: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     spec: Optional[Dict[str, Any]] = None
     error_message: Optional[str] = None
+    # Set when the service was created by POST /services/generate/batch
+    batch_id: Optional[str] = None
+    # Runtime target the service is generated for: "asgi" or "flask" (see app/core/runtimes.py)
+    runtime: Optional[str] = None
+    smoke_test: Optional[SmokeTestReport] = None
+    # Oldest first; empty until the service is first edited
+    revisions: List[ServiceRevision] = Field(default_factory=list)
+
+
+class ServiceSummary(ServiceMetadata):
+    """List view of a service; `prompt`, `spec` and `revisions` are only present when requested."""
+    prompt: Optional[str] = None
+
+
+# Large fields left out of list responses unless asked for with ?include=
+DETAIL_FIELDS = ("prompt", "spec", "revisions")
+
+
+class BatchGenerateRequest(BaseModel):
+    prompts: List[str] = Field(..., min_length=1)
+    # Build every service in one Cloud Build job with parallel steps instead of one job each.
+    combined_build: bool = False
+    # Runtime target for every service in the batch; RUNTIME_TARGET when unset.
+    runtime: Optional[str] = None
+
+
+class GenerationBatch(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    service_ids: List[str]
+    combined_build: bool = False
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class BatchProgress(BaseModel):
+    batch_id: str
+    total: int
+    pending: int
+    building: int
+    deployed: int
+    failed: int
+    # True once every service has reached DEPLOYED or FAILED
+    done: bool
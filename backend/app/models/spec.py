@@ -0,0 +1,63 @@
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional, Dict, Any, List, Literal
+
+# The rules of the system prompt (app/core/ai.py), as the model every spec must satisfy
+# before anything is rendered or built. app/core/spec_validation.py repairs near misses.
+
+HTTP_METHODS = ("GET", "POST", "PUT", "DELETE")
+# Field types the generated models.py can import and the smoke test can exercise.
+FIELD_TYPES = (
+    "str",
+    "int",
+    "float",
+    "bool",
+    "EmailStr",
+    "HttpUrl",
+    "List[str]",
+    "List[int]",
+    "List[float]",
+    "List[bool]",
+    "Dict[str, Any]",
+)
+SERVICE_NAME_PATTERN = r"^[a-z]([a-z0-9-]*[a-z0-9])?$"
+SERVICE_NAME_MAX_LENGTH = 30
+FIELD_NAME_PATTERN = r"^[a-z][a-z0-9_]*$"
+MODEL_NAME_PATTERN = r"^[A-Z][A-Za-z0-9]*$"
+# A leading "/" then segments of URL-safe characters or {parameters}; no trailing slash, query or fragment.
+PATH_PATTERN = r"^(/([A-Za-z0-9._~-]+|\{[a-z_][a-z0-9_]*\}))+$"
+
+
+class SchemaField(BaseModel):
+    model_config = ConfigDict(extra="forbid", strict=True)
+
+    name: str = Field(pattern=FIELD_NAME_PATTERN, max_length=64)
+    type: Literal[FIELD_TYPES]
+    required: bool
+
+
+class EndpointSpec(BaseModel):
+    model_config = ConfigDict(extra="forbid", strict=True)
+
+    path: str = Field(pattern=PATH_PATTERN, max_length=200)
+    method: Literal[HTTP_METHODS]
+    model_name: str = Field(pattern=MODEL_NAME_PATTERN, max_length=64)
+    schema_fields: List[SchemaField]
+
+
+class ServiceSpec(BaseModel):
+    model_config = ConfigDict(extra="forbid", strict=True)
+
+    service_name: str = Field(pattern=SERVICE_NAME_PATTERN, max_length=SERVICE_NAME_MAX_LENGTH)
+    endpoint: EndpointSpec
+
+
+class SpecDelta(BaseModel):
+    """Body of PATCH /services/{id}: an edit to the endpoint of a service's stored spec."""
+    model_config = ConfigDict(extra="forbid")
+
+    path: Optional[str] = None
+    method: Optional[str] = None
+    model_name: Optional[str] = None
+    # Fields to add, replacing any existing field of the same name
+    add_fields: List[Dict[str, Any]] = Field(default_factory=list)
+    remove_fields: List[str] = Field(default_factory=list)
@@ -1,9 +1,208 @@
 # backend/app/state.py
+"""
+Shared Google Cloud and AI clients.
 
-from typing import Dict, Any
-from google.cloud.devtools.cloudbuild_v1.services import cloud_build
-from google.cloud import run_v2
+Every client is registered with a factory and created the first time it is
+used, so importing the app pays for neither the client libraries nor their
+credential lookups. The lifespan starts `clients.warm_up()` as a background
+task: it imports each library in a worker thread and creates the clients
+while the app is already serving, so readiness never waits on them.
 
-# This simple dictionary will hold our shared client instances.
-# They will be populated during the application's startup.
-clients: Dict[str, Any] = {}
\ No newline at end of file
+Clients are read and replaced like a dict (`clients["build_client"]`);
+tests and benchmarks assign fakes the same way. Reading a client that does
+not exist yet creates it on the spot, which on the event loop would block
+every request while its library imports (or while a warm-up thread holds
+its lock). Code on the loop that may run before warm-up has finished
+awaits `clients.aget(name)` instead, and routes declare the clients they
+use with `Depends(clients.require(...))`.
+"""
+import asyncio
+import importlib
+import inspect
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core import telemetry
+from app.core.config import settings
+
+log = telemetry.get_logger("clients")
+
+
+@dataclass
+class ClientFactory:
+    create: Callable[[], Any]
+    # Modules the factory needs; warm-up imports them off the event loop first.
+    imports: Tuple[str, ...] = ()
+    # Async gRPC clients bind to the running loop and must be created on its thread.
+    loop_bound: bool = False
+    # Created by warm_up(); clients that are not are still created on first use.
+    warm: bool = True
+
+
+class ClientRegistry:
+
+    def __init__(self):
+        self._factories: Dict[str, ClientFactory] = {}
+        self._clients: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        # Seconds spent creating each client, including its imports.
+        self.timings: Dict[str, float] = {}
+
+    def register(self, name: str, factory: ClientFactory):
+        self._factories[name] = factory
+        self._locks[name] = threading.Lock()
+
+    def get(self, name: str) -> Any:
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        if name not in self._factories:
+            raise KeyError(name)
+        with self._locks[name]:
+            if name not in self._clients:
+                started = time.perf_counter()
+                self._clients[name] = self._factories[name].create()
+                self.timings[name] = time.perf_counter() - started
+        return self._clients[name]
+
+    def __getitem__(self, name: str) -> Any:
+        return self.get(name)
+
+    def __setitem__(self, name: str, client: Any):
+        self._clients[name] = client
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._clients
+
+    async def aget(self, name: str) -> Any:
+        """
+        `get` for callers on the event loop: thread-safe clients are created in a
+        worker thread, and loop-bound ones after their imports ran in one, so
+        the loop never waits on an import, a credential lookup or a lock.
+        """
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        if name not in self._factories:
+            raise KeyError(name)
+        factory = self._factories[name]
+        if not factory.loop_bound:
+            return await asyncio.to_thread(self.get, name)
+        await asyncio.to_thread(_import_all, factory.imports)
+        # Only ever created on the loop thread, so this lock is never held by another thread.
+        return self.get(name)
+
+    def require(self, *names: str) -> Callable[[], Awaitable[None]]:
+        """A FastAPI dependency that makes sure `names` exist before the route runs."""
+        async def dependency():
+            for name in names:
+                await self.aget(name)
+        return dependency
+
+    async def warm_up(self):
+        """Creates every warm client, one at a time; a failure is logged and left to first use to retry."""
+        for name, factory in self._factories.items():
+            if not factory.warm or name in self._clients:
+                continue
+            try:
+                if factory.loop_bound:
+                    started = time.perf_counter()
+                    await asyncio.to_thread(_import_all, factory.imports)
+                    self.get(name)
+                    self.timings[name] = time.perf_counter() - started
+                else:
+                    await asyncio.to_thread(self.get, name)
+            except Exception as e:
+                log.warning(f"Could not warm up client {name}: {e}", extra={"fields": {"client": name}})
+
+    async def close(self):
+        """Closes the clients that were created and support it."""
+        for client in list(self._clients.values()):
+            close = getattr(client, "close", None)
+            if close is None or inspect.ismodule(client):
+                continue
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+        self._clients.clear()
+
+
+def _import_all(modules: Tuple[str, ...]):
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _firestore_client():
+    from google.cloud import firestore
+    return firestore.AsyncClient(project=settings.GCP_PROJECT_ID)
+
+
+def _firestore_watch_client():
+    # Listeners (on_snapshot) run on their own threads and need the synchronous client.
+    from google.cloud import firestore
+    return firestore.Client(project=settings.GCP_PROJECT_ID)
+
+
+def _storage_client():
+    # Synchronous; calls run on the GCS I/O pool (see app.core.storage_io).
+    from google.cloud import storage
+    from requests.adapters import HTTPAdapter
+
+    from app.core.storage_io import connection_pool_size
+
+    client = storage.Client(project=settings.GCP_PROJECT_ID)
+    # Every storage thread shares this session. requests keeps 10 connections per
+    # host by default and drops the rest, so size the pool for all of them.
+    pool_size = connection_pool_size()
+    client._http.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+    return client
+
+
+def _build_client():
+    from google.cloud.devtools.cloudbuild_v1.services import cloud_build
+    return cloud_build.CloudBuildAsyncClient()
+
+
+def _run_client():
+    from google.cloud import run_v2
+    return run_v2.ServicesAsyncClient()
+
+
+def _firebase_app() -> Optional[Any]:
+    import firebase_admin
+    from firebase_admin import credentials
+
+    # This will use the Application Default Credentials of the Cloud Run service account
+    try:
+        if not firebase_admin._apps:
+            return firebase_admin.initialize_app(credentials.ApplicationDefault())
+        return firebase_admin.get_app()
+    except Exception as e:
+        log.error(f"Firebase Admin SDK initialization error: {e}")
+        # In a local environment, you might need to point to a service account JSON file.
+        # For Cloud Run, Application Default Credentials should work.
+        return None
+
+
+def _genai():
+    import google.generativeai as genai
+    genai.configure(api_key=settings.GEMINI_API_KEY)
+    return genai
+
+
+clients = ClientRegistry()
+clients.register("firestore_client", ClientFactory(_firestore_client, ("google.cloud.firestore",), loop_bound=True))
+clients.register(
+    "firestore_watch_client",
+    ClientFactory(_firestore_watch_client, ("google.cloud.firestore",), warm=settings.EVENTS_FANOUT == "firestore"),
+)
+clients.register("storage_client", ClientFactory(_storage_client))
+clients.register(
+    "build_client",
+    ClientFactory(_build_client, ("google.cloud.devtools.cloudbuild_v1.services.cloud_build",), loop_bound=True),
+)
+clients.register("run_client", ClientFactory(_run_client, ("google.cloud.run_v2",), loop_bound=True))
+clients.register("firebase_app", ClientFactory(_firebase_app))
+clients.register("genai", ClientFactory(_genai, warm=settings.AI_PROVIDER == "gemini"))
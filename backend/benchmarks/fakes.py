@@ -0,0 +1,545 @@
+"""
+In-process stand-ins for the Google services the backend talks to.
+
+Each fake implements only the client surface `app/` actually uses and sleeps
+for a configurable latency per call, so the benchmark exercises the real
+request handlers, pipeline and reconciler without credentials or network.
+Async clients sleep with asyncio; sync clients (Storage, Firebase token
+verification) block their thread, exactly like the real libraries do.
+"""
+import asyncio
+import copy
+import hashlib
+import itertools
+import operator
+import os
+import re
+import time
+from dataclasses import dataclass, fields
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from google.api_core.exceptions import NotFound
+
+
+@dataclass
+class Latencies:
+    """Injected per-call latency, in seconds, for each backend."""
+    firestore: float = 0.01
+    gcs: float = 0.03
+    cloud_build: float = 0.05
+    cloud_run: float = 0.03
+    firebase: float = 0.002
+    gemini: float = 0.8
+    # How long a fake build stays WORKING before it reports SUCCESS.
+    build_duration: float = 5.0
+
+    @classmethod
+    def names(cls) -> List[str]:
+        return [field.name for field in fields(cls)]
+
+
+# --- Firestore ---
+
+_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda value, options: value in options,
+}
+
+
+def _resolve_sentinels(data: dict) -> dict:
+    from google.cloud import firestore
+    return {
+        key: datetime.utcnow() if value is firestore.SERVER_TIMESTAMP else value
+        for key, value in data.items()
+    }
+
+
+class FakeSnapshot:
+    def __init__(self, reference: "FakeDocumentRef", data: Optional[dict]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[dict]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field: str) -> Any:
+        return self._data.get(field)
+
+
+class FakeDocumentRef:
+    def __init__(self, client: "FakeFirestoreClient", collection: str, doc_id: str):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def _docs(self) -> Dict[str, dict]:
+        return self._client.data.setdefault(self._collection, {})
+
+    async def get(self, transaction=None) -> FakeSnapshot:
+        await self._client.delay()
+        return FakeSnapshot(self, copy.deepcopy(self._docs.get(self.id)))
+
+    async def set(self, data: dict, merge: bool = False):
+        await self._client.delay()
+        self._apply_set(data, merge)
+
+    async def update(self, data: dict):
+        await self._client.delay()
+        self._apply_update(data)
+
+    async def delete(self):
+        await self._client.delay()
+        self._docs.pop(self.id, None)
+
+    def _apply_set(self, data: dict, merge: bool = False):
+        data = copy.deepcopy(_resolve_sentinels(data))
+        if merge and self.id in self._docs:
+            self._docs[self.id].update(data)
+        else:
+            self._docs[self.id] = data
+
+    def _apply_update(self, data: dict):
+        if self.id not in self._docs:
+            raise NotFound(f"No document to update: {self._collection}/{self.id}")
+        document = self._docs[self.id]
+        for key, value in _resolve_sentinels(data).items():
+            # Dotted paths update nested map fields, e.g. "checkpoints.spec".
+            *parents, leaf = key.split(".")
+            target = document
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[leaf] = copy.deepcopy(value)
+
+
+class _AggregationResult:
+    def __init__(self, value: int):
+        self.value = value
+
+
+class _CountQuery:
+    def __init__(self, query: "FakeQuery"):
+        self._query = query
+
+    async def get(self):
+        await self._query._client.delay()
+        return [[_AggregationResult(len(self._query._matches()))]]
+
+
+class FakeQuery:
+    def __init__(self, client: "FakeFirestoreClient", collection: str, **state):
+        self._client = client
+        self._collection = collection
+        self._filters: Tuple = state.get("filters", ())
+        self._order: Optional[Tuple[str, str]] = state.get("order")
+        self._fields: Optional[List[str]] = state.get("fields")
+        self._limit: Optional[int] = state.get("limit")
+        self._start_after: Optional[str] = state.get("start_after")
+
+    def _with(self, **changes) -> "FakeQuery":
+        state = {
+            "filters": self._filters,
+            "order": self._order,
+            "fields": self._fields,
+            "limit": self._limit,
+            "start_after": self._start_after,
+        }
+        state.update(changes)
+        return FakeQuery(self._client, self._collection, **state)
+
+    def document(self, doc_id: str) -> FakeDocumentRef:
+        return FakeDocumentRef(self._client, self._collection, doc_id)
+
+    def where(self, field: str, op: str, value: Any) -> "FakeQuery":
+        return self._with(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return self._with(order=(field, direction))
+
+    def select(self, field_paths) -> "FakeQuery":
+        return self._with(fields=list(field_paths))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._with(limit=count)
+
+    def start_after(self, snapshot: FakeSnapshot) -> "FakeQuery":
+        return self._with(start_after=snapshot.id)
+
+    def count(self) -> _CountQuery:
+        return _CountQuery(self)
+
+    def _matches(self) -> List[Tuple[str, dict]]:
+        documents = self._client.data.setdefault(self._collection, {})
+        rows = [
+            (doc_id, data) for doc_id, data in documents.items()
+            if all(field in data and _OPERATORS[op](data[field], value) for field, op, value in self._filters)
+        ]
+        if self._order:
+            field, direction = self._order
+            rows = [row for row in rows if row[1].get(field) is not None]
+            rows.sort(key=lambda row: (row[1][field], row[0]), reverse=direction == "DESCENDING")
+        if self._start_after:
+            ids = [doc_id for doc_id, _ in rows]
+            if self._start_after in ids:
+                rows = rows[ids.index(self._start_after) + 1:]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return rows
+
+    async def stream(self):
+        await self._client.delay()
+        for doc_id, data in self._matches():
+            if self._fields is not None:
+                data = {field: data[field] for field in self._fields if field in data}
+            yield FakeSnapshot(self.document(doc_id), copy.deepcopy(data))
+
+
+class FakeWriteBatch:
+    def __init__(self, client: "FakeFirestoreClient"):
+        self._client = client
+        self._sets: List[Tuple[FakeDocumentRef, dict, bool]] = []
+        self._updates: List[Tuple[FakeDocumentRef, dict]] = []
+
+    def set(self, reference: FakeDocumentRef, data: dict, merge: bool = False):
+        self._sets.append((reference, data, merge))
+
+    def update(self, reference: FakeDocumentRef, data: dict):
+        self._updates.append((reference, data))
+
+    async def commit(self):
+        await self._client.delay()
+        # Atomic like the real thing: one missing document fails the whole batch.
+        for reference, _ in self._updates:
+            if reference.id not in reference._docs:
+                raise NotFound(f"No document to update: {reference.id}")
+        for reference, data, merge in self._sets:
+            reference._apply_set(data, merge)
+        for reference, data in self._updates:
+            reference._apply_update(data)
+
+
+class FakeFirestoreClient:
+    """Dict-backed replacement for `firestore.AsyncClient`; transactions are not supported."""
+
+    def __init__(self, latency: float = 0.0, *args, **kwargs):
+        self.latency = latency
+        self.data: Dict[str, Dict[str, dict]] = {}
+
+    async def delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def collection(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    async def get_all(self, references: List[FakeDocumentRef]):
+        await self.delay()
+        for reference in references:
+            yield FakeSnapshot(reference, copy.deepcopy(reference._docs.get(reference.id)))
+
+    def transaction(self):
+        raise NotImplementedError("Run the benchmark with JOB_BACKEND=memory.")
+
+
+# --- Cloud Storage ---
+
+class FakeSigningCredentials:
+    valid = True
+
+    def refresh(self, request):
+        pass
+
+    def sign_bytes(self, payload: bytes) -> bytes:
+        return b"signature"
+
+
+class FakeBlob:
+    def __init__(self, client: "FakeStorageClient", bucket: str, name: str):
+        self._client = client
+        self._bucket = bucket
+        self.name = name
+
+    def upload_from_file(
+        self, file_obj, rewind: bool = False, size: Optional[int] = None, content_type: str = None, timeout=None, retry=None
+    ):
+        self._client.delay()
+        if rewind:
+            file_obj.seek(0)
+        self._client.objects[(self._bucket, self.name)] = file_obj.read()
+
+    def exists(self) -> bool:
+        self._client.delay()
+        return (self._bucket, self.name) in self._client.objects
+
+    @property
+    def size(self) -> Optional[int]:
+        data = self._client.objects.get((self._bucket, self.name))
+        return len(data) if data is not None else None
+
+    def download_as_bytes(self, start: Optional[int] = None, end: Optional[int] = None, timeout=None) -> bytes:
+        self._client.delay()
+        try:
+            data = self._client.objects[(self._bucket, self.name)]
+        except KeyError:
+            raise NotFound(f"gs://{self._bucket}/{self.name}")
+        # `end` is inclusive, as in the real client.
+        return data[start or 0:None if end is None else end + 1]
+
+    def generate_signed_url(self, expiration: timedelta, version: str = "v4", credentials=None) -> str:
+        # Signing is local CPU work in the real client, so it does not sleep.
+        return f"https://storage.googleapis.com/{self._bucket}/{self.name}?X-Goog-Expires={int(expiration.total_seconds())}"
+
+
+class FakeBucket:
+    def __init__(self, client: "FakeStorageClient", name: str):
+        self._client = client
+        self.name = name
+
+    def blob(self, name: str, chunk_size: Optional[int] = None) -> FakeBlob:
+        return FakeBlob(self._client, self.name, name)
+
+    def get_blob(self, name: str, timeout=None) -> Optional[FakeBlob]:
+        self._client.delay()
+        blob = FakeBlob(self._client, self.name, name)
+        return blob if blob.size is not None else None
+
+
+class FakeStorageClient:
+    """Replacement for the synchronous `storage.Client`; objects live in a dict."""
+
+    def __init__(self, latency: float = 0.0, *args, **kwargs):
+        self.latency = latency
+        self.objects: Dict[Tuple[str, str], bytes] = {}
+        self._credentials = FakeSigningCredentials()
+        # Mounted with a sized connection pool like the real client's session; never used.
+        self._http = requests.Session()
+
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def bucket(self, name: str) -> FakeBucket:
+        return FakeBucket(self, name)
+
+
+# --- Cloud Build ---
+
+class _Pager:
+    """Async iterable standing in for the google-api-core async pagers."""
+
+    def __init__(self, items: List[Any]):
+        self._items = items
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for item in self._items:
+            yield item
+
+
+class _Operation:
+    def __init__(self, build):
+        from google.cloud.devtools import cloudbuild_v1
+        self.metadata = cloudbuild_v1.BuildOperationMetadata(build=build)
+
+
+class FakeCloudBuildClient:
+    """
+    Replacement for `CloudBuildAsyncClient`. Builds report WORKING until
+    `build_duration` has passed and SUCCESS afterwards, with an image digest
+    for every listed image and a log object in the logs bucket. A successful
+    build's `gcloud run deploy` step registers the service with the Run fake.
+    """
+
+    def __init__(
+        self,
+        latency: float,
+        build_duration: float,
+        storage: FakeStorageClient,
+        run: "FakeRunClient",
+        logs_bucket: str,
+    ):
+        self.latency = latency
+        self.build_duration = build_duration
+        self.storage = storage
+        self.run = run
+        self.logs_bucket = logs_bucket
+        self._builds: Dict[str, Tuple[Any, float]] = {}
+        self._ids = itertools.count(1)
+
+    async def delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def add_build(self, build_id: str, build=None, finished: bool = True):
+        """Registers a build directly, e.g. to seed services with logs."""
+        from google.cloud.devtools import cloudbuild_v1
+        build = build or cloudbuild_v1.Build()
+        build.id = build_id
+        build.logs_bucket = f"gs://{self.logs_bucket}"
+        started = time.monotonic() - (self.build_duration if finished else 0)
+        self._builds[build_id] = (build, started)
+        log_lines = "".join(f"Step #{i}: benchmark log line\n" for i in range(200))
+        self.storage.objects[(self.logs_bucket, f"log-{build_id}.txt")] = log_lines.encode("utf-8")
+
+    def _snapshot(self, build_id: str):
+        from google.cloud.devtools import cloudbuild_v1
+        build, started = self._builds[build_id]
+        build = cloudbuild_v1.Build(build)
+        if time.monotonic() - started >= self.build_duration:
+            build.status = cloudbuild_v1.Build.Status.SUCCESS
+            digest = f"sha256:{hashlib.sha256(build_id.encode()).hexdigest()}"
+            build.results = cloudbuild_v1.Results(images=[
+                cloudbuild_v1.BuiltImage(name=image, digest=digest) for image in build.images
+            ])
+            for step in build.steps:
+                if "deploy" in step.args:
+                    self.run.register(step.args[step.args.index("deploy") + 1])
+        else:
+            build.status = cloudbuild_v1.Build.Status.WORKING
+        return build
+
+    async def create_build(self, project_id: str, build):
+        await self.delay()
+        build_id = f"bench-build-{next(self._ids)}"
+        self.add_build(build_id, build, finished=False)
+        return _Operation(self._snapshot(build_id))
+
+    async def get_build(self, project_id: str, id: str):
+        await self.delay()
+        if id not in self._builds:
+            raise NotFound(f"Build {id} not found")
+        return self._snapshot(id)
+
+    async def list_builds(self, project_id: str, filter: str = "", page_size: int = 0):
+        await self.delay()
+        wanted = set(re.findall(r'build_id="([^"]+)"', filter))
+        return _Pager([self._snapshot(build_id) for build_id in self._builds if build_id in wanted])
+
+
+# --- Cloud Run ---
+
+class _RunService:
+    def __init__(self, name: str, uri: str):
+        self.name = name
+        self.uri = uri
+
+
+class FakeRunClient:
+    """Replacement for `run_v2.ServicesAsyncClient`; services appear once a fake build deploys them."""
+
+    def __init__(self, latency: float, project_id: str, region: str):
+        self.latency = latency
+        self.project_id = project_id
+        self.region = region
+        self.services: Dict[str, str] = {}
+
+    async def delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    @staticmethod
+    def service_path(project: str, location: str, service: str) -> str:
+        return f"projects/{project}/locations/{location}/services/{service}"
+
+    def register(self, service_name: str):
+        path = self.service_path(self.project_id, self.region, service_name)
+        self.services[path] = f"https://{service_name}-bench.a.run.app"
+
+    async def get_service(self, name: str):
+        await self.delay()
+        if name not in self.services:
+            raise NotFound(f"Service {name} not found")
+        return _RunService(name, self.services[name])
+
+    async def list_services(self, parent: str):
+        await self.delay()
+        return _Pager([
+            _RunService(name, uri) for name, uri in self.services.items() if name.startswith(f"{parent}/")
+        ])
+
+    async def delete_service(self, name: str):
+        await self.delay()
+        if self.services.pop(name, None) is None:
+            raise NotFound(f"Service {name} not found")
+
+    async def close(self):
+        pass
+
+
+# --- Firebase ---
+
+def make_verify_id_token(latency: float):
+    """
+    Replacement for `firebase_admin.auth.verify_id_token`. A token of the form
+    `bench-<uid>` is valid for an hour; anything else is rejected.
+    """
+    def verify_id_token(token: str, *args, **kwargs) -> dict:
+        if latency:
+            time.sleep(latency)
+        if not token.startswith("bench-"):
+            raise ValueError("Not a benchmark token.")
+        now = int(time.time())
+        return {"uid": token.removeprefix("bench-"), "iat": now, "exp": now + 3600}
+    return verify_id_token
+
+
+@dataclass
+class FakeBackends:
+    firestore: FakeFirestoreClient
+    storage: FakeStorageClient
+    build: FakeCloudBuildClient
+    run: FakeRunClient
+
+
+def install(latencies: Latencies) -> FakeBackends:
+    """
+    Points the backend at the fakes. Must run before anything under `app` is
+    imported, because settings are read at import time; the clients created
+    on first use (see `app.state`) then come from the patched classes.
+    """
+    os.environ.setdefault("GCP_PROJECT_ID", "bench-project")
+    os.environ.setdefault("GCP_SOURCE_BUCKET_NAME", "bench-source")
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    os.environ["AI_PROVIDER"] = "fake"
+    os.environ["AI_FAKE_LATENCY_SECONDS"] = str(latencies.gemini)
+    os.environ["JOB_BACKEND"] = "memory"
+    os.environ["ADMISSION_STORE"] = "memory"
+    os.environ["EVENTS_FANOUT"] = "memory"
+    # Every generate request comes from one user, which the per-user limit would mostly turn into 429s.
+    os.environ.setdefault("ADMISSION_ENABLED", "false")
+
+    import firebase_admin
+    from firebase_admin import auth
+    from google.cloud import firestore, storage
+
+    backends = FakeBackends(
+        firestore=FakeFirestoreClient(latencies.firestore),
+        storage=FakeStorageClient(latencies.gcs),
+        build=None,
+        run=FakeRunClient(
+            latencies.cloud_run, os.environ["GCP_PROJECT_ID"], os.environ.get("GCP_REGION", "us-central1")
+        ),
+    )
+    backends.build = FakeCloudBuildClient(
+        latencies.cloud_build, latencies.build_duration, backends.storage, backends.run, logs_bucket="bench-logs"
+    )
+
+    firestore.AsyncClient = lambda *args, **kwargs: backends.firestore
+    storage.Client = lambda *args, **kwargs: backends.storage
+    firebase_admin.initialize_app = lambda *args, **kwargs: None
+    auth.verify_id_token = make_verify_id_token(latencies.firebase)
+    return backends
@@ -0,0 +1,317 @@
+"""
+Offline load benchmark for the backend API.
+
+Runs the real FastAPI app in-process against the fakes in `benchmarks.fakes`
+and drives it over ASGI, so results reflect this code base rather than the
+network or Google's backends. Run from `backend/`:
+
+    python -m benchmarks.run --duration 10 --concurrency 32 --output results.json
+    python -m benchmarks.run --baseline results.json   # compare against an earlier run
+
+Scenarios run one after another (then all together as `mixed`) and each
+reports req/s, latency percentiles, status codes and event-loop lag.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import Counter
+from dataclasses import asdict
+from datetime import datetime
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional
+
+from benchmarks import fakes
+
+if TYPE_CHECKING:
+    # Only for annotations; run() imports it where it is used.
+    import httpx
+
+RequestFn = Callable[["httpx.AsyncClient", int], Awaitable["httpx.Response"]]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize_latencies(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes a task that sleeps `interval` seconds."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def __enter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+    def summary(self) -> Dict[str, float]:
+        return summarize_latencies(self.samples)
+
+
+async def drive(client, request_fn: RequestFn, concurrency: int, duration: float) -> Dict:
+    """Runs `concurrency` closed-loop clients for `duration` seconds."""
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    deadline = time.perf_counter() + duration
+
+    async def user(index: int):
+        iteration = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await request_fn(client, index * 1_000_000 + iteration)
+                statuses[str(response.status_code)] += 1
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+            iteration += 1
+
+    started = time.perf_counter()
+    with LoopLagMonitor() as lag:
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+        "latency": summarize_latencies(latencies),
+        "status_codes": dict(statuses),
+        "event_loop_lag": lag.summary(),
+    }
+
+
+async def drive_mixed(client, request_fns: Dict[str, RequestFn], concurrency: int, duration: float) -> Dict:
+    """Runs every scenario at once, splitting `concurrency` clients between them."""
+    share = max(1, concurrency // len(request_fns))
+    with LoopLagMonitor() as lag:
+        results = await asyncio.gather(*(
+            drive(client, request_fn, share, duration) for request_fn in request_fns.values()
+        ))
+    per_scenario = dict(zip(request_fns, results))
+    return {
+        "requests": sum(result["requests"] for result in results),
+        "requests_per_second": round(sum(result["requests_per_second"] for result in results), 2),
+        "event_loop_lag": lag.summary(),
+        "scenarios": per_scenario,
+    }
+
+
+def seed_services(backends: fakes.FakeBackends, user_id: str, count: int) -> List[str]:
+    """Writes `count` deployed services for a user straight into the fake Firestore."""
+    from app.core.config import settings
+    from app.models.service import ServiceMetadata, ServiceStatus
+
+    documents = backends.firestore.data.setdefault(settings.FIRESTORE_SERVICES_COLLECTION, {})
+    service_ids = []
+    for i in range(count):
+        build_id = f"seed-{user_id}-{i}"
+        source_blob = f"source/{build_id}/service.zip"
+        metadata = ServiceMetadata(
+            user_id=user_id,
+            service_name=f"svc-{i}",
+            prompt=f"A contact form API that stores submissions, number {i}",
+            spec={"service_name": f"svc-{i}", "endpoint": {"path": "/contact", "method": "POST",
+                                                         "model_name": "Contact", "schema_fields": []}},
+            status=ServiceStatus.DEPLOYED,
+            build_id=build_id,
+            source_blob=source_blob,
+            deployed_url=f"https://svc-{i}-bench.a.run.app",
+        )
+        documents[metadata.id] = metadata.model_dump()
+        backends.build.add_build(build_id)
+        backends.storage.objects[(settings.GCP_SOURCE_BUCKET_NAME, source_blob)] = b"PK"
+        service_ids.append(metadata.id)
+    return service_ids
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run(args, latencies: fakes.Latencies, backends: fakes.FakeBackends) -> Dict:
+    import httpx
+
+    import main
+    from app.core import pipeline
+    from app.core.reconciler import reconciler
+    from app.state import clients
+
+    # Start what the lifespan would, minus the Google clients (already faked)
+    # and the signing certificate refresher (it only talks to Google).
+    clients["build_client"] = backends.build
+    clients["run_client"] = backends.run
+    await reconciler.start()
+    await pipeline.workers.start()
+
+    def headers(user_id: str) -> Dict[str, str]:
+        return {"Authorization": f"Bearer bench-{user_id}"}
+
+    detail_user = "detail-user"
+    detail_ids = seed_services(backends, detail_user, 50)
+
+    def list_services(user_id: str) -> RequestFn:
+        async def request(client, i):
+            return await client.get("/api/v1/services/", params={"limit": args.page_size}, headers=headers(user_id))
+        return request
+
+    async def generate(client, i):
+        return await client.post(
+            "/api/v1/services/generate",
+            json={"prompt": f"A contact form API with name, email and message fields, variant {i % args.distinct_prompts}"},
+            headers=headers("generate-user"),
+        )
+
+    async def logs(client, i):
+        return await client.get(f"/api/v1/services/{detail_ids[i % len(detail_ids)]}/logs", headers=headers(detail_user))
+
+    async def artifact(client, i):
+        return await client.get(f"/api/v1/services/{detail_ids[i % len(detail_ids)]}/artifact", headers=headers(detail_user))
+
+    scenarios: Dict[str, RequestFn] = {}
+    for count in args.services_per_user:
+        user_id = f"list-user-{count}"
+        seed_services(backends, user_id, count)
+        scenarios[f"list_services_n{count}"] = list_services(user_id)
+    scenarios["logs"] = logs
+    scenarios["artifact"] = artifact
+    scenarios["generate"] = generate
+
+    results: Dict[str, Dict] = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, request_fn in scenarios.items():
+            if args.scenarios and name not in args.scenarios:
+                continue
+            print(f"Running {name} for {args.duration}s with {args.concurrency} clients...", file=sys.stderr)
+            results[name] = await drive(client, request_fn, args.concurrency, args.duration)
+        if not args.scenarios or "mixed" in args.scenarios:
+            print(f"Running mixed for {args.duration}s with {args.concurrency} clients...", file=sys.stderr)
+            results["mixed"] = await drive_mixed(client, scenarios, args.concurrency, args.duration)
+
+    from app.core.config import settings
+    services = backends.firestore.data.get(settings.FIRESTORE_SERVICES_COLLECTION, {}).values()
+    pipeline_statuses = Counter(service["status"] for service in services if service["user_id"] == "generate-user")
+
+    await pipeline.workers.stop()
+    await reconciler.stop()
+
+    return {
+        "revision": git_revision(),
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "config": {
+            "duration_seconds": args.duration,
+            "concurrency": args.concurrency,
+            "page_size": args.page_size,
+            "services_per_user": args.services_per_user,
+            "distinct_prompts": args.distinct_prompts,
+            "latencies_seconds": asdict(latencies),
+        },
+        "scenarios": results,
+        "generated_services_by_status": dict(pipeline_statuses),
+    }
+
+
+def compare(current: Dict, baseline: Dict):
+    """Prints throughput and p99 changes per scenario relative to a baseline run."""
+    print(f"\nCompared with {baseline.get('revision') or 'baseline'} ({baseline.get('timestamp')}):")
+    print(f"{'scenario':<28}{'req/s':>12}{'change':>10}{'p99 ms':>12}{'change':>10}")
+    for name, result in current["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        rps = result["requests_per_second"]
+        p99 = result.get("latency", {}).get("p99_ms")
+        if previous is None:
+            print(f"{name:<28}{rps:>12.1f}{'new':>10}")
+            continue
+
+        def change(now, before):
+            if now is None or not before:
+                return "-"
+            return f"{(now - before) / before * 100:+.1f}%"
+
+        previous_p99 = previous.get("latency", {}).get("p99_ms")
+        p99_text = f"{p99:>12.1f}" if p99 is not None else f"{'-':>12}"
+        print(f"{name:<28}{rps:>12.1f}{change(rps, previous['requests_per_second']):>10}"
+              f"{p99_text}{change(p99, previous_p99):>10}")
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent closed-loop clients.")
+    parser.add_argument("--services-per-user", type=lambda v: [int(n) for n in v.split(",")], default=[10, 100, 500],
+                        help="Comma-separated service counts; one GET /services scenario per count.")
+    parser.add_argument("--page-size", type=int, default=100, help="`limit` sent with GET /services.")
+    parser.add_argument("--distinct-prompts", type=int, default=50,
+                        help="Prompts POST /generate cycles through; fewer means more spec cache hits.")
+    parser.add_argument("--scenarios", type=lambda v: v.split(","), default=None,
+                        help="Comma-separated subset of scenarios to run, e.g. generate,logs,mixed.")
+    parser.add_argument("--latency", action="append", default=[], metavar="BACKEND=SECONDS",
+                        help=f"Override an injected latency. Backends: {', '.join(fakes.Latencies.names())}.")
+    parser.add_argument("--output", default="benchmark-results.json", help="Where to write the JSON results.")
+    parser.add_argument("--baseline", help="Earlier results file to compare against.")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    latencies = fakes.Latencies()
+    for override in args.latency:
+        name, _, value = override.partition("=")
+        if name not in fakes.Latencies.names():
+            raise SystemExit(f"Unknown backend '{name}'. Expected one of: {', '.join(fakes.Latencies.names())}.")
+        setattr(latencies, name, float(value))
+
+    backends = fakes.install(latencies)
+    results = asyncio.run(run(args, latencies, backends))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps({name: {key: result[key] for key in ("requests_per_second", "latency") if key in result}
+                      for name, result in results["scenarios"].items()}, indent=2))
+    print(f"\nResults written to {os.path.abspath(args.output)}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    # Keep per-request and per-job logging out of the measurements.
+    logging.disable(logging.INFO)
+    main()
@@ -1,31 +1,76 @@
-from fastapi import FastAPI
+from app.core import startup
+
+# Heavy modules are imported one at a time first so the startup report can time each of them.
+startup.report.import_modules(startup.APP_MODULES)
+
+import asyncio
+import hmac
+import math
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from app.api.v1.router import api_router
+from app.core import admission, ai, resilience, spec_validation, telemetry
 from app.core.config import settings
-from app.state import clients # Import the clients dictionary
-from google.cloud.devtools.cloudbuild_v1.services import cloud_build
-from google.cloud import run_v2
+from app.state import clients # Import the shared client registry
+from app.core.reconciler import reconciler
+from app.core.auth import cert_refresher, token_cache
+from app.core.events import broker
+from app.core.signing import signer
+from app.core.pipeline import workers
+from app.core.storage_io import gcs
+
+# Counters the components keep themselves, read at scrape time.
+telemetry.stats.counter("spec_cache_lookups", "Spec cache lookups by outcome.", lambda: ai.cache.stats, label="result")
+telemetry.stats.counter("auth_token_cache_hits", "Verified ID tokens served from the cache.", lambda: token_cache.hits)
+telemetry.stats.counter("auth_token_cache_misses", "ID tokens that needed full verification.", lambda: token_cache.misses)
+telemetry.stats.counter("signed_url_cache_hits", "Artifact links served from the signed URL cache.", lambda: signer.hits)
+telemetry.stats.counter("signed_url_cache_misses", "Artifact links that had to be signed.", lambda: signer.misses)
+telemetry.stats.gauge("reconciler_builds_in_flight", "Cloud Builds tracked by the reconciler.", lambda: reconciler.in_flight)
+telemetry.stats.gauge("status_stream_connections", "Open service status event streams.", lambda: broker.connections)
+telemetry.stats.gauge("job_workers_active", "Generation jobs currently being run by this instance.", lambda: workers.active)
+telemetry.stats.counter("spec_validation_results", "Generated specs that were valid, repaired or rejected.", lambda: spec_validation.stats, label="result")
+telemetry.stats.counter("generation_admission_decisions", "Generation requests admitted or rejected, by reason.", lambda: admission.controller.decisions, label="result")
+telemetry.stats.gauge("gcs_io_in_flight", "GCS calls running on the GCS I/O pool.", lambda: gcs.in_flight, label="operation")
+telemetry.stats.gauge("startup_seconds", "Seconds from process start to each startup phase.", lambda: startup.report.phases, label="phase")
+telemetry.stats.gauge("startup_import_seconds", "Seconds each module took to import at startup.", lambda: startup.report.imports, label="module")
+telemetry.stats.gauge("client_init_seconds", "Seconds each shared client took to create.", lambda: clients.timings, label="client")
+telemetry.stats.gauge("circuit_breaker_state", "Upstream circuit breakers: 0 closed, 1 half open, 2 open.", resilience.breaker_states, label="upstream")
+
+log = telemetry.get_logger("startup")
+startup.report.mark("imported")
+
+
+async def start_background():
+    """Creates the clients, then starts everything that talks to them; runs while the app already serves."""
+    await clients.warm_up()
+    await reconciler.start()
+    await cert_refresher.start()
+    await workers.start()
+
 
 # This is the lifespan event handler.
 # Code before the 'yield' runs on startup.
 # Code after the 'yield' runs on shutdown.
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("Application startup: Initializing Google Cloud clients...")
-    build_client = cloud_build.CloudBuildAsyncClient()
-    run_client = run_v2.ServicesAsyncClient()
-    clients["build_client"] = build_client
-    clients["run_client"] = run_client
-    print("Google Cloud clients initialized successfully.")
-    
+    log.info("Application startup: warming up Google Cloud clients in the background")
+    background = asyncio.create_task(start_background())
+    startup.report.mark("ready")
+
     yield
-    
-    print("Application shutdown: Closing clients.")
-    # Only close clients that have a close method
-    if hasattr(run_client, 'close'):
-        await run_client.close()
-    # CloudBuildAsyncClient doesn't have a close method, so we skip it
+
+    log.info("Application shutdown: closing clients")
+    background.cancel()
+    await asyncio.gather(background, return_exceptions=True)
+    await workers.stop()
+    await reconciler.stop()
+    await cert_refresher.stop()
+    await clients.close()
+    gcs.shutdown()
 
 
 # Pass the lifespan manager to the FastAPI app
@@ -43,8 +88,35 @@ if settings.CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["ETag", "X-Next-Cursor"],
+    )
+
+@app.middleware("http")
+async def bind_trace(request: Request, call_next):
+    # Cloud Run forwards the load balancer's trace; reuse it so our logs join that trace.
+    trace_id = telemetry.parse_cloud_trace_header(request.headers.get("x-cloud-trace-context"))
+    with telemetry.trace(trace_id):
+        if startup.report.mark("first_request"):
+            log.info("Startup report", extra={"fields": startup.report.summary(clients.timings)})
+        return await call_next(request)
+
+@app.exception_handler(resilience.CircuitOpen)
+async def circuit_open(request: Request, exc: resilience.CircuitOpen):
+    # An upstream is failing; tell clients when to come back instead of letting the request hang.
+    return JSONResponse(
+        status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(math.ceil(exc.retry_after))}
     )
 
+@app.get("/metrics", include_in_schema=False)
+def metrics(authorization: Optional[str] = Header(None)):
+    # Served on the public API, so it is off unless a scraper token is configured.
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), settings.METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token.", headers={"WWW-Authenticate": "Bearer"})
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/", tags=["Health Check"])
 def read_root():
     return {"status": "ok"}
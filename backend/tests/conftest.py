@@ -0,0 +1,28 @@
+"""
+Unit tests run offline: settings are read at import time, so the required
+ones are set before anything under `app` is imported, and every Google
+client is replaced per test (see `app.state`) rather than created.
+"""
+import os
+
+os.environ.setdefault("GCP_PROJECT_ID", "test-project")
+os.environ.setdefault("GCP_SOURCE_BUCKET_NAME", "test-source")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("AI_PROVIDER", "fake")
+os.environ.setdefault("JOB_BACKEND", "memory")
+os.environ.setdefault("ADMISSION_STORE", "memory")
+os.environ.setdefault("EVENTS_FANOUT", "memory")
+
+
+import pytest
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """The benchmark's dict-backed Firestore, installed as the shared client; `fake_db.data` holds the documents."""
+    from benchmarks.fakes import FakeFirestoreClient
+    from app.state import clients
+
+    db = FakeFirestoreClient()
+    monkeypatch.setitem(clients._clients, "firestore_client", db)
+    return db
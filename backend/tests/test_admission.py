@@ -0,0 +1,149 @@
+import asyncio
+
+import pytest
+
+from app.core import admission, gcp
+from app.core.admission import AdmissionController, AdmissionRejected, InMemoryAdmissionStore, refill, take
+from app.core.config import settings
+from app.models.service import ServiceStatus
+
+
+def test_refill_caps_at_capacity():
+    assert refill(0.0, 100.0, 110.0, capacity=5, rate=0.2) == 2.0
+    assert refill(4.0, 100.0, 200.0, capacity=5, rate=0.2) == 5
+    # A clock that went backwards adds nothing.
+    assert refill(1.0, 100.0, 90.0, capacity=5, rate=0.2) == 1.0
+
+
+def test_take():
+    assert take(5.0, 1, capacity=5, rate=0.5) == (4.0, 0.0)
+    assert take(0.5, 1, capacity=5, rate=0.5) == (0.5, 1.0)
+    # A batch above the burst needs a full bucket and leaves it in debt.
+    assert take(5.0, 8, capacity=5, rate=0.5) == (-3.0, 0.0)
+    assert take(4.0, 8, capacity=5, rate=0.5) == (4.0, 2.0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, "time", lambda: now[0])
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_memory_store_waits_for_refill(clock):
+    store = InMemoryAdmissionStore()
+    for _ in range(3):
+        assert asyncio.run(store.take("u", 1, capacity=3, rate=0.1)) == 0
+    assert asyncio.run(store.take("u", 1, capacity=3, rate=0.1)) == pytest.approx(10.0)
+    assert asyncio.run(store.take("other", 1, capacity=3, rate=0.1)) == 0
+
+    clock[0] += 10
+    assert asyncio.run(store.take("u", 1, capacity=3, rate=0.1)) == 0
+
+
+def test_memory_store_drops_least_recent_buckets(clock):
+    store = InMemoryAdmissionStore(max_entries=2)
+    for key in ("a", "b", "a", "c"):
+        asyncio.run(store.take(key, 1, capacity=3, rate=0.1))
+    assert list(store._buckets) == ["a", "c"]
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    for name, value in {
+        "ADMISSION_ENABLED": True,
+        "ADMISSION_MAX_PENDING": 10,
+        "ADMISSION_MAX_BUILDING": 4,
+        "ADMISSION_USER_RATE_PER_MINUTE": 6.0,
+        "ADMISSION_USER_BURST": 2,
+        "ADMISSION_LOAD_TTL_SECONDS": 5.0,
+        "ADMISSION_RETRY_AFTER_SECONDS": 30,
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+
+
+def counted(monkeypatch, load):
+    """Serves `load` (or raises it) as the service counts; returns the list of count calls."""
+    calls = []
+
+    async def count_services_by_status(statuses):
+        calls.append(statuses)
+        if isinstance(load, Exception):
+            raise load
+        return dict(load)
+
+    monkeypatch.setattr(gcp, "count_services_by_status", count_services_by_status)
+    return calls
+
+
+def rejection(controller, user_id="u", cost=1) -> AdmissionRejected:
+    with pytest.raises(AdmissionRejected) as rejected:
+        asyncio.run(controller.admit(user_id, cost))
+    return rejected.value
+
+
+def test_user_rate_limit(monkeypatch, limits, clock):
+    counted(monkeypatch, {})
+    controller = AdmissionController(InMemoryAdmissionStore())
+    asyncio.run(controller.admit("u"))
+    asyncio.run(controller.admit("u"))
+
+    rejected = rejection(controller)
+    assert rejected.reason == "user_rate"
+    assert rejected.retry_after == 10
+    asyncio.run(controller.admit("someone-else"))
+    assert controller.decisions == {"admitted": 3, "user_rate": 1}
+
+
+def test_global_caps_reject_before_spending_tokens(monkeypatch, limits, clock):
+    counted(monkeypatch, {ServiceStatus.PENDING: 9, ServiceStatus.BUILDING: 0})
+    store = InMemoryAdmissionStore()
+    controller = AdmissionController(store)
+
+    rejected = rejection(controller, cost=2)
+    assert (rejected.reason, rejected.retry_after) == ("queue_full", 30)
+    assert store._buckets == {}
+
+    asyncio.run(controller.admit("u"))
+    # Counted from this instance's own admissions until the counts are read again.
+    assert rejection(controller).reason == "queue_full"
+
+
+def test_builds_saturated(monkeypatch, limits, clock):
+    counted(monkeypatch, {ServiceStatus.BUILDING: 4})
+    assert rejection(AdmissionController(InMemoryAdmissionStore())).reason == "builds_saturated"
+
+
+def test_counts_are_reused_until_they_expire(monkeypatch, limits, clock):
+    calls = counted(monkeypatch, {})
+    controller = AdmissionController(InMemoryAdmissionStore())
+    asyncio.run(controller.admit("a"))
+    asyncio.run(controller.admit("b"))
+    assert len(calls) == 1
+    assert controller._admitted_since_load == 2
+
+    clock[0] += 5
+    asyncio.run(controller.admit("c"))
+    assert len(calls) == 2
+    assert controller._admitted_since_load == 1
+
+
+class BrokenStore(admission.AdmissionStore):
+    async def take(self, key, cost, capacity, rate):
+        raise ConnectionError("firestore unavailable")
+
+
+def test_unavailable_store_and_counts_admit(monkeypatch, limits, clock):
+    counted(monkeypatch, ConnectionError("firestore unavailable"))
+    controller = AdmissionController(BrokenStore())
+    for _ in range(5):
+        asyncio.run(controller.admit("u"))
+    assert controller.decisions == {"admitted": 5}
+
+
+def test_disabled_admits_everything(monkeypatch, limits):
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", False)
+    calls = counted(monkeypatch, {ServiceStatus.PENDING: 100})
+    asyncio.run(AdmissionController(BrokenStore()).admit("u", cost=50))
+    assert calls == []
@@ -0,0 +1,127 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import build_profiles, gcp, generation, pipeline, runtimes
+from app.core.config import settings
+from app.core.reconciler import BuildReconciler
+from app.models.service import ServiceMetadata, ServiceStatus
+
+SPEC = {
+    "service_name": "contact-form-api",
+    "endpoint": {
+        "path": "/contacts",
+        "method": "POST",
+        "model_name": "Contact",
+        "schema_fields": [{"name": "name", "type": "str", "required": True}],
+    },
+}
+
+
+def test_source_hash():
+    files = {"main.py": "app = 1\n", "models.py": "class Contact: ...\n"}
+    assert generation.source_hash(files) == generation.source_hash(dict(reversed(files.items())))
+    assert generation.source_hash(files) != generation.source_hash({**files, "main.py": "app = 2\n"})
+    assert generation.source_hash(files) != generation.source_hash({**files, "extra.py": ""})
+    # Paths and contents are delimited, so moving text between them changes the hash.
+    assert generation.source_hash({"a": "bc"}) != generation.source_hash({"ab": "c"})
+
+
+def package(spec: dict) -> generation.SourceArchive:
+    runtime = runtimes.runtime_for(None)
+    return pipeline.package_service(spec, spec["service_name"], build_profiles.get_profile(), runtime)
+
+
+def test_identical_specs_package_to_the_same_hash():
+    first, second = package(SPEC), package(SPEC)
+    changed = package({**SPEC, "endpoint": {**SPEC["endpoint"], "method": "PUT"}})
+    try:
+        # Archive names are unique per packaging; the hash only covers the rendered files.
+        assert first.filename != second.filename
+        assert first.content_hash == second.content_hash
+        assert changed.content_hash != first.content_hash
+    finally:
+        for archive in (first, second, changed):
+            archive.close()
+
+
+@pytest.fixture
+def uploads(monkeypatch, fake_db):
+    monkeypatch.setattr(settings, "ARTIFACT_DEDUP_ENABLED", True)
+    monkeypatch.setattr(settings, "SMOKE_TEST_ENABLED", False)
+    uploaded = []
+
+    async def upload_source_to_gcs(source, blob_name, size=None):
+        uploaded.append(blob_name)
+        return f"gs://bucket/{blob_name}"
+
+    monkeypatch.setattr(gcp, "upload_source_to_gcs", upload_source_to_gcs)
+    return uploaded
+
+
+def store(service_id: str) -> dict:
+    metadata = ServiceMetadata(id=service_id, user_id="user-1", service_name=SPEC["service_name"], prompt="p", spec=SPEC)
+    archive = package(SPEC)
+    try:
+        return asyncio.run(pipeline.store_source(metadata, archive, runtimes.runtime_for(None), {}))
+    finally:
+        archive.close()
+
+
+def test_identical_source_is_uploaded_once(uploads, fake_db):
+    first = store("svc-1")
+    second = store("svc-2")
+
+    assert len(uploads) == 1
+    assert second == first
+    assert first["source_blob"].startswith("source/svc-1/")
+    assert fake_db.data["artifacts"][first["source_hash"]]["gcs_uri"] == first["gcs_uri"]
+
+
+def test_built_source_reuses_its_image(uploads):
+    first = store("svc-1")
+    image = "us-docker.pkg.dev/p/repo/contact-form-api@sha256:" + "a" * 64
+    asyncio.run(gcp.record_artifact_image(first["source_hash"], image))
+
+    reused = store("svc-2")
+    assert reused["image"] == image
+    # No gcs_uri: there is nothing left to build.
+    assert "gcs_uri" not in reused
+    assert len(uploads) == 1
+
+
+def test_dedup_disabled_uploads_every_source(uploads, monkeypatch, fake_db):
+    monkeypatch.setattr(settings, "ARTIFACT_DEDUP_ENABLED", False)
+    store("svc-1")
+    store("svc-2")
+    assert len(uploads) == 2
+    assert "artifacts" not in fake_db.data
+
+
+def test_deployed_build_records_its_image(uploads, monkeypatch, fake_db):
+    source = store("svc-1")
+    image_name = build_profiles.image_name_for(SPEC["service_name"])
+    service = ServiceMetadata(
+        id="svc-1", user_id="user-1", service_name=SPEC["service_name"], prompt="p",
+        status=ServiceStatus.BUILDING, build_id="b1", source_hash=source["source_hash"],
+    )
+    fake_db.data["services"] = {"svc-1": service.model_dump()}
+
+    async def get_builds(build_ids):
+        results = SimpleNamespace(images=[SimpleNamespace(name=image_name, digest="sha256:" + "b" * 64)])
+        return {"b1": SimpleNamespace(id="b1", status=SimpleNamespace(name="SUCCESS"), steps=[], results=results)}
+
+    async def get_service_urls(region):
+        return {SPEC["service_name"]: "https://contact-form-api.run.app"}
+
+    monkeypatch.setattr(gcp, "get_builds", get_builds)
+    monkeypatch.setattr(gcp, "get_service_urls", get_service_urls)
+    reconciler = BuildReconciler(poll_interval=60)
+    reconciler.track(service)
+    asyncio.run(reconciler.poll_once())
+
+    image = image_name.rsplit(":", 1)[0] + "@sha256:" + "b" * 64
+    assert fake_db.data["artifacts"][source["source_hash"]]["image"] == image
+    assert fake_db.data["services"]["svc-1"]["image"] == image
+    assert fake_db.data["services"]["svc-1"]["status"] == ServiceStatus.DEPLOYED
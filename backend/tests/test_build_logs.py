@@ -0,0 +1,79 @@
+import asyncio
+import gzip
+
+import pytest
+
+from app.core import build_logs, gcp
+from app.core.build_logs import RangeNotSatisfiable, accepts_gzip, parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 100)),
+    ("bytes=100-", (100, 1000)),
+    ("bytes=-100", (900, 1000)),
+    ("bytes=-5000", (0, 1000)),
+    ("bytes=990-5000", (990, 1000)),
+    ("bytes=0-1,5-9", None),
+    ("items=0-9", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=-0", "bytes=5-4"])
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1000)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ("gzip", True),
+    ("br, gzip;q=0.5", True),
+    ("GZIP", True),
+    ("x-gzip", True),
+    ("gzip;q=0", False),
+    ("gzip; q=0.0, br", False),
+    ("*", True),
+    ("*;q=0", False),
+    ("gzip;q=0, *", False),
+    ("br, deflate", False),
+    ("gzip;q=bogus", False),
+])
+def test_accepts_gzip(header, expected):
+    assert accepts_gzip(header) is expected
+
+
+@pytest.fixture
+def log_object(monkeypatch):
+    """A build log in fake GCS, read in small windows so tail_offset crosses window boundaries."""
+    content = b"".join(f"line {i}\n".encode() for i in range(1, 101))
+
+    async def read_object_range(bucket, object_name, start, end):
+        return content[start:end]
+
+    monkeypatch.setattr(gcp, "read_object_range", read_object_range)
+    monkeypatch.setattr(build_logs, "TAIL_WINDOW_BYTES", 16)
+    return content, gcp.BuildLog(bucket="logs", object_name="log-b1.txt", size=len(content))
+
+
+@pytest.mark.parametrize("lines", [1, 3, 50, 100, 500])
+def test_tail_offset(log_object, lines):
+    content, log = log_object
+    offset = asyncio.run(build_logs.tail_offset(log, lines))
+    assert content[offset:] == b"".join(content.splitlines(keepends=True)[-lines:])
+
+
+def test_gzip_stream_round_trips():
+    async def chunks():
+        for i in range(10):
+            yield f"chunk {i}\n".encode()
+
+    async def collect(flush_each):
+        return b"".join([data async for data in build_logs.gzip_stream(chunks(), flush_each=flush_each)])
+
+    expected = b"".join(f"chunk {i}\n".encode() for i in range(10))
+    assert gzip.decompress(asyncio.run(collect(False))) == expected
+    assert gzip.decompress(asyncio.run(collect(True))) == expected
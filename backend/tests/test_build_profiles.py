@@ -0,0 +1,65 @@
+import zipfile
+
+import pytest
+
+from app.core import build_profiles, pipeline, runtimes
+from app.core.build_profiles import CACHE_FROM_SUBSTITUTION
+
+SPEC = {
+    "service_name": "cache-check",
+    "endpoint": {
+        "path": "/items",
+        "method": "POST",
+        "model_name": "Item",
+        "schema_fields": [{"name": "name", "type": "str", "required": True}],
+    },
+}
+PREVIOUS = "us-central1-docker.pkg.dev/p/repo/cache-check@sha256:" + "a" * 64
+
+
+@pytest.mark.parametrize("profile_name", build_profiles.profiles())
+def test_configs_validate(profile_name):
+    profile = build_profiles.get_profile(profile_name)
+    image = build_profiles.image_name_for("svc")
+    for cache_from in (None, PREVIOUS):
+        config = build_profiles.build_config(profile, image, "svc", runtimes.runtime_for(None), cache_from)
+        assert build_profiles.validate_config(config) == []
+
+
+def test_cache_from_is_a_substitution():
+    profile = build_profiles.get_profile("cached")
+    image = build_profiles.image_name_for("svc")
+
+    default = build_profiles.build_config(profile, image, "svc")
+    rebuild = build_profiles.build_config(profile, image, "svc", cache_from=PREVIOUS)
+    # Only the substitution value differs; the steps never name the previous image.
+    assert default["substitutions"] == {CACHE_FROM_SUBSTITUTION: image}
+    assert rebuild["substitutions"] == {CACHE_FROM_SUBSTITUTION: PREVIOUS}
+    assert rebuild["steps"] == default["steps"]
+    assert "${_CACHE_FROM}" in default["steps"][1]["args"]
+
+
+def test_unused_substitution_is_a_problem():
+    profile = build_profiles.get_profile("standard")
+    config = build_profiles.build_config(profile, build_profiles.image_name_for("svc"), "svc")
+    assert "substitutions" not in config
+
+    config["substitutions"] = {"_UNUSED": "x"}
+    assert "substitution _UNUSED is not used by any step" in build_profiles.validate_config(config)
+
+
+@pytest.mark.parametrize("runtime_name", runtimes.RUNTIMES)
+def test_packaged_config_does_not_change_the_source_hash(runtime_name):
+    profile = build_profiles.get_profile("cached")
+    runtime = runtimes.runtime_for(runtime_name)
+    first = pipeline.package_service(SPEC, "cache-check", profile, runtime)
+    second = pipeline.package_service(SPEC, "cache-check", profile, runtime)
+    try:
+        assert first.content_hash == second.content_hash
+        with zipfile.ZipFile(first.fileobj) as archive:
+            packaged = archive.read("cloudbuild.yaml").decode()
+    finally:
+        first.close()
+        second.close()
+    assert "substitutions:" in packaged
+    assert f'{CACHE_FROM_SUBSTITUTION}: "{build_profiles.image_name_for("cache-check")}"' in packaged
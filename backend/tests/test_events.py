@@ -0,0 +1,146 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import events
+from app.core.events import FirestoreStatusBroker
+from app.state import clients
+
+
+class FakeWatch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.stopped = threading.Event()
+
+    def unsubscribe(self):
+        self.stopped.set()
+
+    def send(self, *changes):
+        """Calls back from another thread, as the Firestore listener does."""
+        thread = threading.Thread(target=self.callback, args=([], list(changes), None))
+        thread.start()
+        thread.join()
+
+
+class FakeWatchClient:
+    def __init__(self):
+        self.watches = {}
+
+    def collection(self, name):
+        return self
+
+    def where(self, field, op, value):
+        self.user_id = value
+        return self
+
+    def on_snapshot(self, callback):
+        watch = FakeWatch(callback)
+        self.watches[self.user_id] = watch
+        return watch
+
+
+def change(kind, service_id, **data):
+    document = SimpleNamespace(id=service_id, to_dict=lambda: {"service_name": "svc", **data})
+    return SimpleNamespace(type=SimpleNamespace(name=kind), document=document)
+
+
+@pytest.fixture
+def watch_client(monkeypatch):
+    client = FakeWatchClient()
+    monkeypatch.setattr(clients, "_clients", {"firestore_watch_client": client})
+    return client
+
+
+def drain(queue):
+    deltas = []
+    while not queue.empty():
+        deltas.append(queue.get_nowait())
+    return deltas
+
+
+def test_changes_from_other_instances_reach_the_stream(watch_client):
+    broker = FirestoreStatusBroker("services")
+
+    async def scenario():
+        queue = await broker.subscribe("u1")
+        watch = watch_client.watches["u1"]
+        # The first snapshot is the current state, not a change.
+        watch.send(change("ADDED", "s1", status="BUILDING"))
+        await asyncio.sleep(0)
+        assert drain(queue) == []
+
+        watch.send(change("MODIFIED", "s1", status="DEPLOYED", deployed_url="https://s1.run.app"))
+        watch.send(change("ADDED", "s2", status="PENDING"), change("REMOVED", "s0", status="FAILED"))
+        await asyncio.sleep(0)
+        return drain(queue)
+
+    deltas = asyncio.run(scenario())
+    assert [(delta["id"], delta["status"]) for delta in deltas] == [("s1", "DEPLOYED"), ("s2", "PENDING")]
+    assert deltas[0]["deployed_url"] == "https://s1.run.app"
+
+
+def test_local_publish_is_not_delivered_twice(watch_client):
+    broker = FirestoreStatusBroker("services")
+
+    async def scenario():
+        queue = await broker.subscribe("u1")
+        watch = watch_client.watches["u1"]
+        watch.send()
+        await asyncio.sleep(0)
+
+        broker.publish("u1", {"id": "s1", "status": "DEPLOYED", "deployed_url": "https://s1.run.app"})
+        # The same transition, as the listener sees the write.
+        watch.send(change("MODIFIED", "s1", status="DEPLOYED", deployed_url="https://s1.run.app", error_message=None))
+        await asyncio.sleep(0)
+        return drain(queue)
+
+    assert [delta["status"] for delta in asyncio.run(scenario())] == ["DEPLOYED"]
+
+
+def test_one_listener_per_user_stopped_with_the_last_stream(watch_client):
+    broker = FirestoreStatusBroker("services")
+
+    async def scenario():
+        first, second = await asyncio.gather(broker.subscribe("u1"), broker.subscribe("u1"))
+        watch = watch_client.watches["u1"]
+        broker.unsubscribe("u1", first)
+        assert not watch.stopped.is_set()
+        broker.unsubscribe("u1", second)
+        await asyncio.to_thread(watch.stopped.wait, 1)
+        return watch
+
+    watch = asyncio.run(scenario())
+    assert watch.stopped.is_set()
+    assert broker._watches == {}
+    assert broker.connections == 0
+
+
+def test_streams_work_without_a_listener(monkeypatch):
+    class Unavailable:
+        def collection(self, name):
+            raise ConnectionError("firestore unavailable")
+
+    monkeypatch.setattr(clients, "_clients", {"firestore_watch_client": Unavailable()})
+    broker = FirestoreStatusBroker("services")
+
+    async def scenario():
+        queue = await broker.subscribe("u1")
+        broker.publish("u1", {"id": "s1", "status": "FAILED"})
+        return drain(queue)
+
+    assert asyncio.run(scenario()) == [{"id": "s1", "status": "FAILED"}]
+
+
+def test_memory_broker_drops_oldest_for_slow_clients():
+    broker = events.StatusBroker(queue_size=2)
+
+    async def scenario():
+        queue = await broker.subscribe("u1")
+        for status in ("PENDING", "BUILDING", "DEPLOYED"):
+            broker.publish("u1", {"id": "s1", "status": status})
+        broker.publish("u2", {"id": "s9", "status": "FAILED"})
+        return drain(queue)
+
+    assert [delta["status"] for delta in asyncio.run(scenario())] == ["BUILDING", "DEPLOYED"]
@@ -0,0 +1,217 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import jobs
+from app.core.jobs import InMemoryJobBackend, Job, JobState, LeaseLost, WorkerPool
+
+
+def leased(backend: InMemoryJobBackend, lease_seconds: float = 60) -> Job:
+    job = asyncio.run(backend.lease(lease_seconds))
+    assert job is not None
+    return job
+
+
+def test_lease_complete():
+    backend = InMemoryJobBackend()
+    asyncio.run(backend.enqueue(Job(kind="k")))
+
+    job = leased(backend)
+    assert job.attempts == 1
+    assert asyncio.run(backend.lease(60)) is None
+
+    asyncio.run(backend.complete(job))
+    assert backend.jobs[job.id].state == JobState.DONE
+
+
+def test_retry_makes_job_visible_again():
+    backend = InMemoryJobBackend()
+    asyncio.run(backend.enqueue(Job(kind="k")))
+
+    job = leased(backend)
+    asyncio.run(backend.retry(job, "boom", delay=0))
+
+    again = leased(backend)
+    assert again.id == job.id
+    assert again.attempts == 2
+    assert backend.jobs[job.id].last_error == "boom"
+
+
+def test_expired_lease_rejects_writes():
+    backend = InMemoryJobBackend()
+    asyncio.run(backend.enqueue(Job(kind="k")))
+
+    stale = leased(backend, lease_seconds=0)
+    current = leased(backend)
+    assert current.lease_id != stale.lease_id
+
+    for write in (
+        backend.extend(stale, 60),
+        backend.checkpoint(stale, "spec", {}),
+        backend.complete(stale),
+        backend.retry(stale, "late", 0),
+        backend.fail(stale, "late"),
+    ):
+        with pytest.raises(LeaseLost):
+            asyncio.run(write)
+    assert backend.jobs[current.id].state == JobState.PENDING
+    assert backend.jobs[current.id].checkpoints == {}
+
+    asyncio.run(backend.complete(current))
+    assert backend.jobs[current.id].state == JobState.DONE
+
+
+def test_run_stage_skips_checkpointed_stages():
+    backend = InMemoryJobBackend()
+    asyncio.run(backend.enqueue(Job(kind="k")))
+    job = leased(backend)
+    calls = []
+
+    async def stage():
+        calls.append(1)
+        return {"ok": True}
+
+    assert asyncio.run(jobs.run_stage(backend, job, "spec", stage)) == {"ok": True}
+    assert asyncio.run(jobs.run_stage(backend, job, "spec", stage)) == {"ok": True}
+    assert len(calls) == 1
+    assert backend.jobs[job.id].checkpoints == {"spec": {"ok": True}}
+
+
+class FailingWrites(InMemoryJobBackend):
+    """Raises a transient error from the next `failures` retry/fail writes."""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    async def _maybe_fail(self):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("firestore unavailable")
+
+    async def retry(self, job, error, delay):
+        await self._maybe_fail()
+        await super().retry(job, error, delay)
+
+    async def fail(self, job, error):
+        await self._maybe_fail()
+        await super().fail(job, error)
+
+
+async def run_pool(backend, handler, on_failure=None, permanent_errors=(), until=None, lease_seconds=60.0):
+    async def no_op(job, error):
+        pass
+
+    pool = WorkerPool(
+        backend, handler, on_failure or no_op,
+        workers=1, lease_seconds=lease_seconds, poll_interval=0.01, permanent_errors=permanent_errors,
+    )
+    await pool.start()
+    try:
+        for _ in range(200):
+            if until():
+                break
+            await asyncio.sleep(0.01)
+        return pool._tasks[0].done()
+    finally:
+        await pool.stop()
+
+
+def test_worker_survives_failed_outcome_write():
+    backend = FailingWrites(failures=1)
+    handled = []
+
+    async def handler(job):
+        handled.append(job.payload["n"])
+        if job.payload["n"] == 1:
+            raise RuntimeError("transient")
+
+    async def scenario():
+        await backend.enqueue(Job(kind="k", payload={"n": 1}))
+        await backend.enqueue(Job(kind="k", payload={"n": 2}))
+        worker_died = await run_pool(backend, handler, until=lambda: 2 in handled)
+        return worker_died
+
+    assert asyncio.run(scenario()) is False
+    assert 2 in handled
+    first = next(job for job in backend.jobs.values() if job.payload["n"] == 1)
+    # The retry was never recorded, so the job waits for its lease to expire.
+    assert first.state == JobState.PENDING
+    assert first.lease_id is not None
+
+
+def test_permanent_error_fails_job_and_calls_on_failure():
+    backend = InMemoryJobBackend()
+    failures = []
+
+    async def handler(job):
+        raise ValueError("bad spec")
+
+    async def on_failure(job, error):
+        failures.append((job.id, str(error)))
+
+    async def scenario():
+        job = Job(kind="k", max_attempts=5)
+        await backend.enqueue(job)
+        await run_pool(backend, handler, on_failure, permanent_errors=(ValueError,), until=lambda: failures)
+        return job.id
+
+    job_id = asyncio.run(scenario())
+    assert failures == [(job_id, "bad spec")]
+    assert backend.jobs[job_id].state == JobState.FAILED
+    assert backend.jobs[job_id].attempts == 1
+
+
+def test_worker_abandons_job_after_losing_its_lease():
+    backend = InMemoryJobBackend()
+    outcomes = []
+
+    async def handler(job):
+        # The lease expires and another worker leases the job while this one is still running.
+        backend.jobs[job.id].lease_id = "someone-else"
+        await asyncio.sleep(0)
+        outcomes.append("ran")
+
+    async def on_failure(job, error):
+        outcomes.append("failed")
+
+    async def scenario():
+        job = Job(kind="k")
+        await backend.enqueue(job)
+        worker_died = await run_pool(backend, handler, on_failure, until=lambda: outcomes)
+        return job.id, worker_died
+
+    job_id, worker_died = asyncio.run(scenario())
+    assert not worker_died
+    assert outcomes == ["ran"]
+    assert backend.jobs[job_id].state == JobState.PENDING
+
+
+class FakeSnapshot:
+    def __init__(self, data):
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeRef:
+    def __init__(self, data):
+        self.data = data
+
+    async def get(self, transaction=None):
+        return FakeSnapshot(self.data)
+
+
+def test_firestore_update_compares_lease():
+    ref = FakeRef({"lease_id": "current", "state": JobState.PENDING})
+    updates = []
+    transaction = SimpleNamespace(update=lambda ref, changes: updates.append(changes))
+
+    assert asyncio.run(jobs._update_leased_job(transaction, ref, "stale", {"state": JobState.DONE})) is False
+    assert updates == []
+    assert asyncio.run(jobs._update_leased_job(transaction, ref, "current", {"state": JobState.DONE})) is True
+    assert updates == [{"state": JobState.DONE}]
+    assert asyncio.run(jobs._update_leased_job(transaction, FakeRef(None), "current", {})) is False
@@ -0,0 +1,120 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+import main
+from app.core.auth import get_current_user
+from app.models.service import ServiceMetadata
+
+START = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def api(monkeypatch, fake_db):
+    """GET against /services as user-1, whose five services were created a minute apart (svc-0 first)."""
+    async def user():
+        return {"uid": "user-1"}
+
+    monkeypatch.setattr(main.app, "dependency_overrides", {get_current_user: user})
+    services = [
+        ServiceMetadata(
+            id=f"svc-{i}", user_id="user-1", service_name=f"svc-{i}", prompt=f"prompt {i}", spec={"service_name": f"svc-{i}"},
+            created_at=START + timedelta(minutes=i), updated_at=START + timedelta(minutes=i),
+        )
+        for i in range(5)
+    ]
+    services.append(ServiceMetadata(id="other", user_id="user-2", service_name="other", prompt="p", created_at=START))
+    fake_db.data["services"] = {service.id: service.model_dump() for service in services}
+
+    def get(path="/api/v1/services/", **kwargs) -> httpx.Response:
+        async def request():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.get(path, **kwargs)
+
+        return asyncio.run(request())
+
+    return get
+
+
+def ids(response: httpx.Response):
+    assert response.status_code == 200, response.text
+    return [service["id"] for service in response.json()]
+
+
+def test_pages_follow_the_cursor(api):
+    pages, cursor = [], None
+    while True:
+        response = api(params={"limit": 2, **({"start_after": cursor} if cursor else {})})
+        pages.append(ids(response))
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert pages == [["svc-4", "svc-3"], ["svc-2", "svc-1"], ["svc-0"]]
+
+
+@pytest.mark.parametrize("cursor", ["missing", "other"])
+def test_cursor_must_be_one_of_the_callers_services(api, cursor):
+    assert api(params={"start_after": cursor}).status_code == 400
+
+
+def test_detail_fields_only_when_included(api):
+    summary = api().json()[0]
+    assert "prompt" not in summary and "spec" not in summary and "revisions" not in summary
+    assert summary["status"] == "PENDING"
+
+    detailed = api(params={"include": "prompt,spec"}).json()[0]
+    assert detailed["prompt"] == "prompt 4"
+    assert detailed["spec"] == {"service_name": "svc-4"}
+    assert "revisions" not in detailed
+
+    assert api(params={"include": "prompt,secrets"}).status_code == 400
+
+
+def test_unchanged_list_is_304(api):
+    first = api()
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    assert api().headers["ETag"] == etag
+
+    for if_none_match in (etag, etag.removeprefix("W/"), f'"stale", {etag}', "*"):
+        response = api(headers={"If-None-Match": if_none_match})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+    assert api(headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_etag_varies_with_the_query(api):
+    etags = {
+        api().headers["ETag"],
+        api(params={"limit": 2}).headers["ETag"],
+        api(params={"limit": 2, "start_after": "svc-3"}).headers["ETag"],
+        api(params={"include": "prompt"}).headers["ETag"],
+    }
+    assert len(etags) == 4
+    # The order of include fields does not matter.
+    assert api(params={"include": "spec,prompt"}).headers["ETag"] == api(params={"include": "prompt,spec"}).headers["ETag"]
+
+
+def test_etag_changes_with_updates_and_deletes(api, fake_db):
+    etag = api().headers["ETag"]
+
+    fake_db.data["services"]["svc-1"].update(status="DEPLOYED", updated_at=START + timedelta(hours=1))
+    response = api(headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()[3]["status"] == "DEPLOYED"
+    etag = response.headers["ETag"]
+
+    # Deleting anything but the newest update changes only the count.
+    del fake_db.data["services"]["svc-2"]
+    response = api(headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "svc-2" not in ids(response)
+
+    # Another user's changes do not invalidate this user's list.
+    etag = response.headers["ETag"]
+    fake_db.data["services"]["other"]["updated_at"] = START + timedelta(days=1)
+    assert api(headers={"If-None-Match": etag}).status_code == 304
@@ -0,0 +1,36 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from app.core.config import settings
+
+
+def scrape(headers=None) -> httpx.Response:
+    async def request():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/metrics", headers=headers)
+
+    return asyncio.run(request())
+
+
+def test_metrics_are_off_without_a_token(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", None)
+    assert scrape({"Authorization": "Bearer anything"}).status_code == 404
+
+
+@pytest.mark.parametrize("authorization", [None, "Bearer wrong", "Basic s3cret", "s3cret", "Bearer ünïcode".encode()])
+def test_metrics_reject_a_wrong_token(monkeypatch, authorization):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "s3cret")
+    response = scrape({"Authorization": authorization} if authorization else None)
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
+
+
+def test_metrics_with_the_token(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "s3cret")
+    response = scrape({"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert "circuit_breaker_state" in response.text
@@ -0,0 +1,154 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import gcp
+from app.core.reconciler import BuildReconciler
+from app.models.service import ServiceMetadata, ServiceStatus
+
+
+def building(build_id: str, service_id: str = "svc-1") -> ServiceMetadata:
+    return ServiceMetadata(
+        id=service_id, user_id="user-1", service_name=service_id, prompt="p", status=ServiceStatus.BUILDING, build_id=build_id
+    )
+
+
+def build(build_id: str, status: str, steps=()):
+    return SimpleNamespace(id=build_id, status=SimpleNamespace(name=status), steps=list(steps), results=SimpleNamespace(images=[]))
+
+
+def chain(service_name: str, *statuses: str):
+    """The steps of one service in a combined build, each waiting for the one before it."""
+    steps, previous = [], "-"
+    for name, status in zip(("fetch", "build", "push", "deploy"), statuses):
+        step_id = f"{service_name}-{name}"
+        steps.append(SimpleNamespace(id=step_id, status=SimpleNamespace(name=status), wait_for=[previous]))
+        previous = step_id
+    return steps
+
+
+class FakeFirestore:
+    """Stands in for the gcp write helpers; fails the next `failures` writes."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.writes = []
+
+    async def update_services_batch(self, updates):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("firestore unavailable")
+        self.writes.append(dict(updates))
+        return list(updates)
+
+    async def update_service_fields(self, service_id, changes):
+        await self.update_services_batch({service_id: changes})
+
+
+@pytest.fixture
+def firestore(monkeypatch):
+    fake = FakeFirestore()
+    monkeypatch.setattr(gcp, "update_services_batch", fake.update_services_batch)
+    monkeypatch.setattr(gcp, "update_service_fields", fake.update_service_fields)
+    return fake
+
+
+def poll(reconciler: BuildReconciler, monkeypatch, *builds):
+    async def get_builds(build_ids):
+        return {b.id: b for b in builds if b.id in build_ids}
+
+    monkeypatch.setattr(gcp, "get_builds", get_builds)
+    return asyncio.run(reconciler.poll_once())
+
+
+def test_failed_build_is_written_once(firestore, monkeypatch):
+    reconciler = BuildReconciler(poll_interval=60)
+    reconciler.track(building("b1"))
+
+    poll(reconciler, monkeypatch, build("b1", "FAILURE"))
+    poll(reconciler, monkeypatch, build("b1", "FAILURE"))
+
+    assert reconciler.in_flight == 0
+    assert len(firestore.writes) == 1
+    changes = firestore.writes[0]["svc-1"]
+    assert changes["status"] == ServiceStatus.FAILED
+    assert "FAILURE" in changes["error_message"]
+
+
+def test_running_build_stays_tracked(firestore, monkeypatch):
+    reconciler = BuildReconciler(poll_interval=60)
+    reconciler.track(building("b1"))
+
+    poll(reconciler, monkeypatch, build("b1", "WORKING"))
+
+    assert reconciler.in_flight == 1
+    assert firestore.writes == []
+
+
+def test_failed_write_keeps_build_tracked(firestore, monkeypatch):
+    reconciler = BuildReconciler(poll_interval=60)
+    reconciler.track(building("b1", "svc-1"))
+    reconciler.track(building("b1", "svc-2"))
+    firestore.failures = 1
+
+    with pytest.raises(ConnectionError):
+        poll(reconciler, monkeypatch, build("b1", "TIMEOUT"))
+    assert reconciler.in_flight == 1
+
+    poll(reconciler, monkeypatch, build("b1", "TIMEOUT"))
+    assert reconciler.in_flight == 0
+    assert set(firestore.writes[0]) == {"svc-1", "svc-2"}
+
+
+def test_failed_notification_write_keeps_build_tracked(firestore):
+    reconciler = BuildReconciler(poll_interval=60)
+    reconciler.track(building("b1"))
+    firestore.failures = 1
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(reconciler.apply_build(build("b1", "CANCELLED")))
+    assert reconciler.in_flight == 1
+
+    asyncio.run(reconciler.apply_build(build("b1", "CANCELLED")))
+    assert reconciler.in_flight == 0
+    assert firestore.writes[0]["svc-1"]["status"] == ServiceStatus.FAILED
+
+
+def test_forget_drops_build_once_no_service_waits(firestore):
+    reconciler = BuildReconciler(poll_interval=60)
+    first, second = building("b1", "svc-1"), building("b1", "svc-2")
+    reconciler.track(first)
+    reconciler.track(second)
+
+    reconciler.forget(first)
+    assert reconciler.in_flight == 1
+    reconciler.forget(second)
+    assert reconciler.in_flight == 0
+
+
+def test_partially_failed_combined_build(firestore, monkeypatch):
+    async def get_service_urls(region):
+        return {"svc-a": "https://svc-a.run.app", "svc-b": "https://svc-b.run.app"}
+
+    monkeypatch.setattr(gcp, "get_service_urls", get_service_urls)
+    reconciler = BuildReconciler(poll_interval=60)
+    for service_id in ("svc-a", "svc-b", "svc-c"):
+        reconciler.track(building("b1", service_id))
+
+    steps = (
+        chain("svc-a", "SUCCESS", "SUCCESS", "SUCCESS", "SUCCESS")
+        + chain("svc-b", "SUCCESS", "SUCCESS", "SUCCESS", "SUCCESS")
+        + chain("svc-c", "SUCCESS", "FAILURE", "CANCELLED", "CANCELLED")
+    )
+    poll(reconciler, monkeypatch, build("b1", "FAILURE", steps))
+
+    assert reconciler.in_flight == 0
+    [writes] = firestore.writes
+    # Their chains deployed, so those services are live despite the build's status.
+    assert writes["svc-a"] == {"status": ServiceStatus.DEPLOYED, "deployed_url": "https://svc-a.run.app"}
+    assert writes["svc-b"] == {"status": ServiceStatus.DEPLOYED, "deployed_url": "https://svc-b.run.app"}
+    assert writes["svc-c"] == {
+        "status": ServiceStatus.FAILED,
+        "error_message": "Cloud Build step svc-c-build finished with status FAILURE.",
+    }
@@ -0,0 +1,233 @@
+import asyncio
+
+import httpx
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from app.core import gcp, resilience
+from app.core.resilience import CircuitBreaker, CircuitOpen, Policy, RetryBudget, Upstream
+
+FAST = Policy(deadline=5.0, attempt_timeout=1.0, max_attempts=3, base_delay=0.001, max_delay=0.002)
+
+
+@pytest.fixture(autouse=True)
+def fresh_upstreams(monkeypatch):
+    monkeypatch.setattr(resilience, "_upstreams", {})
+
+
+def flaky(*outcomes):
+    """An upstream call that raises or returns each outcome in turn; `calls` counts attempts."""
+    remaining = list(outcomes)
+
+    async def fn():
+        fn.calls += 1
+        outcome = remaining.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    fn.calls = 0
+    return fn
+
+
+def test_transient_errors_are_retried():
+    fn = flaky(api_exceptions.ServiceUnavailable("down"), api_exceptions.InternalServerError("oops"), "ok")
+    assert asyncio.run(Upstream("test", FAST).call("op", fn)) == "ok"
+    assert fn.calls == 3
+
+
+def test_gives_up_after_max_attempts():
+    fn = flaky(*[api_exceptions.ServiceUnavailable("down")] * 5)
+    with pytest.raises(api_exceptions.ServiceUnavailable):
+        asyncio.run(Upstream("test", FAST).call("op", fn))
+    assert fn.calls == FAST.max_attempts
+
+
+def test_request_errors_are_not_retried():
+    fn = flaky(api_exceptions.NotFound("gone"), "ok")
+    upstream = Upstream("test", FAST)
+    with pytest.raises(api_exceptions.NotFound):
+        asyncio.run(upstream.call("op", fn))
+    assert fn.calls == 1
+    assert upstream.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_non_idempotent_calls_only_retry_rejections():
+    processed = flaky(api_exceptions.InternalServerError("maybe applied"), "ok")
+    with pytest.raises(api_exceptions.InternalServerError):
+        asyncio.run(Upstream("test", FAST).call("create", processed, idempotent=False))
+    assert processed.calls == 1
+
+    rejected = flaky(api_exceptions.ServiceUnavailable("not applied"), "ok")
+    assert asyncio.run(Upstream("test", FAST).call("create", rejected, idempotent=False)) == "ok"
+    assert rejected.calls == 2
+
+
+def test_slow_attempt_times_out():
+    async def hangs():
+        await asyncio.sleep(10)
+
+    policy = Policy(deadline=0.2, attempt_timeout=0.05, max_attempts=2, base_delay=0.001, max_delay=0.002)
+    with pytest.raises(TimeoutError):
+        asyncio.run(Upstream("test", policy).call("op", hangs))
+
+
+def test_breaker_opens_and_probes(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=30)
+
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpen) as rejected:
+        breaker.before_call()
+    assert rejected.value.retry_after == 30
+
+    now[0] += 30
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one probe at a time; a probe that never reports back is replaced after reset_seconds.
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    now[0] += 30
+    breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_seconds=0)
+    for _ in range(5):
+        breaker.record_failure()
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_open_breaker_stops_retries_and_rejects():
+    upstream = Upstream("test", Policy(deadline=5.0, attempt_timeout=1.0, max_attempts=10, base_delay=0.001, max_delay=0.002))
+    fn = flaky(*[api_exceptions.ServiceUnavailable("down")] * 10)
+    with pytest.raises(api_exceptions.ServiceUnavailable):
+        asyncio.run(upstream.call("op", fn))
+    assert fn.calls == upstream.breaker.failure_threshold
+
+    with pytest.raises(CircuitOpen):
+        asyncio.run(upstream.call("op", flaky("ok")))
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, cap=2)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def test_hedge_wins_over_a_slow_primary():
+    policy = Policy(deadline=5.0, attempt_timeout=2.0, max_attempts=1, hedge=True, hedge_min_delay=0.01)
+    upstream = Upstream("test", policy)
+    for _ in range(resilience.MIN_HEDGE_SAMPLES):
+        upstream.latencies.add(0.01)
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        # The first request stalls; the hedge sent after ~p95 answers.
+        await asyncio.sleep(1.0 if len(calls) == 1 else 0.0)
+        return len(calls)
+
+    assert asyncio.run(upstream.call("op", fn)) == 2
+
+
+class FakeBatch:
+    def update(self, ref, changes):
+        pass
+
+    async def commit(self):
+        raise api_exceptions.NotFound("one service was deleted")
+
+
+class FakeDocument:
+    def __init__(self, calls):
+        self.calls = calls
+
+    async def update(self, changes):
+        self.calls.append(changes)
+        raise api_exceptions.ServiceUnavailable("down")
+
+
+class FakeDb:
+    def __init__(self):
+        self.updates = []
+
+    def batch(self):
+        return FakeBatch()
+
+    def collection(self, name):
+        return self
+
+    def document(self, document_id):
+        return FakeDocument(self.updates)
+
+
+def test_batch_update_fallback_is_not_retried_twice(monkeypatch):
+    db = FakeDb()
+    monkeypatch.setattr(gcp, "_db", lambda: db)
+    # Keep the breaker out of it, so only the retry loops limit the attempts.
+    monkeypatch.setattr(resilience.settings, "BREAKER_FAILURE_THRESHOLD", 100)
+    policy = resilience.policies()["firestore"]
+
+    with pytest.raises(api_exceptions.ServiceUnavailable):
+        asyncio.run(gcp.update_services_batch({"svc-1": {"status": "FAILED"}}))
+    # Retried as one call by the outer guard, not attempts x attempts.
+    assert len(db.updates) == policy.max_attempts
+    assert set(resilience._upstreams) == {"firestore"}
+
+
+def test_open_circuit_is_503_with_retry_after(monkeypatch):
+    import main
+    from app.core.auth import get_current_user
+    from app.core.signing import signer
+
+    class Snapshot:
+        exists = True
+
+        def to_dict(self):
+            return {"id": "svc-1", "user_id": "user-1", "service_name": "svc", "prompt": "p", "source_blob": "svc.zip"}
+
+    class Document:
+        async def get(self):
+            return Snapshot()
+
+    class Db:
+        def collection(self, name):
+            return self
+
+        def document(self, document_id):
+            return Document()
+
+    async def signed_url(blob_name, verify_exists=True):
+        raise CircuitOpen("gcs", 12.3)
+
+    async def user():
+        return {"uid": "user-1"}
+
+    monkeypatch.setattr(main.app, "dependency_overrides", {get_current_user: user})
+    monkeypatch.setattr(signer, "signed_url", signed_url)
+    monkeypatch.setattr(main.clients, "_clients", {"firestore_client": Db()})
+
+    async def request():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/api/v1/services/svc-1/artifact")
+
+    response = asyncio.run(request())
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "13"
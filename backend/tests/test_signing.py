@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+from google.auth import impersonated_credentials
+from google.oauth2 import credentials as oauth2_credentials
+
+from app.core import signing
+from app.core.config import settings
+from app.core.signing import UrlSigner
+from app.state import clients
+from benchmarks.fakes import FakeBlob, FakeStorageClient
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(signing.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    """Fake GCS holding one artifact; `storage.signed` lists the blobs each signature was issued for."""
+    client = FakeStorageClient()
+    client.objects[(settings.GCP_SOURCE_BUCKET_NAME, "svc.zip")] = b"zip"
+    client.objects[(settings.GCP_SOURCE_BUCKET_NAME, "other.zip")] = b"zip"
+    client.signed = []
+    sign = FakeBlob.generate_signed_url
+
+    def generate_signed_url(blob, expiration, version="v4", credentials=None):
+        client.signed.append(blob.name)
+        return f"{sign(blob, expiration, version, credentials)}&n={len(client.signed)}"
+
+    monkeypatch.setattr(FakeBlob, "generate_signed_url", generate_signed_url)
+    monkeypatch.setitem(clients._clients, "storage_client", client)
+    return client
+
+
+def new_signer(**overrides) -> UrlSigner:
+    options = {"ttl": 3600, "refresh_margin": 600, "max_entries": 10, "credentials_lifetime": 3600, **overrides}
+    return UrlSigner(**options)
+
+
+def test_url_is_reissued_once_the_margin_is_reached(storage, clock):
+    signer = new_signer()
+    url = asyncio.run(signer.signed_url("svc.zip"))
+    assert "X-Goog-Expires=3600" in url
+
+    clock[0] += 2999
+    assert asyncio.run(signer.signed_url("svc.zip")) == url
+    # Less than the margin left: a fresh link, so none handed out expires within 600s.
+    clock[0] += 1
+    assert asyncio.run(signer.signed_url("svc.zip")) != url
+    assert storage.signed == ["svc.zip", "svc.zip"]
+    assert (signer.hits, signer.misses) == (1, 2)
+
+
+def test_missing_artifact_is_not_cached(storage, clock):
+    signer = new_signer()
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(signer.signed_url("missing.zip"))
+    assert signer.stats()["size"] == 0
+    # Callers that know the blob exists skip the check.
+    asyncio.run(signer.signed_url("missing.zip", verify_exists=False))
+    assert storage.signed == ["missing.zip"]
+
+
+def test_cache_keeps_the_most_recent_blobs(storage, clock):
+    signer = new_signer(max_entries=1)
+    asyncio.run(signer.signed_url("svc.zip"))
+    asyncio.run(signer.signed_url("other.zip"))
+    asyncio.run(signer.signed_url("svc.zip"))
+    assert storage.signed == ["svc.zip", "other.zip", "svc.zip"]
+
+
+def test_concurrent_misses_sign_once(storage, clock):
+    signer = new_signer()
+
+    async def scenario():
+        return await asyncio.gather(*[signer.signed_url("svc.zip") for _ in range(5)])
+
+    assert len(set(asyncio.run(scenario()))) == 1
+    assert storage.signed == ["svc.zip"]
+
+
+def test_credentials_are_reused_until_the_margin(storage, clock, monkeypatch):
+    signer = new_signer(ttl=60, refresh_margin=30)
+    built = []
+    monkeypatch.setattr(signer, "_build_signing_credentials", lambda: built.append(object()) or built[-1])
+
+    for _ in range(3):
+        asyncio.run(signer.signed_url("svc.zip"))
+        clock[0] += 1000
+    assert len(built) == 1
+    clock[0] += 570
+    asyncio.run(signer.signed_url("svc.zip"))
+    assert len(built) == 2
+
+
+def test_credentials_without_a_signer_use_iam(storage, monkeypatch):
+    # User credentials hold a token but no key to sign with.
+    storage._credentials = oauth2_credentials.Credentials(token="token")
+    signer = new_signer()
+    monkeypatch.setattr(settings, "GCP_SIGNER_SERVICE_ACCOUNT_EMAIL", None)
+    with pytest.raises(RuntimeError, match="GCP_SIGNER_SERVICE_ACCOUNT_EMAIL"):
+        signer._build_signing_credentials()
+
+    monkeypatch.setattr(settings, "GCP_SIGNER_SERVICE_ACCOUNT_EMAIL", "signer@p.iam.gserviceaccount.com")
+    credentials = signer._build_signing_credentials()
+    assert isinstance(credentials, impersonated_credentials.Credentials)
+    assert credentials.service_account_email == "signer@p.iam.gserviceaccount.com"
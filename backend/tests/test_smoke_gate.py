@@ -0,0 +1,97 @@
+"""
+The smoke gate against real renders: every method the system prompt allows
+must pass on every runtime, and a service that cannot serve must fail it.
+"""
+import asyncio
+
+import pytest
+
+from app.core import build_profiles, pipeline, runtimes, smoke_gate
+from app.core.config import settings
+from app.models.spec import HTTP_METHODS
+from app.models.service import SmokeTestReport
+
+FIELDS = [
+    {"name": "name", "type": "str", "required": True},
+    {"name": "age", "type": "int", "required": False},
+    {"name": "email", "type": "EmailStr", "required": True},
+    {"name": "website", "type": "HttpUrl", "required": False},
+    {"name": "tags", "type": "List[str]", "required": False},
+    {"name": "extra", "type": "Dict[str, Any]", "required": False},
+]
+
+
+def spec_for(method: str) -> dict:
+    return {
+        "service_name": "smoke-check",
+        "endpoint": {"path": "/items/{item_id}", "method": method, "model_name": "Item", "schema_fields": FIELDS},
+    }
+
+
+def smoke(spec: dict, runtime_name: str) -> SmokeTestReport:
+    runtime = runtimes.runtime_for(runtime_name)
+    archive = pipeline.package_service(spec, spec["service_name"], build_profiles.get_profile(), runtime)
+    try:
+        return asyncio.run(smoke_gate.run_smoke_test(archive, spec, runtime))
+    finally:
+        archive.close()
+
+
+@pytest.fixture(autouse=True)
+def few_requests(monkeypatch):
+    monkeypatch.setattr(settings, "SMOKE_TEST_REQUESTS", 20)
+    # Latency is not under test; a loaded CI machine must not fail the gate on it.
+    monkeypatch.setattr(settings, "SMOKE_TEST_MAX_P99_MS", 10_000.0)
+
+
+@pytest.mark.parametrize("runtime_name", runtimes.RUNTIMES)
+@pytest.mark.parametrize("method", HTTP_METHODS)
+def test_every_method_passes_on_every_runtime(method, runtime_name):
+    report = smoke(spec_for(method), runtime_name)
+    assert report.passed, report.errors
+    assert report.error_rate == 0
+
+
+@pytest.mark.parametrize("runtime_name", runtimes.RUNTIMES)
+def test_service_that_does_not_validate_fails(runtime_name):
+    # The POST spec is smoke-tested against a GET render, which neither routes POST nor validates a body.
+    spec = spec_for("POST")
+    runtime = runtimes.runtime_for(runtime_name)
+    archive = pipeline.package_service(spec_for("GET"), "smoke-check", build_profiles.get_profile(), runtime)
+    try:
+        with pytest.raises(smoke_gate.SmokeTestFailed) as failure:
+            asyncio.run(smoke_gate.run_smoke_test(archive, spec, runtime))
+    finally:
+        archive.close()
+    assert not failure.value.report.passed
+    assert "valid payload got 405" in failure.value.report.errors
+
+
+def test_summarize_counts_wrong_statuses():
+    result = {"samples": [
+        ["valid", 200, 0.001, None],
+        ["valid", 405, 0.001, None],
+        ["invalid", 422, 0.001, None],
+        ["invalid", 200, 0.001, None],
+    ]}
+    report = smoke_gate.summarize(result)
+    assert report.requests == 4
+    assert report.error_rate == 0.5
+    assert report.errors == ["valid payload got 405", "invalid payload got 200"]
+    assert not report.passed
+
+
+def test_summarize_reports_load_errors():
+    report = smoke_gate.summarize({"load_error": "ModuleNotFoundError: models\n"})
+    assert not report.passed
+    assert report.errors == ["ModuleNotFoundError: models"]
+
+
+def test_synthesized_payloads():
+    valid, invalid = smoke_gate.synthesize_payloads(FIELDS)
+    assert valid["email"] == "user@example.com"
+    assert valid["tags"] == ["example"]
+    # Each required field missing, each field mistyped, and a non-object body.
+    assert {"age": 1, "email": "user@example.com", "website": "https://example.com", "tags": ["example"], "extra": {}} in invalid
+    assert {**valid, "age": "not-a-number"} in invalid
+    assert invalid[-1] == []
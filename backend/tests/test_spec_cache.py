@@ -0,0 +1,145 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core import ai, spec_cache
+from app.core.config import settings
+from app.core.spec_cache import FirestoreSpecStore, LRUSpecCache, SpecCache, cache_key
+
+SPEC = {
+    "service_name": "contact-form-api",
+    "endpoint": {
+        "path": "/contacts",
+        "method": "POST",
+        "model_name": "Contact",
+        "schema_fields": [{"name": "name", "type": "str", "required": True}],
+    },
+}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(spec_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_cache_key():
+    key = cache_key("contact  form\napi", "system", "gemini:pro")
+    assert key == cache_key(" contact form api ", "system", "gemini:pro")
+    assert key != cache_key("contact form api", "system v2", "gemini:pro")
+    assert key != cache_key("contact form api", "system", "gemini:flash")
+    # Parts are delimited, so moving text between them changes the key.
+    assert cache_key("b", "a", "m") != cache_key("", "ab", "m")
+
+
+def test_lru_evicts_least_recently_used(clock):
+    cache = LRUSpecCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", {"n": 1})
+    cache.set("b", {"n": 2})
+    assert cache.get("a") == {"n": 1}
+    cache.set("c", {"n": 3})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"n": 1} and cache.get("c") == {"n": 3}
+
+
+def test_lru_entries_expire(clock):
+    cache = LRUSpecCache(max_entries=10, ttl_seconds=60)
+    cache.set("a", {"n": 1})
+    cache.set("short", {"n": 2}, ttl_seconds=5)
+    clock[0] += 5
+    assert cache.get("short") is None
+    assert cache.get("a") == {"n": 1}
+    clock[0] += 55
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_persistent_store_expiry(fake_db):
+    store = FirestoreSpecStore("spec_cache", ttl_seconds=3600)
+    asyncio.run(store.set("k", SPEC, "gemini:pro"))
+    spec, remaining = asyncio.run(store.get("k"))
+    assert spec == SPEC
+    assert 3590 < remaining <= 3600
+    assert fake_db.data["spec_cache"]["k"]["model_version"] == "gemini:pro"
+
+    fake_db.data["spec_cache"]["k"]["expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+    assert asyncio.run(store.get("k")) is None
+    assert asyncio.run(store.get("missing")) is None
+
+
+def test_persistent_hit_is_promoted_with_its_remaining_lifetime(fake_db, clock):
+    store = FirestoreSpecStore("spec_cache", ttl_seconds=3600)
+    asyncio.run(store.set("k", SPEC, "gemini:pro"))
+    fake_db.data["spec_cache"]["k"]["expires_at"] = datetime.utcnow() + timedelta(seconds=100)
+    cache = SpecCache(LRUSpecCache(max_entries=10, ttl_seconds=3600), store)
+
+    assert asyncio.run(cache.get("k")) == SPEC
+    fake_db.data["spec_cache"].clear()
+    assert asyncio.run(cache.get("k")) == SPEC
+    # Promoted for what was left of the stored entry, not a fresh TTL.
+    clock[0] += 101
+    assert asyncio.run(cache.get("k")) is None
+    assert cache.stats == {"memory_hits": 1, "persistent_hits": 1, "misses": 1, "bypassed": 0}
+
+
+def test_cached_specs_are_copies():
+    cache = SpecCache(LRUSpecCache(max_entries=10, ttl_seconds=60))
+    spec = {"endpoint": {"schema_fields": []}}
+    asyncio.run(cache.set("k", spec, "m"))
+    spec["endpoint"]["schema_fields"].append("set after caching")
+    asyncio.run(cache.get("k"))["endpoint"]["schema_fields"].append("changed by a caller")
+    assert asyncio.run(cache.get("k")) == {"endpoint": {"schema_fields": []}}
+
+
+class BrokenStore:
+    async def get(self, key):
+        raise ConnectionError("firestore unavailable")
+
+    async def set(self, key, spec, model_version):
+        raise ConnectionError("firestore unavailable")
+
+
+def test_persistent_failures_are_misses():
+    cache = SpecCache(LRUSpecCache(max_entries=10, ttl_seconds=60), BrokenStore())
+    assert asyncio.run(cache.get("k")) is None
+    asyncio.run(cache.set("k", SPEC, "m"))
+    assert asyncio.run(cache.get("k")) == SPEC
+
+
+@pytest.fixture
+def generations(monkeypatch):
+    """A memory-only cache and a provider call counter for generate_spec_from_prompt."""
+    monkeypatch.setattr(settings, "SPEC_CACHE_ENABLED", True)
+    monkeypatch.setattr(ai, "cache", SpecCache(LRUSpecCache(max_entries=10, ttl_seconds=60)))
+    calls = []
+
+    async def generate(prompt):
+        calls.append(prompt)
+        return {**SPEC, "service_name": f"{SPEC['service_name']}-{len(calls)}"}
+
+    monkeypatch.setattr(ai.engine, "generate", generate)
+    return calls
+
+
+def test_identical_prompts_are_generated_once(generations):
+    first = asyncio.run(ai.generate_spec_from_prompt("contact form api"))
+    assert asyncio.run(ai.generate_spec_from_prompt("contact  form api")) == first
+    assert len(generations) == 1
+
+
+def test_bypass_regenerates_and_refreshes(generations):
+    asyncio.run(ai.generate_spec_from_prompt("contact form api"))
+    fresh = asyncio.run(ai.generate_spec_from_prompt("contact form api", use_cache=False))
+    assert fresh["service_name"] == "contact-form-api-2"
+    assert asyncio.run(ai.generate_spec_from_prompt("contact form api")) == fresh
+    assert len(generations) == 2
+    assert ai.cache.stats["bypassed"] == 1
+
+
+def test_invalid_cached_spec_is_regenerated(generations):
+    key = cache_key("contact form api", ai.SYSTEM_PROMPT, ai.model_version())
+    asyncio.run(ai.cache.set(key, {"service_name": "Not Valid"}, ai.model_version()))
+    assert asyncio.run(ai.generate_spec_from_prompt("contact form api"))["service_name"] == "contact-form-api-1"
+    assert len(generations) == 1
@@ -0,0 +1,170 @@
+import pytest
+
+from app.core import spec_validation
+from app.core.spec_validation import apply_delta, check, normalize_path, normalize_type, validate_spec
+from app.models.spec import SpecDelta
+
+VALID = {
+    "service_name": "contact-form-api",
+    "endpoint": {
+        "path": "/contacts",
+        "method": "POST",
+        "model_name": "Contact",
+        "schema_fields": [
+            {"name": "name", "type": "str", "required": True},
+            {"name": "email", "type": "EmailStr", "required": True},
+        ],
+    },
+}
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("contactForm", "contact_form"),
+    ("Contact Form", "contact_form"),
+    ("HTTPStatus", "http_status"),
+    ("2fa", "field_2fa"),
+    ("class", "class_"),
+])
+def test_snake_case(name, expected):
+    assert spec_validation.snake_case(name) == expected
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("contact form", "ContactForm"),
+    ("user_profile", "UserProfile"),
+    ("request", "RequestModel"),
+    ("3d", "Model3d"),
+])
+def test_pascal_case(name, expected):
+    assert spec_validation.pascal_case(name) == expected
+
+
+def test_service_name():
+    assert spec_validation.service_name("Contact Form API!") == "contact-form-api"
+    assert spec_validation.service_name("123 go") == "api-123-go"
+    assert len(spec_validation.service_name("a-" * 40)) <= 30
+    assert not spec_validation.service_name("a-" * 40).endswith("-")
+
+
+@pytest.mark.parametrize("type_name, expected", [
+    ("string", ("str", False)),
+    ("Integer", ("int", False)),
+    ("array", ("List[str]", False)),
+    ("List[string]", ("List[str]", False)),
+    ("array<integer>", ("List[int]", False)),
+    ("Optional[int]", ("int", True)),
+    ("Dict[string, Any]", ("Dict[str, Any]", False)),
+    ("datetime", ("datetime", False)),
+])
+def test_normalize_type(type_name, expected):
+    assert normalize_type(type_name) == expected
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("contacts", "/contacts"),
+    ("/contacts/", "/contacts"),
+    ("//users//<int:userId>/", "/users/{user_id}"),
+    ("/users/:id?full=1", "/users/{id}"),
+    ("/users/{userId}", "/users/{user_id}"),
+    ("/my items", "/my-items"),
+])
+def test_normalize_path(path, expected):
+    assert normalize_path(path) == expected
+
+
+def test_valid_spec_is_unchanged():
+    before = dict(spec_validation.stats)
+    assert validate_spec(VALID) == VALID
+    assert spec_validation.stats["valid"] == before["valid"] + 1
+
+
+def test_repairs_near_misses():
+    raw = {
+        "service_name": "Contact Form",
+        "description": "dropped",
+        "endpoints": [{
+            "path": "contacts/<id>",
+            "method": "put",
+            "model_name": "contact",
+            "summary": "dropped",
+            "schema_fields": {"fullName": "string", "age": "Optional[integer]"},
+        }],
+    }
+    before = dict(spec_validation.stats)
+    assert validate_spec(raw) == {
+        "service_name": "contact-form",
+        "endpoint": {
+            "path": "/contacts/{id}",
+            "method": "PUT",
+            "model_name": "Contact",
+            "schema_fields": [
+                # Rule 10: body methods default to required, unless the type was Optional.
+                {"name": "full_name", "type": "str", "required": True},
+                {"name": "age", "type": "int", "required": False},
+            ],
+        },
+    }
+    assert spec_validation.stats["repaired"] == before["repaired"] + 1
+
+
+def test_required_defaults_to_false_without_a_body():
+    spec = {**VALID, "endpoint": {**VALID["endpoint"], "method": "GET", "schema_fields": [{"name": "q", "type": "str"}]}}
+    assert validate_spec(spec)["endpoint"]["schema_fields"] == [{"name": "q", "type": "str", "required": False}]
+
+
+@pytest.mark.parametrize("raw, problem", [
+    ([VALID], "must be a JSON object"),
+    ({**VALID, "endpoint": {**VALID["endpoint"], "path": "/health"}}, "reserved"),
+    ({**VALID, "endpoint": {**VALID["endpoint"], "method": "PATCH"}}, "endpoint.method"),
+    ({**VALID, "endpoint": {**VALID["endpoint"], "schema_fields": [{"name": "at", "type": "datetime"}]}}, "schema_fields.0.type"),
+    (
+        {**VALID, "endpoint": {**VALID["endpoint"], "schema_fields": VALID["endpoint"]["schema_fields"] * 2}},
+        "duplicate names email, name",
+    ),
+    (
+        {**VALID, "endpoint": {**VALID["endpoint"], "schema_fields": [{"name": "model_id", "type": "str"}]}},
+        "model_ namespace",
+    ),
+])
+def test_rejects_what_cannot_be_repaired(raw, problem):
+    before = dict(spec_validation.stats)
+    with pytest.raises(ValueError, match=problem):
+        validate_spec(raw)
+    assert spec_validation.stats["rejected"] == before["rejected"] + 1
+
+
+def test_check_does_not_repair():
+    with pytest.raises(ValueError, match="service_name"):
+        check({**VALID, "service_name": "Contact Form"})
+
+
+def test_apply_delta():
+    delta = SpecDelta(
+        method="put",
+        add_fields=[{"name": "phoneNumber", "type": "string"}, {"name": "email", "type": "str", "required": False}],
+        remove_fields=["Name"],
+    )
+    endpoint = apply_delta(VALID, delta)["endpoint"]
+    assert endpoint["method"] == "PUT"
+    assert endpoint["schema_fields"] == [
+        {"name": "phone_number", "type": "str", "required": True},
+        # Adding an existing name replaces that field.
+        {"name": "email", "type": "str", "required": False},
+    ]
+    # The stored spec is not modified.
+    assert VALID["endpoint"]["method"] == "POST"
+
+
+def test_apply_delta_rejects_bad_edits():
+    with pytest.raises(ValueError, match="unknown field"):
+        apply_delta(VALID, SpecDelta(remove_fields=["nope"]))
+    with pytest.raises(ValueError, match="schema_fields"):
+        apply_delta(VALID, SpecDelta(add_fields=[{"name": "at", "type": "datetime"}]))
+
+
+def test_response_schema_requests_only_required_properties():
+    schema = spec_validation.response_schema()
+    endpoint = schema["properties"]["endpoint"]
+    assert schema["required"] == ["service_name", "endpoint"]
+    assert endpoint["properties"]["method"]["enum"] == ["GET", "POST", "PUT", "DELETE"]
+    assert endpoint["properties"]["schema_fields"]["items"]["properties"]["type"]["format"] == "enum"
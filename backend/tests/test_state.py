@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import time
+
+from app.state import ClientFactory, ClientRegistry
+
+
+def slow_factory(calls: list, seconds: float = 0.2):
+    def create():
+        calls.append(threading.get_ident())
+        time.sleep(seconds)
+        return object()
+    return create
+
+
+def test_aget_waits_for_warm_up_without_blocking_the_loop():
+    registry = ClientRegistry()
+    calls = []
+    registry.register("slow", ClientFactory(slow_factory(calls)))
+
+    async def scenario():
+        warm_up = asyncio.create_task(registry.warm_up())
+        await asyncio.sleep(0.01)
+        client = asyncio.create_task(registry.aget("slow"))
+        ticks = 0
+        while not client.done():
+            ticks += 1
+            await asyncio.sleep(0.005)
+        await warm_up
+        return ticks, client.result()
+
+    ticks, client = asyncio.run(scenario())
+    assert ticks > 5
+    assert client is registry["slow"]
+    assert len(calls) == 1
+    assert calls[0] != threading.get_ident()
+
+
+def test_loop_bound_clients_are_created_on_the_loop_thread():
+    registry = ClientRegistry()
+    calls = []
+    registry.register("bound", ClientFactory(slow_factory(calls, 0), imports=("json",), loop_bound=True))
+
+    async def scenario():
+        await registry.require("bound")()
+        return await registry.aget("bound")
+
+    client = asyncio.run(scenario())
+    assert client is registry["bound"]
+    assert calls == [threading.get_ident()]
+
+
+def test_assigned_clients_are_never_created():
+    registry = ClientRegistry()
+    calls = []
+    registry.register("fakeable", ClientFactory(slow_factory(calls)))
+    fake = object()
+    registry["fakeable"] = fake
+
+    assert asyncio.run(registry.aget("fakeable")) is fake
+    asyncio.run(registry.warm_up())
+    assert calls == []
@@ -1,4 +1,5 @@
 import { useState } from 'react';
+import { useQuery } from '@tanstack/react-query';
 import { ServiceMetadata } from '@/types';
 import { Button } from '@/components/ui/button';
 import {
@@ -11,7 +12,7 @@ import {
 import { Copy, Download, FileText, Loader2 } from 'lucide-react';
 import toast from 'react-hot-toast';
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "@/components/ui/table";
-import { getServiceArtifact, getServiceLogs } from '@/lib/api-client';
+import { getService, getServiceArtifact, getServiceLogs } from '@/lib/api-client';
 
 interface ServiceDetailsDialogProps {
   isOpen: boolean;
@@ -23,10 +24,17 @@ const ServiceDetailsDialog: React.FC<ServiceDetailsDialogProps> = ({ isOpen, onC
   const [isDownloading, setIsDownloading] = useState(false);
   const [isFetchingLogs, setIsFetchingLogs] = useState(false);
 
+  // The dashboard list omits specs, so load the full service when the dialog opens.
+  const { data: details, isLoading: isLoadingDetails } = useQuery({
+    queryKey: ['service', service?.id, service?.status],
+    queryFn: () => getService(service!.id),
+    enabled: isOpen && !!service && !service.spec,
+  });
+
   if (!service) return null;
 
   // Safely access nested values — spec or endpoint may be missing.
-  const endpoint = service.spec?.endpoint;
+  const endpoint = (service.spec ?? details?.spec)?.endpoint;
   const deployed_url = service.deployed_url;
 
   const getCurlCommand = () => {
@@ -85,6 +93,18 @@ const ServiceDetailsDialog: React.FC<ServiceDetailsDialogProps> = ({ isOpen, onC
     }
   };
 
+  if (!endpoint && isLoadingDetails && isOpen) {
+    return (
+      <Dialog open={isOpen} onOpenChange={onClose}>
+        <DialogContent>
+          <div className="flex justify-center py-8">
+            <Loader2 className="h-6 w-6 animate-spin text-muted-foreground" />
+          </div>
+        </DialogContent>
+      </Dialog>
+    );
+  }
+
   // --- ADDED A CHECK FOR endpoint ---
   // Prevents crash if the spec is somehow malformed
   if (!endpoint) {
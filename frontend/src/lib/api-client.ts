@@ -1,5 +1,5 @@
 import { auth } from './firebase';
-import { ServiceMetadata } from '../types';
+import { ServiceMetadata, ServiceStatusDelta } from '../types';
 
 // --- DEBUG LINE ---
 // This will print the URL being used to the browser console on your live site.
@@ -52,13 +52,57 @@ const parseFilename = (disposition: string | null): string | undefined => {
   return match ? match[1] : undefined;
 };
 
+// The list leaves out each service's spec; fetch it with getService when needed.
+// The browser revalidates with the returned ETag, so unchanged lists come back as 304s.
 export const getServices = async (): Promise<ServiceMetadata[]> => {
   const headers = await getHeaders();
-  const response = await fetch(`${baseURL}/services`, { headers });
+  const response = await fetch(`${baseURL}/services?include=prompt`, { headers });
   if (!response.ok) throw new Error(await response.text());
   return response.json();
 };
 
+export const getService = async (serviceId: string): Promise<ServiceMetadata> => {
+  const headers = await getHeaders();
+  const response = await fetch(`${baseURL}/services/${serviceId}`, { headers });
+  if (!response.ok) throw new Error(await response.text());
+  return response.json();
+};
+
+// Reads the server-sent status stream until it closes or `signal` aborts.
+// Uses fetch rather than EventSource so the ID token can travel in the Authorization header.
+export const streamServiceEvents = async (
+  onDelta: (delta: ServiceStatusDelta) => void,
+  signal: AbortSignal,
+  onOpen?: () => void,
+): Promise<void> => {
+  const headers = await getHeaders();
+  const response = await fetch(`${baseURL}/services/events`, {
+    headers: { ...headers, Accept: 'text/event-stream' },
+    signal,
+  });
+  if (!response.ok || !response.body) throw new Error(await response.text());
+  onOpen?.();
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) return;
+    buffer += decoder.decode(value, { stream: true });
+    const messages = buffer.split('\n\n');
+    buffer = messages.pop() ?? '';
+    for (const message of messages) {
+      const data = message
+        .split('\n')
+        .filter(line => line.startsWith('data:'))
+        .map(line => line.slice(5).trim())
+        .join('\n');
+      if (data) onDelta(JSON.parse(data));
+    }
+  }
+};
+
 export const generateService = async (prompt: string): Promise<ServiceMetadata> => {
   const headers = await getHeaders();
   const response = await fetch(`${baseURL}/services/generate`, {
@@ -1,6 +1,7 @@
-import { useState } from 'react';
-import { useQuery } from '@tanstack/react-query';
-import { getServices } from '@/lib/api-client';
+import { useEffect, useState } from 'react';
+import { useQuery, useQueryClient } from '@tanstack/react-query';
+import { getServices, streamServiceEvents } from '@/lib/api-client';
+import { ServiceMetadata } from '@/types';
 import ServiceCard from '@/components/services/ServiceCard';
 import ServiceCardSkeleton from '@/components/services/ServiceCardSkeleton';
 import DashboardEmptyState from '@/components/services/DashboardEmptyState';
@@ -10,6 +11,41 @@ import { useAuth } from '@/hooks/useAuth'; // <-- Import useAuth
 const Dashboard = () => {
   const { user } = useAuth(); // <-- Get the authenticated user
   const [showGuide, setShowGuide] = useState(true);
+  const [streamConnected, setStreamConnected] = useState(false);
+  const queryClient = useQueryClient();
+
+  // Status changes are pushed over the event stream; polling is the fallback (see refetchInterval below).
+  useEffect(() => {
+    if (!user) return;
+    const controller = new AbortController();
+
+    const connect = async () => {
+      while (!controller.signal.aborted) {
+        try {
+          await streamServiceEvents((delta) => {
+            const services = queryClient.getQueryData<ServiceMetadata[]>(['services']);
+            if (!services?.some(s => s.id === delta.id)) {
+              queryClient.invalidateQueries(['services']);
+              return;
+            }
+            queryClient.setQueryData<ServiceMetadata[]>(['services'], (old) =>
+              old?.map(s => (s.id === delta.id ? { ...s, ...delta } : s)),
+            );
+          }, controller.signal, () => setStreamConnected(true));
+        } catch {
+          // Fall through to the retry below.
+        }
+        setStreamConnected(false);
+        if (controller.signal.aborted) return;
+        // Catch up on anything missed while disconnected, then reconnect.
+        queryClient.invalidateQueries(['services']);
+        await new Promise(resolve => setTimeout(resolve, 5000));
+      }
+    };
+    connect();
+
+    return () => controller.abort();
+  }, [user, queryClient]);
 
   const { data: services, isLoading, error } = useQuery({
     queryKey: ['services'],
@@ -17,8 +53,10 @@ const Dashboard = () => {
     // --- THE CRITICAL FIX ---
     // Only enable this query if the user object exists.
     enabled: !!user,
-    refetchInterval: (data) => 
-      data?.some(s => s.status === 'BUILDING' || s.status === 'PENDING') ? 5000 : false,
+    // While services are in flight, poll fast if the stream is down and slowly even when it is up,
+    // in case a delta never arrives. The browser revalidates with the list's ETag, so an unchanged poll is a 304.
+    refetchInterval: (data) =>
+      data?.some(s => s.status === 'BUILDING' || s.status === 'PENDING') ? (streamConnected ? 30000 : 5000) : false,
   });
 
   if (isLoading) {
@@ -32,4 +32,7 @@ export interface ServiceMetadata {
   updated_at: string; // ISO 8601 date string
   spec?: ServiceSpec;
   error_message?: string;
-}
\ No newline at end of file
+}
+// Pushed by GET /services/events whenever a service changes state.
+export type ServiceStatusDelta = Pick<ServiceMetadata, 'id'> &
+  Partial<Pick<ServiceMetadata, 'service_name' | 'status' | 'deployed_url' | 'error_message' | 'updated_at'>>;